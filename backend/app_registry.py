@@ -0,0 +1,150 @@
+import os
+import uuid
+import asyncio
+from typing import Dict, Optional, Tuple
+
+from cache import TTLCache
+from database import run_db
+from storage import ApplicationExists, get_storage
+
+# In-process cache of the `applications` registry for /consent/grant.
+# Apps are few and rarely change, so lookups by app_id or app_name are served from
+# memory; the admin hook (POST /admin/cache/apps/invalidate) drops stale entries.
+APP_CACHE_SIZE = int(os.environ.get("APP_CACHE_SIZE", "10000"))
+APP_CACHE_TTL = float(os.environ.get("APP_CACHE_TTL", "300"))
+
+_UNKNOWN = object()
+
+def _retrieve(task: asyncio.Task) -> None:
+    # Waiters re-raise a failure; mark it retrieved so it is not also logged when nobody waited
+    if not task.cancelled():
+        task.exception()
+
+class AppRegistry:
+    """
+    Resolves an app reference (UUID or app name) to (app_id, app_name).
+
+    Two bounded TTL maps are kept in step: app_id -> app_name and app_name -> app_id.
+    Both are filled on a miss and on create, along with app_id -> owner_user_id for
+    owner() (who may query an app's consent decisions). Concurrent resolutions of the same
+    reference share one database round trip (single-flight) in this process; across
+    workers, the unique index on app_name makes a losing create select the winner's
+    row, so a brand-new app name still gets exactly one application.
+    """
+
+    def __init__(self, maxsize: int = APP_CACHE_SIZE, ttl: float = APP_CACHE_TTL):
+        self.names = TTLCache(maxsize=maxsize, ttl=ttl)  # app_id -> app_name
+        self.ids = TTLCache(maxsize=maxsize, ttl=ttl)    # app_name -> app_id
+        self.owners = TTLCache(maxsize=maxsize, ttl=ttl)  # app_id -> owner_user_id (or None)
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+        self.created = 0
+
+    def _remember(self, app_id: str, app_name: str, owner_user_id: Optional[str] = None) -> None:
+        app_id = str(app_id)
+        self.names.set(app_id, app_name)
+        self.owners.set(app_id, str(owner_user_id) if owner_user_id else None)
+        if app_name is not None:
+            self.ids.set(app_name, app_id)
+
+    async def resolve(self, app_ref: str, owner_user_id: Optional[str] = None) -> Optional[Tuple[str, str]]:
+        """
+        Returns (app_id, app_name). A UUID must name an existing application (None if
+        it does not); any other string is an app name, created on first use.
+        """
+        try:
+            uuid.UUID(app_ref)
+            is_id = True
+        except ValueError:
+            is_id = False
+
+        if is_id:
+            app_name = self.names.get(app_ref)
+            if app_name is not None:
+                return app_ref, app_name
+        else:
+            app_id = self.ids.get(app_ref)
+            if app_id is not None:
+                return app_id, app_ref
+
+        key = ("id" if is_id else "name", app_ref)
+        pending = self._inflight.get(key)
+        if pending is None:
+            # The lookup runs as its own task: cancelling the request that started it
+            # (client disconnect, timeout) must not cancel it for the others waiting
+            pending = asyncio.get_running_loop().create_task(self._fetch(key, is_id, app_ref, owner_user_id))
+            pending.add_done_callback(_retrieve)
+            self._inflight[key] = pending
+        return await asyncio.shield(pending)
+
+    async def _fetch(self, key: tuple, is_id: bool, app_ref: str,
+                     owner_user_id: Optional[str]) -> Optional[Tuple[str, str]]:
+        try:
+            if is_id:
+                return await self._load_by_id(app_ref)
+            return await self._load_or_create(app_ref, owner_user_id)
+        finally:
+            del self._inflight[key]
+
+    async def _load_by_id(self, app_id: str) -> Optional[Tuple[str, str]]:
+        app = await run_db(get_storage().get_application, app_id)
+        if not app:
+            return None  # Not cached: the app may be registered later
+        self._remember(app["app_id"], app["app_name"], app.get("owner_user_id"))
+        return str(app["app_id"]), app["app_name"]
+
+    async def _load_or_create(self, app_name: str, owner_user_id: Optional[str]) -> Tuple[str, str]:
+        store = get_storage()
+        app = await run_db(store.find_application, app_name)
+        if not app:
+            # Create new application with this identifier as name
+            try:
+                app = await run_db(store.create_application, {
+                    "app_name": app_name,
+                    "owner_user_id": owner_user_id,
+                    "verification_status": "pending"
+                })
+                self.created += 1
+            except ApplicationExists:
+                # Another worker created it since our lookup: use its row
+                app = await run_db(store.find_application, app_name)
+                if not app:
+                    raise
+        self._remember(app["app_id"], app_name, app.get("owner_user_id"))
+        return str(app["app_id"]), app_name
+
+    async def owner(self, app_id: str) -> Optional[str]:
+        """owner_user_id of an application; None if it has no owner or does not exist."""
+        try:
+            app_id = str(uuid.UUID(app_id))
+        except ValueError:
+            return None  # Decisions are only answered for registered app IDs
+        owner = self.owners.get(app_id, _UNKNOWN)
+        if owner is _UNKNOWN:
+            await self._load_by_id(app_id)
+            owner = self.owners.get(app_id)
+        return owner
+
+    def invalidate(self, app_ref: str) -> None:
+        """Forgets one app, given its app_id or app_name."""
+        app_name = self.names.pop(app_ref)
+        if app_name is not None:
+            self.ids.pop(app_name)
+        app_id = self.ids.pop(app_ref)
+        if app_id is not None:
+            self.names.pop(app_id)
+        self.owners.pop(app_id or app_ref)
+
+    def clear(self) -> None:
+        self.names.clear()
+        self.ids.clear()
+        self.owners.clear()
+
+    def stats(self) -> dict:
+        return {
+            "by_id": self.names.stats(),
+            "by_name": self.ids.stats(),
+            "created": self.created,
+            "inflight": len(self._inflight),
+        }
+
+app_registry = AppRegistry()
@@ -0,0 +1,228 @@
+"""
+Audit ledger archive export.
+
+Streams audit_events in chain order into a directory of compressed columnar segments
+plus a signed manifest, for regulators who audit the ledger offline with the
+standalone verifier (verify_archive.py; format described there):
+
+    cd backend
+    python -m archive --out /path/to/archive [--segment-events 100000] [--level 6]
+    python verify_archive.py /path/to/archive --keys keys.json   # keys.json = GET /consent/keys
+
+The export is a snapshot: it stops at the ledger head as of its start. Memory holds
+at most two segments (one being read, one being compressed and written).
+"""
+import os
+import sys
+import json
+import zlib
+import struct
+import asyncio
+import hashlib
+import argparse
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from database import run_db
+from storage import get_storage
+from canonical import canonical_json
+from chain import event_hash_version
+from utils import parse_timestamp, sign_payload, signing_key_id
+from verify_archive import (
+    ARCHIVE_FORMAT, ARCHIVE_VERSION, COLUMNS, CURRENT_OVERFLOW, HASH_SIZE, MAGIC, MANIFEST_FILE,
+    PREV_NULL, PREV_OVERFLOW, little_endian, manifest_bytes
+)
+
+ARCHIVE_SEGMENT_EVENTS = int(os.environ.get("ARCHIVE_SEGMENT_EVENTS", "100000"))
+ARCHIVE_PAGE_SIZE = int(os.environ.get("ARCHIVE_PAGE_SIZE", "5000"))
+ARCHIVE_COMPRESSION_LEVEL = int(os.environ.get("ARCHIVE_COMPRESSION_LEVEL", "6"))
+
+_NO_HASH = bytes(HASH_SIZE)
+
+def _pack_hash(value) -> Optional[bytes]:
+    """32 bytes for a 64-char lowercase hex digest, None for anything else (kept verbatim)."""
+    if isinstance(value, str) and len(value) == 2 * HASH_SIZE:
+        try:
+            packed = bytes.fromhex(value)
+        except ValueError:
+            return None
+        if packed.hex() == value:
+            return packed
+    return None
+
+def _text(value) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+def encode_segment(index: int, events: List[dict], level: int = ARCHIVE_COMPRESSION_LEVEL) -> bytes:
+    """One segment file: magic, header length, header (the segment index), columns."""
+    count = len(events)
+    current, prev, flags, overflow = bytearray(), bytearray(), bytearray(), []
+    payload, offsets = bytearray(), [0]
+    shards: Dict[int, dict] = {}
+    for event in events:
+        flag = 0
+        prev_hash = event.get("hash_prev")
+        packed_prev = _pack_hash(prev_hash)
+        if prev_hash is None:
+            flag |= PREV_NULL
+        elif packed_prev is None:
+            flag |= PREV_OVERFLOW
+            overflow.append(prev_hash)
+        prev += packed_prev or _NO_HASH
+        packed_current = _pack_hash(event["hash_current"])
+        if packed_current is None:
+            flag |= CURRENT_OVERFLOW
+            overflow.append(event["hash_current"])
+        current += packed_current or _NO_HASH
+        flags.append(flag)
+
+        payload += canonical_json(event["event_payload"])
+        offsets.append(len(payload))
+
+        shard = event.get("shard") or 0
+        chain = shards.setdefault(shard, {"events": 0, "first_prev": prev_hash})
+        chain["events"] += 1
+        chain["last_hash"] = event["hash_current"]
+    if len(payload) >= 2 ** 32:
+        raise ValueError("Segment payloads exceed 4 GiB; use fewer events per segment")
+
+    data = {
+        "hash_current": bytes(current),
+        "hash_prev": bytes(prev),
+        "flags": bytes(flags),
+        "hash_version": little_endian("B", [event_hash_version(e) for e in events]),
+        "shard": little_endian("H", [e.get("shard") or 0 for e in events]),
+        "payload_offsets": little_endian("I", offsets),
+        "payload": bytes(payload),
+        "event_id": json.dumps([str(e["event_id"]) for e in events]).encode("utf-8"),
+        "event_type": json.dumps([e["event_type"] for e in events]).encode("utf-8"),
+        "actor_id": json.dumps([_text(e.get("actor_id")) for e in events]).encode("utf-8"),
+        "actor_type": json.dumps([e.get("actor_type") for e in events]).encode("utf-8"),
+        "timestamp": json.dumps([_text(e["timestamp"]) for e in events]).encode("utf-8"),
+        "overflow": json.dumps(overflow).encode("utf-8"),
+    }
+    columns, blobs, offset = {}, [], 0
+    for name, codec in COLUMNS.items():
+        blob = zlib.compress(data[name], level) if codec == "zlib" else data[name]
+        columns[name] = {"offset": offset, "length": len(blob), "codec": codec, "raw_length": len(data[name])}
+        blobs.append(blob)
+        offset += len(blob)
+
+    header = json.dumps({
+        "segment": index,
+        "events": count,
+        "first_event_id": str(events[0]["event_id"]),
+        "last_event_id": str(events[-1]["event_id"]),
+        "first_timestamp": _text(events[0]["timestamp"]),
+        "last_timestamp": _text(events[-1]["timestamp"]),
+        "shards": {str(s): c for s, c in sorted(shards.items())},
+        "columns": columns,
+    }, sort_keys=True).encode("utf-8")
+    return b"".join([MAGIC, struct.pack("<I", len(header)), header, *blobs])
+
+def _write_segment(directory: str, index: int, events: List[dict], level: int) -> dict:
+    name = f"segment-{index:06d}.seg"
+    blob = encode_segment(index, events, level)
+    with open(os.path.join(directory, name), "wb") as f:
+        f.write(blob)
+    return {
+        "file": name,
+        "sha256": hashlib.sha256(blob).hexdigest(),
+        "bytes": len(blob),
+        "events": len(events),
+        "first_event_id": str(events[0]["event_id"]),
+        "last_event_id": str(events[-1]["event_id"]),
+        "first_timestamp": _text(events[0]["timestamp"]),
+        "last_timestamp": _text(events[-1]["timestamp"]),
+    }
+
+async def export_archive(directory: str, segment_events: int = ARCHIVE_SEGMENT_EVENTS,
+                         page_size: int = ARCHIVE_PAGE_SIZE, level: int = ARCHIVE_COMPRESSION_LEVEL) -> dict:
+    """
+    Writes the ledger (up to its current head) to `directory` and returns the signed manifest.
+    Pages are read while the previous segment is compressed and written in a thread.
+    """
+    os.makedirs(directory, exist_ok=True)
+    store = get_storage()
+    segment_events = max(1, segment_events)
+    head = await run_db(store.latest_audit_event)
+    head_key = (parse_timestamp(head["timestamp"]), str(head["event_id"])) if head else None
+
+    segments: List[dict] = []
+    heads: Dict[int, dict] = {}
+    writing: Optional[asyncio.Task] = None
+    batch: List[dict] = []
+    cursor = None
+    total = 0
+    done = head is None
+
+    async def flush(events: List[dict]) -> None:
+        # Waits for the segment being written, then hands `events` to the writer thread
+        nonlocal writing
+        if writing is not None:
+            segments.append(await writing)
+            writing = None
+        if events:
+            index = len(segments)
+            writing = asyncio.create_task(asyncio.to_thread(_write_segment, directory, index, events, level))
+
+    while not done:
+        page = await run_db(store.audit_events_after, cursor, page_size)
+        for event in page:
+            if (parse_timestamp(event["timestamp"]), str(event["event_id"])) > head_key:
+                done = True
+                break
+            batch.append(event)
+            shard = event.get("shard") or 0
+            chain = heads.setdefault(shard, {"shard": shard, "events": 0})
+            chain.update(event_id=str(event["event_id"]), timestamp=_text(event["timestamp"]), hash=event["hash_current"])
+            chain["events"] += 1
+            total += 1
+            if len(batch) >= segment_events:
+                await flush(batch)
+                batch = []
+        if len(page) < page_size:
+            done = True
+        elif page:
+            cursor = (page[-1]["timestamp"], page[-1]["event_id"])
+    await flush(batch)
+    await flush([])
+
+    manifest = {
+        "format": ARCHIVE_FORMAT,
+        "version": ARCHIVE_VERSION,
+        "created_at": datetime.utcnow().isoformat(),
+        "event_count": total,
+        "segment_events": segment_events,
+        "compression": "zlib",
+        "segments": segments,
+        "heads": [heads[s] for s in sorted(heads)],
+        "kid": signing_key_id(),
+    }
+    signed = {"signed_payload": manifest, "signature": sign_payload(manifest, data=manifest_bytes(manifest))}
+    with open(os.path.join(directory, MANIFEST_FILE), "w") as f:
+        json.dump(signed, f, indent=2)
+    return signed
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", required=True, help="archive directory (created if missing)")
+    parser.add_argument("--segment-events", type=int, default=ARCHIVE_SEGMENT_EVENTS)
+    parser.add_argument("--page-size", type=int, default=ARCHIVE_PAGE_SIZE)
+    parser.add_argument("--level", type=int, default=ARCHIVE_COMPRESSION_LEVEL, help="zlib level 0-9")
+    args = parser.parse_args(argv)
+
+    try:
+        signed = asyncio.run(export_archive(args.out, args.segment_events, args.page_size, args.level))
+    finally:
+        get_storage().close()
+    manifest = signed["signed_payload"]
+    size = sum(s["bytes"] for s in manifest["segments"])
+    print(f"Exported {manifest['event_count']} event(s) in {len(manifest['segments'])} segment(s), "
+          f"{size} bytes, to {args.out}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,440 @@
+import os
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from database import run_db
+from storage import LedgerConflict, LedgerRejected, get_storage
+from chain import GENESIS_HASH
+from merkle import merkle_log
+from event_hub import event_hub
+from canonical import AUDIT_HASH_VERSION, chain_hash
+from shards import AUDIT_SHARDS, WriterLease, writer_lease
+from utils import parse_timestamp
+
+AUDIT_BATCH_MAX_SIZE = int(os.environ.get("AUDIT_BATCH_MAX_SIZE", "100"))
+AUDIT_BATCH_MAX_WAIT_MS = float(os.environ.get("AUDIT_BATCH_MAX_WAIT_MS", "5"))
+# How many times a batch is relinked when another worker moved the chain head first
+AUDIT_CONFLICT_RETRIES = int(os.environ.get("AUDIT_CONFLICT_RETRIES", "20"))
+
+def hash_timestamp_for(event_payload, timestamp: str) -> str:
+    """
+    The timestamp string that goes into the hash.
+    Receipts carry their own ISO timestamp, which the chain has always used;
+    other events fall back to the row's timestamp column.
+    """
+    if isinstance(event_payload, dict) and isinstance(event_payload.get("timestamp"), str):
+        return event_payload["timestamp"]
+    return timestamp
+
+class ChainClock:
+    """
+    Hands out strictly increasing timestamps, so (timestamp) order always equals chain
+    order. Shared by the shard writers of a sharded ledger, which keeps one global order
+    across all shards (the live stream follows it).
+    """
+
+    def __init__(self):
+        self.last: Optional[datetime] = None
+
+    def observe(self, timestamp: datetime) -> None:
+        if self.last is None or timestamp > self.last:
+            self.last = timestamp
+
+    def next(self) -> datetime:
+        now = datetime.utcnow()
+        if self.last is not None and now <= self.last:
+            now = self.last + timedelta(microseconds=1)
+        self.last = now
+        return now
+
+class AuditAppender:
+    """
+    Single-writer pipeline for audit_events.
+
+    Route handlers enqueue events and await the returned row. One writer task
+    drains the queue, links the queued events to the in-memory chain head in
+    queue order and writes each batch with a single bulk insert (group commit).
+    A batch is flushed once it reaches `max_batch_size` or `max_wait_ms` after
+    its first event arrived, whichever comes first.
+
+    Within a process only this task reads or advances the head. Every API worker
+    has its own appender, so the head in memory can be stale: the storage checks
+    each batch against the stored head in the same transaction as the insert
+    (LedgerConflict if another worker appended first), and the batch is relinked
+    on the reloaded head. Concurrent writers therefore never fork the chain.
+    """
+
+    def __init__(self, max_batch_size: int = AUDIT_BATCH_MAX_SIZE,
+                 max_wait_ms: float = AUDIT_BATCH_MAX_WAIT_MS, shard: Optional[int] = None,
+                 clock: Optional[ChainClock] = None, release: Optional["OrderedRelease"] = None,
+                 lease: Optional[WriterLease] = None):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        # Set when this writer owns one chain of a sharded ledger (see ShardedAuditAppender)
+        self.shard = shard
+        self.clock = clock or ChainClock()
+        self._release = release
+        # Checked before every write of a sharded ledger (one writer process, see shards.py)
+        self._lease = lease
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._head: Optional[str] = None
+        self.batches_flushed = 0
+        self.events_written = 0
+        self.conflicts = 0
+
+    # --- lifecycle ---
+
+    def start(self) -> None:
+        if self._task and not self._task.done():
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flushes whatever is queued, then stops the writer (and the Merkle root signer it notified)."""
+        if not self._task:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._release is None:
+            await merkle_signer.stop()
+
+    # --- producer side ---
+
+    async def append(self, event_type: str, actor_id: Optional[str], actor_type: str,
+                     event_payload: dict, grant: Optional[dict] = None,
+                     canonical: Optional[bytes] = None, shard: int = 0) -> dict:
+        """
+        Queues one event and waits until it is durably written.
+        `grant` holds the consent, purposes and receipt rows a CONSENT_GRANTED event
+        certifies; they are written in the same transaction as the event.
+        `canonical` is canonical_json(event_payload) if the caller already has it
+        (the signed bytes), so the hash reuses it instead of serializing again.
+        `shard` is shards.shard_for() of the event; a single chain ignores it.
+        Returns the stored audit_events row (including hash_prev / hash_current).
+        """
+        event = {
+            "event_type": event_type,
+            "actor_id": actor_id,
+            "actor_type": actor_type,
+            "event_payload": event_payload,
+            "shard": shard,
+        }
+        if grant is not None:
+            event["grant"] = grant
+        if canonical is not None:
+            event["canonical"] = canonical
+        rows = await self.append_many([event])
+        return rows[0]
+
+    async def append_many(self, events: List[dict], return_exceptions: bool = False) -> List[dict]:
+        """
+        Queues several events back to back, so they form a contiguous chain segment.
+        Each event is a dict with event_type, actor_id, actor_type, event_payload
+        and optionally grant, expire ({consent_id} to mark expired in the same
+        transaction), canonical and shard (see append).
+        With return_exceptions, an event that failed yields its exception in place
+        of the row instead of raising.
+        """
+        self.start()
+        loop = asyncio.get_running_loop()
+        futures = []
+        for event in events:
+            fut = loop.create_future()
+            self._queue.put_nowait((event, fut))
+            futures.append(fut)
+        return list(await asyncio.gather(*futures, return_exceptions=return_exceptions))
+
+    # --- writer side ---
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            if self.max_wait and self._queue.qsize() < self.max_batch_size - 1:
+                # Give concurrent writers a moment to join this group commit
+                await asyncio.sleep(self.max_wait)
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _load_head(self) -> None:
+        head = get_storage().latest_audit_event(self.shard)
+        if head:
+            self._head = head["hash_current"]
+            self.clock.observe(parse_timestamp(head["timestamp"]))
+        else:
+            self._head = GENESIS_HASH
+
+    def _link(self, events: List[dict]) -> List[dict]:
+        rows = []
+        prev_hash = self._head
+        for event in events:
+            timestamp = self.clock.next().isoformat()
+            current_hash = chain_hash(
+                prev_hash, event["event_payload"], hash_timestamp_for(event["event_payload"], timestamp),
+                AUDIT_HASH_VERSION, event.get("canonical")
+            )
+            row = {
+                "event_type": event["event_type"],
+                "actor_id": event.get("actor_id"),
+                "actor_type": event["actor_type"],
+                "event_payload": event["event_payload"],
+                "timestamp": timestamp,
+                "hash_prev": prev_hash,
+                "hash_current": current_hash,
+                "hash_version": AUDIT_HASH_VERSION,
+            }
+            if event.get("grant") is not None:
+                row["grant"] = event["grant"]
+            if event.get("expire") is not None:
+                row["expire"] = event["expire"]
+            if self.shard is not None:
+                row["shard"] = self.shard
+            rows.append(row)
+            prev_hash = current_hash
+        return rows
+
+    def _write(self, rows: List[dict]) -> List[dict]:
+        if self._lease is not None:
+            self._lease.check()
+        return get_storage().append_ledger(rows)
+
+    async def _flush(self, batch: List[tuple]) -> None:
+        attempts = 0
+        while True:
+            ticket = None
+            try:
+                if self._head is None:
+                    await run_db(self._load_head)
+                rows = self._link([event for event, _ in batch])
+                if self._release is not None:
+                    ticket = self._release.reserve()
+                stored = await run_db(self._write, rows)
+                break
+            except Exception as e:
+                if ticket is not None:
+                    self._release.complete(ticket, [])
+                # The write may or may not have landed; re-read the head before the next batch
+                self._head = None
+                if isinstance(e, LedgerConflict) and attempts < AUDIT_CONFLICT_RETRIES:
+                    # Another worker appended first and nothing landed: relink on its head
+                    attempts += 1
+                    self.conflicts += 1
+                    continue
+                print(f"Audit batch of {len(batch)} event(s) failed: {e}")
+                if isinstance(e, LedgerRejected) and not isinstance(e, LedgerConflict) and len(batch) > 1:
+                    # The database rejected the batch, so the transaction rolled back and nothing
+                    # landed. Retry one event at a time so a single bad grant fails only its caller.
+                    for item in batch:
+                        await self._flush([item])
+                    return
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                return
+
+        self._head = rows[-1]["hash_current"]
+        self.batches_flushed += 1
+        self.events_written += len(rows)
+        for (_, fut), row in zip(batch, stored):
+            if not fut.done():
+                fut.set_result(row)
+        # The batch's Merkle leaves were stored with it; a root may be due
+        merkle_signer.notify()
+        if self._release is not None:
+            # Other shards may still be writing earlier events; publish in chain order
+            self._release.complete(ticket, stored)
+            return
+
+        # Push to /audit/events/stream subscribers right away
+        event_hub.publish(stored)
+
+    def publish_mark(self) -> Optional[int]:
+        """
+        Changes whenever a batch is linked, and is None while a linked batch is not yet
+        published (see OrderedRelease). One chain publishes as it writes: always 0.
+        """
+        return 0
+
+class MerkleRootSigner:
+    """
+    Signs Merkle roots from its own task. The leaves themselves are written with
+    each ledger batch (Storage.append_ledger); writers only notify() this task,
+    which never waits, so signing a root (or the startup backfill of the index)
+    never holds up the audit writer or the grants waiting on it. A failed attempt
+    is logged and retried with exponential backoff.
+    """
+
+    RETRY_MIN_SECONDS = 0.5
+    RETRY_MAX_SECONDS = 30.0
+
+    def __init__(self):
+        self._backfill = False
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopped: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.failures = 0
+
+    def start(self) -> None:
+        if self._task and not self._task.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._stopped = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        if self._backfill:
+            self._wakeup.set()
+
+    async def stop(self) -> None:
+        """Signs a root if one is due, then stops."""
+        if not self._task:
+            return
+        self._stopped.set()
+        self._wakeup.set()
+        await self._task
+        self._task = None
+
+    def notify(self) -> None:
+        """Called after a batch is stored: the tree grew, a root may be due."""
+        self.start()
+        self._wakeup.set()
+
+    def backfill(self) -> None:
+        """Catches the index up with the ledger (events written before it existed) in the background."""
+        self._backfill = True
+        self.start()
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        delay = self.RETRY_MIN_SECONDS
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                if self._backfill:
+                    added = await run_db(merkle_log.backfill)
+                    self._backfill = False
+                    if added:
+                        print(f"Merkle index backfilled with {added} leaves")
+                await run_db(merkle_log.sign_root_if_due)
+                delay = self.RETRY_MIN_SECONDS
+            except Exception as e:
+                self.failures += 1
+                print(f"Merkle root signing failed (retried in {delay:g}s): {e}")
+                if not self._stopped.is_set():
+                    try:
+                        await asyncio.wait_for(self._stopped.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    delay = min(delay * 2, self.RETRY_MAX_SECONDS)
+                    self._wakeup.set()
+            if self._stopped.is_set():
+                return
+
+merkle_signer = MerkleRootSigner()
+
+class OrderedRelease:
+    """
+    Publishes the batches of several shard writers in the order they were linked,
+    which is timestamp order, whatever order their writes finish in. A batch is
+    handed to the live stream as soon as every earlier batch is stored (or failed).
+    """
+
+    def __init__(self):
+        self._reserved = 0
+        self._released = 0
+        self._done: Dict[int, List[dict]] = {}
+
+    def reserve(self) -> int:
+        """Called right after linking a batch; tickets follow link order."""
+        ticket = self._reserved
+        self._reserved += 1
+        return ticket
+
+    def complete(self, ticket: int, stored: List[dict]) -> None:
+        """Hands in a stored batch (empty if its write failed) and publishes every batch now in order."""
+        self._done[ticket] = stored
+        while self._released in self._done:
+            batch = self._done.pop(self._released)
+            self._released += 1
+            if batch:
+                event_hub.publish(batch)
+
+    def publish_mark(self) -> Optional[int]:
+        return self._reserved if self._reserved == self._released else None
+
+class ShardedAuditAppender:
+    """
+    Writer for a sharded ledger (AUDIT_SHARDS > 1): one AuditAppender per shard, each
+    with its own queue, in-memory head and group commits, so batches for different
+    shards are linked and written concurrently instead of queueing behind one head.
+    All shards draw timestamps from one ChainClock and are published through one
+    OrderedRelease, so the ledger still has a single global (timestamp) order within
+    the process. That order only holds within one process, so every write requires
+    the writer lease (shards.WriterLease), which at most one process holds.
+    """
+
+    def __init__(self, shards: int = AUDIT_SHARDS, max_batch_size: int = AUDIT_BATCH_MAX_SIZE,
+                 max_wait_ms: float = AUDIT_BATCH_MAX_WAIT_MS, lease: Optional[WriterLease] = writer_lease):
+        self.clock = ChainClock()
+        self.release = OrderedRelease()
+        self.shards = [AuditAppender(max_batch_size, max_wait_ms, shard=i, clock=self.clock, release=self.release,
+                                     lease=lease)
+                       for i in range(shards)]
+
+    def start(self) -> None:
+        merkle_signer.start()
+        for appender in self.shards:
+            appender.start()
+
+    async def stop(self) -> None:
+        await asyncio.gather(*(appender.stop() for appender in self.shards))
+        await merkle_signer.stop()
+
+    async def append(self, event_type: str, actor_id: Optional[str], actor_type: str,
+                     event_payload: dict, grant: Optional[dict] = None,
+                     canonical: Optional[bytes] = None, shard: int = 0) -> dict:
+        """See AuditAppender.append; the event goes to the writer of `shard`."""
+        self.start()
+        return await self.shards[shard % len(self.shards)].append(
+            event_type, actor_id, actor_type, event_payload, grant=grant, canonical=canonical
+        )
+
+    async def append_many(self, events: List[dict], return_exceptions: bool = False) -> List[dict]:
+        """
+        See AuditAppender.append_many. Events are split by their "shard"; each shard's
+        events stay contiguous and in order on that shard's chain.
+        """
+        self.start()
+        by_shard: Dict[int, List[int]] = {}
+        for i, event in enumerate(events):
+            by_shard.setdefault(event.get("shard", 0) % len(self.shards), []).append(i)
+        results: List = [None] * len(events)
+
+        async def write(shard: int, positions: List[int]) -> None:
+            rows = await self.shards[shard].append_many([events[i] for i in positions],
+                                                        return_exceptions=return_exceptions)
+            for i, row in zip(positions, rows):
+                results[i] = row
+
+        await asyncio.gather(*(write(shard, positions) for shard, positions in by_shard.items()))
+        return results
+
+    def publish_mark(self) -> Optional[int]:
+        return self.release.publish_mark()
+
+    def stats(self) -> List[dict]:
+        return [{"shard": a.shard, "batches_flushed": a.batches_flushed, "events_written": a.events_written,
+                 "head_conflicts": a.conflicts} for a in self.shards]
+
+audit_appender = ShardedAuditAppender() if AUDIT_SHARDS > 1 else AuditAppender()
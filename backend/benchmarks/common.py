@@ -0,0 +1,127 @@
+import os
+import sys
+import json
+import math
+import time
+import platform
+import argparse
+import tempfile
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# Benchmarks run against the embedded database and a throwaway keyring unless told otherwise
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("STORAGE_SQLITE_PATH", ":memory:")
+os.environ.setdefault("SIGNING_KEYS_DIR", os.path.join(tempfile.gettempdir(), "saksham-bench-keys"))
+os.environ.setdefault("AUTH_MODE", "local")
+os.environ.setdefault("JWT_SECRET", "benchmark-secret-benchmark-secret")
+
+DEFAULT_TOLERANCE = 0.25
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+def summarize(name: str, latencies: List[float], wall_seconds: float, **extra) -> dict:
+    """Throughput and latency percentiles (ms) for one benchmark; latencies in seconds."""
+    ordered = sorted(latencies)
+    count = len(ordered)
+    return {
+        "name": name,
+        "count": count,
+        "wall_seconds": round(wall_seconds, 4),
+        "ops_per_sec": round(count / wall_seconds, 1) if wall_seconds > 0 else None,
+        "mean_ms": round(sum(ordered) / count * 1000, 4) if count else None,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 4),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 4),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 4),
+        **extra,
+    }
+
+def time_calls(fn, iterations: int) -> dict:
+    """Calls fn() `iterations` times, timing each call."""
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+    return {"latencies": latencies, "wall": time.perf_counter() - started}
+
+def print_table(results: List[dict]) -> None:
+    header = f"{'benchmark':<44} {'count':>7} {'ops/s':>11} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['name']:<44} {r['count']:>7} {r['ops_per_sec'] or 0:>11.1f} "
+              f"{r['p50_ms']:>10.3f} {r['p95_ms']:>10.3f} {r['p99_ms']:>10.3f}")
+
+def report(suite: str, results: List[dict], config: dict) -> dict:
+    return {
+        "suite": suite,
+        "created_at": datetime.utcnow().isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": config,
+        "results": results,
+    }
+
+def write_json(path: str, data: dict) -> None:
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+    print(f"Wrote {path}")
+
+def compare(results: List[dict], baseline: dict, tolerance: float) -> List[str]:
+    """
+    Regressions against a baseline report: throughput below (1 - tolerance) x baseline
+    or p95 latency above (1 + tolerance) x baseline. Benchmarks missing on either side
+    are skipped.
+    """
+    previous: Dict[str, dict] = {r["name"]: r for r in baseline.get("results", [])}
+    regressions = []
+    for r in results:
+        base = previous.get(r["name"])
+        if not base:
+            continue
+        if base.get("ops_per_sec") and r.get("ops_per_sec") is not None \
+                and r["ops_per_sec"] < base["ops_per_sec"] * (1 - tolerance):
+            regressions.append(f"{r['name']}: {r['ops_per_sec']} ops/s vs baseline {base['ops_per_sec']}")
+        if base.get("p95_ms") and r["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{r['name']}: p95 {r['p95_ms']} ms vs baseline {base['p95_ms']}")
+    return regressions
+
+def add_output_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--out", help="write machine-readable results (JSON) to this file")
+    parser.add_argument("--baseline", help="compare against this results file; exit 1 on regression")
+    parser.add_argument("--save-baseline", help="also write the results to this file as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help=f"allowed slowdown before a regression is reported (default {DEFAULT_TOLERANCE})")
+
+def finish(args, suite: str, results: List[dict], config: dict) -> int:
+    """Prints, writes and compares results. Returns the process exit code."""
+    print_table(results)
+    data = report(suite, results, config)
+    if args.out:
+        write_json(args.out, data)
+    if args.save_baseline:
+        write_json(args.save_baseline, data)
+    if args.baseline:
+        if not os.path.exists(args.baseline):
+            print(f"Baseline {args.baseline} not found, skipping comparison")
+            return 0
+        with open(args.baseline) as f:
+            baseline: Optional[dict] = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nNo regressions beyond {args.tolerance:.0%} against {args.baseline}")
+    return 0
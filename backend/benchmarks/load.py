@@ -0,0 +1,148 @@
+"""
+Load generator for the API hot paths, driven in-process through the ASGI app.
+
+Runs against the embedded SQLite storage (STORAGE_BACKEND=sqlite, in memory by
+default) with authentication stubbed out, so no network or hosted project is needed.
+Scenarios run in order, each reusing data from the previous ones:
+
+    grant -> verify -> revoke -> events -> verify-chain (full, then incremental)
+
+    cd backend
+    python -m benchmarks.load [--requests 500] [--concurrency 16] [--purposes 3] [--out results.json]
+                              [--baseline baseline.json] [--save-baseline baseline.json]
+"""
+import argparse
+import asyncio
+import sys
+import time
+import uuid
+from typing import Callable, List
+
+from benchmarks.common import add_output_args, finish, summarize
+
+import httpx
+
+from main import app
+from models import AuthenticatedUser
+from routers.auth import get_current_user
+
+BENCH_USER = AuthenticatedUser(id=str(uuid.uuid4()), email="bench@example.com", role="authenticated")
+
+async def _stub_user():
+    return BENCH_USER
+
+async def drive(client: httpx.AsyncClient, name: str, make_request: Callable[[int], "asyncio.Future"],
+                count: int, concurrency: int) -> dict:
+    """Issues `count` requests with at most `concurrency` in flight; non-2xx responses count as errors."""
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            t0 = time.perf_counter()
+            response = await make_request(i)
+            latencies.append(time.perf_counter() - t0)
+            if response.status_code >= 300:
+                errors += 1
+            return response
+
+    started = time.perf_counter()
+    responses = await asyncio.gather(*(one(i) for i in range(count)))
+    result = summarize(name, latencies, time.perf_counter() - started, errors=errors, concurrency=concurrency)
+    result["responses"] = responses
+    return result
+
+async def run(requests: int, concurrency: int, purposes: int) -> list:
+    app.dependency_overrides[get_current_user] = _stub_user
+    grant_body = {
+        "app_id": "Benchmark App",
+        "purposes": [
+            {"purpose_code": code, "data_categories": ["email", "location"]}
+            for code in ["CORE_FUNCTION", "ANALYTICS", "MARKETING"][:max(1, purposes)]
+        ],
+    }
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            grants = await drive(client, "POST /consent/grant",
+                                 lambda i: client.post("/consent/grant", json=grant_body), requests, concurrency)
+            receipts = [r.json() for r in grants.pop("responses") if r.status_code == 200]
+            results.append(grants)
+            if not receipts:
+                raise RuntimeError("No grant succeeded; nothing to verify")
+
+            verify = await drive(client, "POST /consent/verify",
+                                 lambda i: client.post("/consent/verify", json={"receipt": receipts[i % len(receipts)]}),
+                                 requests, concurrency)
+            verify.pop("responses")
+            results.append(verify)
+
+            def check_body(i):
+                payload = receipts[i % len(receipts)]["receipt_payload"]
+                return {"user_id": payload["user_id"], "app_id": payload["app_id"],
+                        "purpose_code": grant_body["purposes"][0]["purpose_code"], "data_categories": ["email"]}
+            check = await drive(client, "POST /consent/check",
+                                lambda i: client.post("/consent/check", json=check_body(i)), requests, concurrency)
+            check.pop("responses")
+            results.append(check)
+
+            to_revoke = receipts[:max(1, len(receipts) // 2)]
+            revoke = await drive(client, "POST /consent/revoke",
+                                 lambda i: client.post("/consent/revoke", json={"consent_id": to_revoke[i]["consent_id"]}),
+                                 len(to_revoke), concurrency)
+            revoke.pop("responses")
+            results.append(revoke)
+
+            events = await drive(client, "GET /audit/events",
+                                 lambda i: client.get("/audit/events", params={"limit": 50}),
+                                 requests, concurrency)
+            first_page = events.pop("responses")[0]
+            results.append(events)
+
+            # Deep page without payloads: should cost the same as the first page
+            cursor = first_page.headers.get("x-next-cursor")
+            if cursor:
+                page = await drive(client, "GET /audit/events?cursor",
+                                   lambda i: client.get("/audit/events", params={
+                                       "limit": 50, "cursor": cursor, "fields": "event_type,actor_id"}),
+                                   requests, concurrency)
+                page.pop("responses")
+                results.append(page)
+
+            # Sequential on purpose: each call is a pass over the ledger
+            full = await drive(client, "GET /audit/verify-chain?full=true",
+                               lambda i: client.get("/audit/verify-chain", params={"full": "true", "limit": 1000}),
+                               5, 1)
+            full.pop("responses")
+            results.append(full)
+
+            incremental = await drive(client, "GET /audit/verify-chain",
+                                      lambda i: client.get("/audit/verify-chain", params={"limit": 1000}),
+                                      max(10, requests // 10), 1)
+            incremental.pop("responses")
+            results.append(incremental)
+    app.dependency_overrides.pop(get_current_user, None)
+    return results
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight")
+    parser.add_argument("--purposes", type=int, default=3, help="purposes per grant (1-3)")
+    add_output_args(parser)
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args.requests, args.concurrency, args.purposes))
+    failed = [r for r in results if r["errors"]]
+    for r in failed:
+        print(f"{r['name']}: {r['errors']} non-2xx response(s)")
+    code = finish(args, "load", results, {
+        "requests": args.requests, "concurrency": args.concurrency, "purposes": args.purposes,
+    })
+    return code or (1 if failed else 0)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""
+Micro-benchmarks for the crypto / hashing hot paths.
+chain_hash_v2_presigned reuses the canonical bytes that were signed, as /consent/grant does.
+
+    cd backend
+    python -m benchmarks.micro [--iterations 2000] [--purposes 1,5,25,100] [--out results.json]
+                               [--baseline baseline.json] [--save-baseline baseline.json]
+"""
+import argparse
+import sys
+import uuid
+from datetime import datetime, timedelta
+
+from benchmarks.common import add_output_args, finish, summarize, time_calls
+
+from canonical import HASH_V2, chain_hash
+from utils import canonical_json, generate_hash_chain, sign_payload, signing_key_id, verify_signature
+
+def receipt_payload(purposes: int, categories: int = 3) -> dict:
+    """A /consent/grant receipt with `purposes` purposes of `categories` data categories each."""
+    now = datetime.utcnow()
+    return {
+        "version": "1.0",
+        "consent_id": str(uuid.uuid4()),
+        "user_id": str(uuid.uuid4()),
+        "app_id": str(uuid.uuid4()),
+        "app_name": "Benchmark App",
+        "timestamp": now.isoformat(),
+        "expiry": (now + timedelta(hours=24)).isoformat(),
+        "purposes": [
+            {"purpose": f"PURPOSE_{i}", "categories": [f"category_{j}" for j in range(categories)]}
+            for i in range(purposes)
+        ],
+        "kid": signing_key_id(),
+    }
+
+def run(iterations: int, purpose_counts) -> list:
+    results = []
+    for purposes in purpose_counts:
+        payload = receipt_payload(purposes)
+        signature = sign_payload(payload)
+        timestamp = payload["timestamp"]
+        data = canonical_json(payload)
+        size = len(data)
+        cases = [
+            ("canonical_json", lambda: canonical_json(payload)),
+            ("sign_payload", lambda: sign_payload(payload)),
+            ("verify_signature", lambda: verify_signature(payload, signature, memoize=False)),
+            ("verify_signature_memoized", lambda: verify_signature(payload, signature)),
+            ("generate_hash_chain", lambda: generate_hash_chain("0" * 64, payload, timestamp)),
+            ("chain_hash_v2", lambda: chain_hash("0" * 64, payload, timestamp, HASH_V2)),
+            ("chain_hash_v2_presigned", lambda: chain_hash("0" * 64, payload, timestamp, HASH_V2, data)),
+        ]
+        for name, fn in cases:
+            fn()  # warm up
+            timed = time_calls(fn, iterations)
+            results.append(summarize(
+                f"{name}[purposes={purposes}]", timed["latencies"], timed["wall"], payload_bytes=size
+            ))
+    return results
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--purposes", default="1,5,25,100", help="comma-separated purpose counts per payload")
+    add_output_args(parser)
+    args = parser.parse_args(argv)
+
+    purpose_counts = [int(p) for p in args.purposes.split(",") if p.strip()]
+    results = run(args.iterations, purpose_counts)
+    return finish(args, "micro", results, {"iterations": args.iterations, "purposes": purpose_counts})
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+import os
+import re
+import json
+import hashlib
+from typing import Optional
+
+try:
+    import orjson
+except ImportError:  # Optional: pip install orjson
+    orjson = None
+
+# --- CANONICALIZATION ENGINE ---
+# One serialization of a payload feeds both the signer and (for hash format v2) the
+# hash chain. The canonical form is compact JSON with sorted keys and ASCII escapes,
+# exactly what json.dumps(sort_keys=True, separators=(',', ':')) has always produced.
+#
+# Hash formats (stored per event in audit_events.hash_version):
+#   1  SHA256(prev_hash + json.dumps(payload, sort_keys=True) + timestamp)   legacy
+#   2  SHA256 over prev_hash, canonical_json(payload), timestamp, fed as streaming updates
+# Events keep the format they were written with; AUDIT_HASH_VERSION picks it for new ones.
+HASH_V1 = 1
+HASH_V2 = 2
+AUDIT_HASH_VERSION = int(os.environ.get("AUDIT_HASH_VERSION", str(HASH_V2)))
+
+# orjson is used when installed, unless CANONICAL_FAST_JSON=false
+CANONICAL_FAST_JSON = orjson is not None and \
+    os.environ.get("CANONICAL_FAST_JSON", "true").lower() in ("1", "true", "yes")
+
+# Floats orjson renders differently from json.dumps: exponent form (1e16 vs 1e+16), small
+# values (0.00001 vs 1e-05) and NaN / Infinity, which orjson renders as null. In compact
+# JSON every value outside a string starts the output or follows ':', ',' or '['; with
+# those mapped to ':' and the number characters deleted, an exponent's "e" (or a null)
+# directly follows a ':'. Hits inside strings are possible and only cost a fallback.
+_DELIMITERS = bytes.maketrans(b",[", b"::")
+_NUMBER_CHARS = b"-.0123456789"
+_DIVERGENT = re.compile(rb':(?:e|null)')
+
+def _may_diverge(data: bytes) -> bool:
+    if b"0.0000" in data:
+        return True
+    values = data.translate(_DELIMITERS, _NUMBER_CHARS)
+    return values.startswith((b"e", b"null")) or _DIVERGENT.search(values) is not None
+
+_ORJSON_OPTIONS = 0 if orjson is None else (
+    orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+    | orjson.OPT_PASSTHROUGH_SUBCLASS
+)
+
+def _refuse(value):
+    """
+    orjson `default` hook: datetimes, dataclasses and subclasses of str/int/dict/list take
+    the stdlib path (which refuses or renders them its own way). orjson has no such hook
+    for UUIDs: it writes them as strings where json.dumps raises.
+    """
+    raise TypeError(f"{type(value).__name__} is not canonical-fast-path serializable")
+
+def _stdlib_canonical(payload) -> bytes:
+    return json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+def _fast_canonical(payload) -> Optional[bytes]:
+    """orjson's rendering of payload when it is byte-for-byte json.dumps', else None."""
+    try:
+        data = orjson.dumps(payload, default=_refuse, option=_ORJSON_OPTIONS)
+    except orjson.JSONEncodeError:
+        return None  # e.g. integers beyond 64 bits, non-str keys, lone surrogates
+    # orjson writes non-ASCII text and DEL (0x7f) raw where json.dumps escapes them
+    if not data.isascii() or b"\x7f" in data or _may_diverge(data):
+        return None
+    return data
+
+def canonical_json(payload) -> bytes:
+    """
+    Produces a deterministic JSON byte string.
+    Keys are sorted, no whitespace, non-ASCII characters escaped.
+    """
+    if CANONICAL_FAST_JSON:
+        data = _fast_canonical(payload)
+        if data is not None:
+            return data
+    return _stdlib_canonical(payload)
+
+def legacy_hash_text(payload) -> str:
+    """The payload as hash format v1 serialized it (json.dumps default separators)."""
+    return json.dumps(payload, sort_keys=True)
+
+def chain_hash(prev_hash: Optional[str], payload, timestamp: str, version: int = HASH_V1,
+               canonical: Optional[bytes] = None) -> str:
+    """
+    hash_current for an audit event in the given hash format.
+    `canonical` is canonical_json(payload) when the caller already has it (e.g. the
+    bytes that were just signed), so v2 events are serialized only once.
+    """
+    if version == HASH_V2:
+        h = hashlib.sha256()
+        h.update((prev_hash or "").encode('utf-8'))
+        h.update(canonical if canonical is not None else canonical_json(payload))
+        h.update(timestamp.encode('utf-8'))
+        return h.hexdigest()
+    if version != HASH_V1:
+        raise ValueError(f"Unknown hash version: {version}")
+    content = (prev_hash or "") + legacy_hash_text(payload) + timestamp
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
@@ -0,0 +1,267 @@
+import os
+import time
+from typing import Dict, List, Optional
+
+from canonical import HASH_V1, chain_hash
+from workers import chunked, map_chunks
+from metrics import record_chain_page
+
+GENESIS_HASH = "0" * 64
+
+# Events per worker task when recomputing hashes in parallel, and the smallest
+# range worth shipping to the process pool (below it pickling costs more than it saves)
+CHAIN_VERIFY_CHUNK_SIZE = int(os.environ.get("CHAIN_VERIFY_CHUNK_SIZE", "2000"))
+CHAIN_VERIFY_PARALLEL_MIN = int(os.environ.get("CHAIN_VERIFY_PARALLEL_MIN", "4000"))
+
+def _as_iso(value) -> str:
+    if isinstance(value, str):
+        return value
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+def event_hash_timestamp(event: dict) -> str:
+    """
+    The timestamp string an event's hash was computed with.
+
+    IMPORTANT: Use timestamp from event_payload if available.
+    The hash was originally calculated using receipt_payload['timestamp'] (ISO string),
+    not the database timestamp column. REVOKE events don't carry a timestamp in their
+    payload, so they fall back to the column.
+    """
+    event_payload = event.get("event_payload")
+    if isinstance(event_payload, dict) and event_payload.get("timestamp"):
+        return _as_iso(event_payload["timestamp"])
+    return _as_iso(event["timestamp"])
+
+def event_hash_version(event: dict) -> int:
+    # Events written before hash versions existed have no value (format v1)
+    return event.get("hash_version") or HASH_V1
+
+def recompute_hash(event: dict) -> str:
+    return chain_hash(event["hash_prev"], event["event_payload"], event_hash_timestamp(event), event_hash_version(event))
+
+def _recompute_chunk(items: List[tuple]) -> List[str]:
+    # Runs in a worker process: (hash_prev, payload, hash_timestamp, hash_version) -> hash_current
+    return [chain_hash(prev, payload, ts, version) for prev, payload, ts, version in items]
+
+async def recompute_hashes(events: List[dict], parallel: bool = True) -> List[str]:
+    """
+    Recomputes hash_current for every event, in order.
+    Each hash depends only on the event's own stored hash_prev, payload and timestamp,
+    so chunks are hashed independently in the worker pool; the cheap link check
+    between neighbours stays in ChainVerifier. Small ranges (and WORKER_PROCESSES=1)
+    are hashed serially in a thread, so the event loop is never blocked.
+    """
+    items = [(e["hash_prev"], e["event_payload"], event_hash_timestamp(e), event_hash_version(e)) for e in events]
+    parallel = parallel and len(items) >= CHAIN_VERIFY_PARALLEL_MIN
+    chunks = chunked(items, CHAIN_VERIFY_CHUNK_SIZE if parallel else len(items) or 1)
+    results = await map_chunks(_recompute_chunk, chunks, parallel=parallel)
+    return [h for chunk in results for h in chunk]
+
+class ChainVerifier:
+    """
+    Verifies a run of audit events fed in chain order (oldest first), page by page.
+
+    Checks:
+    1. Each event's hash_current matches recalculated hash (data integrity)
+    2. Each event's hash_prev matches previous event's hash_current (chain linkage)
+    3. No duplicate timestamps (potential insertion attack)
+
+    `expected_prev` is the hash the first fed event must link to (the genesis hash or
+    a checkpoint's hash). When it is None the first event's link is not checked.
+
+    Memory is constant in the number of events: events arrive sorted by timestamp,
+    so duplicates are always neighbours and only the previous timestamp is kept.
+    Streaming callers can drain_violations() after each page to keep it that way.
+    """
+
+    def __init__(self, expected_prev: Optional[str] = None):
+        self.expected_prev = expected_prev
+        self.count = 0
+        self.violations: List[dict] = []
+        self.critical = 0
+        self.warnings = 0
+        self.last_event: Optional[dict] = None
+        # Last event verified before the first critical violation (safe to checkpoint)
+        self.last_good_event: Optional[dict] = None
+        self.good_count = 0
+        self._prev_timestamp = None
+        self._duplicate_reported = False
+
+    def feed(self, events: List[dict], hashes: Optional[List[str]] = None) -> None:
+        """
+        Checks events in order. `hashes` are precomputed hash_current values
+        (see recompute_hashes); without them each hash is recomputed inline.
+        """
+        for i, event in enumerate(events):
+            self._check(event, hashes[i] if hashes is not None else None)
+
+    async def feed_async(self, events: List[dict], parallel: bool = True) -> None:
+        """Recomputes hashes in the worker pool, then runs the ordered checks."""
+        started = time.perf_counter()
+        self.feed(events, await recompute_hashes(events, parallel=parallel))
+        record_chain_page(len(events), time.perf_counter() - started)
+
+    def _check(self, event: dict, recalc_hash: Optional[str] = None) -> None:
+        event_id = event["event_id"]
+        event_timestamp = event["timestamp"]
+        event_type = event["event_type"]
+        clean = self.critical == 0
+
+        # Check 1: Verify hash_current matches recalculated hash
+        # This detects if the event data was modified
+        if recalc_hash is None:
+            recalc_hash = recompute_hash(event)
+        if recalc_hash != event["hash_current"]:
+            self.add_violation({
+                "event_id": str(event_id),
+                "event_type": event_type,
+                "timestamp": event_timestamp,
+                "reason": "Hash Mismatch - Event data may have been tampered with",
+                "details": "Recalculated hash doesn't match stored hash_current",
+                "expected_hash": recalc_hash,
+                "found_hash": event["hash_current"],
+                "severity": "CRITICAL"
+            })
+
+        # Check 2: Verify chain linkage (hash_prev matches previous event's hash_current)
+        # This detects if events were deleted, reordered, or inserted
+        if self.expected_prev is not None and event["hash_prev"] != self.expected_prev:
+            self.add_violation({
+                "event_id": str(event_id),
+                "event_type": event_type,
+                "timestamp": event_timestamp,
+                "reason": "Chain Link Broken - Previous event hash mismatch",
+                "details": "Event's hash_prev doesn't match previous event's hash_current. Possible deletion, reordering, or insertion.",
+                "expected_prev_hash": self.expected_prev,
+                "found_prev_hash": event["hash_prev"],
+                "severity": "CRITICAL"
+            })
+
+        # Check 3: Duplicate timestamps (rolling window over the previous event)
+        if event_timestamp == self._prev_timestamp and not self._duplicate_reported:
+            self._duplicate_reported = True
+            self.add_violation({
+                "event_id": "MULTIPLE",
+                "reason": "Duplicate Timestamps Detected",
+                "details": "Multiple events have the same timestamp. This may indicate unauthorized insertions.",
+                "severity": "WARNING"
+            })
+        self._prev_timestamp = event_timestamp
+
+        # Update expected previous hash for next iteration
+        self.expected_prev = event["hash_current"]
+        self.last_event = event
+        self.count += 1
+        if clean and self.critical == 0:
+            self.last_good_event = event
+            self.good_count = self.count
+
+    def add_violation(self, violation: dict) -> None:
+        if violation.get("severity") == "CRITICAL":
+            self.critical += 1
+        elif violation.get("severity") == "WARNING":
+            self.warnings += 1
+        self.violations.append(violation)
+
+    def drain_violations(self) -> List[dict]:
+        """Returns the violations found since the last drain and forgets them (counts are kept)."""
+        drained, self.violations = self.violations, []
+        return drained
+
+    def status(self) -> str:
+        if not self.critical and not self.warnings:
+            return "VALID"
+        return "TAMPERED" if self.critical else "SUSPICIOUS"
+
+    def summary(self, verified_count: Optional[int] = None) -> dict:
+        status = self.status()
+        return {
+            "verified_count": self.count if verified_count is None else verified_count,
+            "total_events": self.count if verified_count is None else verified_count,
+            "violations": self.violations,
+            "critical_violations": self.critical,
+            "warnings": self.warnings,
+            "status": status,
+            "message": "Chain verified successfully" if status == "VALID" else f"Found {self.critical + self.warnings} violation(s)"
+        }
+
+class ShardedChainVerifier:
+    """
+    Verifies the interleaved chains of a sharded ledger fed in global (timestamp,
+    event_id) order: each event goes to the ChainVerifier of its shard (audit_events.shard),
+    and every shard chain starts from the genesis hash. Same interface as ChainVerifier
+    for page-by-page callers; violations are tagged with their shard.
+    """
+
+    def __init__(self):
+        self.verifiers: Dict[int, ChainVerifier] = {}
+
+    async def feed_async(self, events: List[dict], parallel: bool = True) -> None:
+        by_shard: Dict[int, List[dict]] = {}
+        for event in events:
+            by_shard.setdefault(event.get("shard") or 0, []).append(event)
+        for shard, shard_events in by_shard.items():
+            verifier = self.verifiers.setdefault(shard, ChainVerifier(expected_prev=GENESIS_HASH))
+            await verifier.feed_async(shard_events, parallel=parallel)
+
+    def drain_violations(self) -> List[dict]:
+        return [{"shard": shard, **v} for shard, verifier in sorted(self.verifiers.items())
+                for v in verifier.drain_violations()]
+
+    @property
+    def count(self) -> int:
+        return sum(v.count for v in self.verifiers.values())
+
+    @property
+    def critical(self) -> int:
+        return sum(v.critical for v in self.verifiers.values())
+
+    @property
+    def warnings(self) -> int:
+        return sum(v.warnings for v in self.verifiers.values())
+
+    def status(self) -> str:
+        if not self.critical and not self.warnings:
+            return "VALID"
+        return "TAMPERED" if self.critical else "SUSPICIOUS"
+
+    def summary(self) -> dict:
+        status = self.status()
+        return {
+            "verified_count": self.count,
+            "total_events": self.count,
+            "violations": self.drain_violations(),
+            "critical_violations": self.critical,
+            "warnings": self.warnings,
+            "status": status,
+            "message": "Chain verified successfully" if status == "VALID" else f"Found {self.critical + self.warnings} violation(s)",
+            "shards": sorted(self.verifiers),
+        }
+
+def checkpoint_violation(checkpoint: dict, event: Optional[dict]) -> Optional[dict]:
+    """
+    Re-checks the event a checkpoint points at. A missing event, or one whose stored
+    or recomputed hash no longer equals the checkpointed hash, means history that was
+    already verified has since been altered.
+    """
+    if event is None:
+        return {
+            "event_id": str(checkpoint.get("last_event_id")),
+            "reason": "Checkpoint Event Missing",
+            "details": "The last verified event no longer exists. Possible deletion. Run a full re-verification.",
+            "severity": "CRITICAL"
+        }
+    if event["hash_current"] != checkpoint["last_hash"] or recompute_hash(event) != checkpoint["last_hash"]:
+        return {
+            "event_id": str(event["event_id"]),
+            "event_type": event.get("event_type"),
+            "timestamp": event.get("timestamp"),
+            "reason": "Checkpoint Mismatch - Verified history was modified",
+            "details": "The last verified event no longer hashes to the checkpointed value. Run a full re-verification.",
+            "expected_hash": checkpoint["last_hash"],
+            "found_hash": event["hash_current"],
+            "severity": "CRITICAL"
+        }
+    return None
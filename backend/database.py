@@ -1,5 +1,10 @@
 import os
-from supabase import create_client, Client
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+import httpx
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -7,10 +12,49 @@ load_dotenv()
 url: str = os.environ.get("SUPABASE_URL")
 key: str = os.environ.get("SUPABASE_KEY")
 
-if not url or not key:
-    raise ValueError("Missing SUPABASE_URL or SUPABASE_KEY in environment variables")
+# --- DATA ACCESS LAYER ---
+# Storage backends are synchronous (supabase-py, sqlite3), so every query is a blocking
+# call. Route handlers never make it on the event loop: queries run on a bounded thread
+# pool (DB_POOL_SIZE) that shares one keep-alive HTTP connection pool of the same size,
+# so a worker can have up to DB_POOL_SIZE queries in flight.
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "32"))
+DB_TIMEOUT = float(os.environ.get("DB_TIMEOUT", "30"))
+DB_KEEPALIVE_SECONDS = float(os.environ.get("DB_KEEPALIVE_SECONDS", "60"))
+
+http_client = httpx.Client(
+    limits=httpx.Limits(
+        max_connections=DB_POOL_SIZE,
+        max_keepalive_connections=DB_POOL_SIZE,
+        keepalive_expiry=DB_KEEPALIVE_SECONDS,
+    ),
+    timeout=DB_TIMEOUT,
+    follow_redirects=True,
+)
+
+_supabase = None
+_supabase_lock = threading.Lock()
 
-supabase: Client = create_client(url, key)
+_db_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="db")
 
 def get_db():
-    return supabase
+    """
+    The shared supabase client, created on first use (so STORAGE_BACKEND=sqlite runs
+    without Supabase credentials). Application code goes through storage.get_storage().
+    """
+    global _supabase
+    if _supabase is None:
+        with _supabase_lock:
+            if _supabase is None:
+                if not url or not key:
+                    raise ValueError("Missing SUPABASE_URL or SUPABASE_KEY in environment variables")
+                from supabase import create_client, ClientOptions
+                _supabase = create_client(url, key, options=ClientOptions(httpx_client=http_client))
+    return _supabase
+
+async def run_db(fn: Callable, *args) -> Any:
+    """Runs a blocking function that talks to the database on the DB pool."""
+    return await asyncio.get_running_loop().run_in_executor(_db_executor, fn, *args)
+
+def close_db() -> None:
+    _db_executor.shutdown(wait=False)
+    http_client.close()
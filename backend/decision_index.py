@@ -0,0 +1,325 @@
+import os
+import sys
+import time
+import uuid
+import asyncio
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from database import run_db
+from storage import get_storage
+from utils import parse_timestamp
+
+# In-memory index of active consents for /consent/check.
+# Warmed at startup by streaming `consents` + `consent_purposes`, updated in place by the
+# grant / revoke paths of this process, and kept in step with other workers by tailing
+# the audit ledger every DECISION_INDEX_SYNC_SECONDS (grants and revocations are
+# CONSENT_GRANTED / CONSENT_REVOKED / CONSENT_EXPIRED events).
+DECISION_INDEX_ENABLED = os.environ.get("DECISION_INDEX_ENABLED", "true").lower() in ("1", "true", "yes")
+DECISION_INDEX_MAX_CONSENTS = int(os.environ.get("DECISION_INDEX_MAX_CONSENTS", "2000000"))
+DECISION_INDEX_PAGE_SIZE = int(os.environ.get("DECISION_INDEX_PAGE_SIZE", "1000"))
+DECISION_INDEX_SYNC_SECONDS = float(os.environ.get("DECISION_INDEX_SYNC_SECONDS", "2"))
+
+Scope = Tuple[Tuple[str, frozenset], ...]
+
+def _uuid_bytes(value) -> Optional[bytes]:
+    text = str(value)
+    if len(text) == 36 and text[8] == text[13] == text[18] == text[23] == "-":
+        # Fast path for the canonical form (several times cheaper than uuid.UUID)
+        try:
+            raw = bytes.fromhex(text.replace("-", ""))
+        except ValueError:
+            return None
+        return raw if len(raw) == 16 else None
+    try:
+        return uuid.UUID(text).bytes
+    except ValueError:
+        return None
+
+def _uuid_str(raw: bytes) -> str:
+    h = raw.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+def _epoch(value) -> float:
+    return parse_timestamp(value).replace(tzinfo=timezone.utc).timestamp()
+
+def _make_scope(purposes) -> Scope:
+    """[(purpose_code, data_categories)] -> sorted ((purpose_code, frozenset(categories)), ...)"""
+    return tuple(sorted(
+        (sys.intern(str(purpose)), frozenset(sys.intern(str(c)) for c in categories or ()))
+        for purpose, categories in purposes
+    ))
+
+class Grant:
+    """One active consent: 16-byte consent_id, expiry (epoch seconds) and purpose -> categories."""
+
+    __slots__ = ("consent_id", "expiry", "scope")
+
+    def __init__(self, consent_id: bytes, expiry: float, scope: Scope):
+        self.consent_id = consent_id
+        self.expiry = expiry
+        self.scope = scope
+
+def decide(grants: Iterable[Grant], now: float, purpose_code: str, data_categories: Iterable[str]) -> dict:
+    """
+    Whether any of a (user, app)'s grants covers the purpose and every requested category.
+    Among covering grants the one that expires last is reported.
+    """
+    wanted = set(data_categories)
+    best, reason = None, "no_consent"
+    for grant in grants:
+        if grant.expiry <= now:
+            if reason == "no_consent":
+                reason = "expired"
+            continue
+        if reason in ("no_consent", "expired"):
+            reason = "purpose_not_granted"
+        for purpose, categories in grant.scope:
+            if purpose != purpose_code:
+                continue
+            if wanted <= categories:
+                if best is None or grant.expiry > best.expiry:
+                    best = grant
+            else:
+                reason = "category_not_granted"
+    if best is None:
+        return {"allowed": False, "reason": reason, "consent_id": None, "expiry": None}
+    return {
+        "allowed": True,
+        "reason": "granted",
+        "consent_id": _uuid_str(best.consent_id),
+        "expiry": datetime.utcfromtimestamp(best.expiry),
+    }
+
+class DecisionIndex:
+    """
+    (user_id, app_id) -> active grants, for sub-millisecond consent decisions.
+
+    Compact representation: keys are the two UUIDs as 32 raw bytes, consent IDs are
+    16 bytes, purpose codes are interned and identical scopes (purpose -> category
+    sets) are shared between consents, so a million consents that use a handful of
+    scopes cost little more than their keys. At most `max_consents` are held; past
+    that the index stops adding and denials are double-checked against the database.
+
+    Mutated only from the event loop (write paths, warm-up and ledger sync), and each
+    key's grants are replaced as a whole tuple, so lookups never see a partial update.
+    """
+
+    def __init__(self, max_consents: int = DECISION_INDEX_MAX_CONSENTS,
+                 page_size: int = DECISION_INDEX_PAGE_SIZE, sync_seconds: float = DECISION_INDEX_SYNC_SECONDS):
+        self.max_consents = max_consents
+        self.page_size = max(1, page_size)
+        self.sync_seconds = max(0.1, sync_seconds)
+        self._entries: Dict[bytes, Tuple[Grant, ...]] = {}
+        self._owners: Dict[bytes, bytes] = {}  # consent_id -> key
+        self._scopes: Dict[Scope, Scope] = {}
+        # Revoked / expired consents (final), so a replayed grant never brings one back
+        self._removed = set()
+        self._cursor = None  # (timestamp, event_id) of the last ledger event applied
+        self._task: Optional[asyncio.Task] = None
+        self.ready = False
+        self.complete = True
+        self.hits = 0
+        self.fallbacks = 0
+        self.events_applied = 0
+
+    # --- lifecycle ---
+
+    def start(self) -> None:
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if not self._task:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while not self.ready:
+            try:
+                await self.warm()
+            except Exception as e:
+                print(f"Decision index warm-up failed (retrying): {e}")
+                await asyncio.sleep(self.sync_seconds)
+        while True:
+            await asyncio.sleep(self.sync_seconds)
+            try:
+                await self.sync()
+            except Exception as e:
+                print(f"Decision index sync failed: {e}")
+
+    async def warm(self) -> int:
+        """Streams every active consent into the index, then catches up with the ledger."""
+        store = get_storage()
+        # Ledger position first: anything that changes while we stream is replayed by sync()
+        head = await run_db(store.latest_audit_event)
+        cursor = (head["timestamp"], head["event_id"]) if head else None
+        now = datetime.utcnow().isoformat()
+        loaded, after = 0, None
+        while True:
+            rows = await run_db(store.active_grants, now, self.page_size, after)
+            for row in rows:
+                self.add(row["consent_id"], row["user_id"], row["app_id"], row["expiry_time"],
+                         [(p["purpose_code"], p["data_categories"]) for p in row["purposes"]])
+            loaded += len(rows)
+            if len(rows) < self.page_size:
+                break
+            after = str(rows[-1]["consent_id"])
+            await asyncio.sleep(0)
+        self._cursor = cursor
+        await self.sync()
+        self.ready = True
+        print(f"Decision index warmed with {loaded} active consent(s)")
+        return loaded
+
+    async def sync(self) -> int:
+        """Applies grants, revocations and expiries recorded in the ledger since the last sync."""
+        store = get_storage()
+        applied = 0
+        while True:
+            events = await run_db(store.audit_events_after, self._cursor, self.page_size)
+            for event in events:
+                self._apply(event)
+                self._cursor = (event["timestamp"], event["event_id"])
+            applied += len(events)
+            if len(events) < self.page_size:
+                break
+        self.events_applied += applied
+        return applied
+
+    def _apply(self, event: dict) -> None:
+        payload = event.get("event_payload")
+        if not isinstance(payload, dict) or not payload.get("consent_id"):
+            return
+        if event["event_type"] == "CONSENT_GRANTED":
+            try:
+                self.add(payload["consent_id"], payload["user_id"], payload["app_id"], payload["expiry"],
+                         [(p["purpose"], p["categories"]) for p in payload.get("purposes") or []])
+            except (KeyError, TypeError, ValueError):
+                pass  # not a receipt we issued (e.g. a tampered demo event)
+        elif event["event_type"] in ("CONSENT_REVOKED", "CONSENT_EXPIRED"):
+            self.remove(payload["consent_id"])
+
+    # --- write paths ---
+
+    @staticmethod
+    def _key(user_id, app_id) -> Optional[bytes]:
+        user, app = _uuid_bytes(user_id), _uuid_bytes(app_id)
+        if user is None or app is None:
+            return None
+        return user + app
+
+    def _scope(self, purposes) -> Scope:
+        scope = _make_scope(purposes)
+        return self._scopes.setdefault(scope, scope)
+
+    def add(self, consent_id, user_id, app_id, expiry, purposes) -> None:
+        """Records an active consent; purposes is [(purpose_code, data_categories)]."""
+        key, cid = self._key(user_id, app_id), _uuid_bytes(consent_id)
+        if key is None or cid is None or cid in self._removed:
+            return
+        if cid not in self._owners and len(self._owners) >= self.max_consents:
+            self.complete = False
+            return
+        grant = Grant(cid, _epoch(expiry), self._scope(purposes))
+        others = tuple(g for g in self._entries.get(key, ()) if g.consent_id != cid)
+        self._entries[key] = others + (grant,)
+        self._owners[cid] = key
+
+    def remove(self, consent_id) -> None:
+        cid = _uuid_bytes(consent_id)
+        if cid is None:
+            return
+        if len(self._removed) >= self.max_consents:
+            self._removed.clear()
+        self._removed.add(cid)
+        key = self._owners.pop(cid, None)
+        if key is None:
+            return
+        rest = tuple(g for g in self._entries.get(key, ()) if g.consent_id != cid)
+        if rest:
+            self._entries[key] = rest
+        else:
+            self._entries.pop(key, None)
+
+    # --- decisions ---
+
+    def lookup(self, user_id, app_id, purpose_code: str, data_categories: Iterable[str] = ()) -> Optional[dict]:
+        """
+        The decision from memory, or None if the index cannot be trusted to answer
+        (still warming, or a denial after the index hit its size limit).
+        """
+        key = self._key(user_id, app_id)
+        grants = self._entries.get(key, ()) if key is not None else ()
+        result = decide(grants, time.time(), purpose_code, data_categories)
+        if key is not None and not (self.ready and (result["allowed"] or self.complete)):
+            return None
+        self.hits += 1
+        return result
+
+    async def check_many(self, checks: List[dict]) -> List[dict]:
+        """
+        Decisions for [{user_id, app_id, purpose_code, data_categories}], in input order.
+        Checks the index cannot answer are resolved from the database in one batched
+        lookup for all their distinct (user, app) pairs.
+        """
+        results: List[Optional[dict]] = []
+        pending: Dict[bytes, List[int]] = {}
+        for i, c in enumerate(checks):
+            result = self.lookup(c["user_id"], c["app_id"], c["purpose_code"], c.get("data_categories") or ())
+            results.append(result)
+            if result is None:
+                pending.setdefault(self._key(c["user_id"], c["app_id"]), []).append(i)
+        if pending:
+            self.fallbacks += sum(len(v) for v in pending.values())
+            pairs = [(checks[v[0]]["user_id"], checks[v[0]]["app_id"]) for v in pending.values()]
+            loaded = await run_db(self._load_grants, pairs)
+            now = time.time()
+            for grants, indexes in zip(loaded, pending.values()):
+                for i in indexes:
+                    c = checks[i]
+                    results[i] = decide(grants, now, c["purpose_code"], c.get("data_categories") or ())
+        return results
+
+    async def check(self, user_id, app_id, purpose_code: str, data_categories: Iterable[str] = ()) -> dict:
+        result = self.lookup(user_id, app_id, purpose_code, data_categories)
+        if result is not None:
+            return result
+        return (await self.check_many([{
+            "user_id": user_id, "app_id": app_id, "purpose_code": purpose_code, "data_categories": data_categories,
+        }]))[0]
+
+    def _load_grants(self, pairs: List[tuple]) -> List[List[Grant]]:
+        # Runs on a DB thread, so it builds its own scopes instead of touching the index.
+        # Pairs that are not UUIDs cannot have consents (and would fail the uuid columns)
+        keys = [self._key(user_id, app_id) for user_id, app_id in pairs]
+        valid = [(str(u), str(a)) for (u, a), key in zip(pairs, keys) if key is not None]
+        rows = get_storage().active_grants_for(datetime.utcnow().isoformat(), valid) if valid else []
+        grants: Dict[bytes, List[Grant]] = {}
+        for r in rows:
+            grants.setdefault(self._key(r["user_id"], r["app_id"]), []).append(
+                Grant(_uuid_bytes(r["consent_id"]), _epoch(r["expiry_time"]),
+                      _make_scope([(p["purpose_code"], p["data_categories"]) for p in r["purposes"]]))
+            )
+        return [grants.get(key, []) if key is not None else [] for key in keys]
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "complete": self.complete,
+            "consents": len(self._owners),
+            "keys": len(self._entries),
+            "scopes": len(self._scopes),
+            "max_consents": self.max_consents,
+            "hits": self.hits,
+            "fallbacks": self.fallbacks,
+            "events_applied": self.events_applied,
+        }
+
+decision_index = DecisionIndex()
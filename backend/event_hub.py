@@ -0,0 +1,183 @@
+import os
+import asyncio
+from collections import deque
+from typing import Iterable, List, Optional, Set
+
+from database import run_db
+from storage import get_storage
+from utils import parse_timestamp
+
+# Fan-out of newly appended audit events to /audit/events/stream subscribers.
+# Events written by this process are published by the audit appender as soon as they
+# are stored; one poller per process picks up events from other writers (and only
+# runs while someone is subscribed), so the database sees one query per
+# EVENT_HUB_POLL_SECONDS no matter how many dashboards are connected.
+EVENT_HUB_POLL_SECONDS = float(os.environ.get("EVENT_HUB_POLL_SECONDS", "1"))
+# Recent events kept in memory, so reconnecting clients resume without a DB query
+EVENT_HUB_BUFFER = int(os.environ.get("EVENT_HUB_BUFFER", "1000"))
+# Events queued per subscriber before it is cut off and told to resume from its cursor
+EVENT_HUB_QUEUE_SIZE = int(os.environ.get("EVENT_HUB_QUEUE_SIZE", "1000"))
+EVENT_HUB_PAGE_SIZE = int(os.environ.get("EVENT_HUB_PAGE_SIZE", "500"))
+# Comment line sent on idle streams so proxies keep the connection open
+EVENT_STREAM_HEARTBEAT_SECONDS = float(os.environ.get("EVENT_STREAM_HEARTBEAT_SECONDS", "15"))
+
+def event_key(event: dict) -> tuple:
+    """Chain-order sort key; compares timestamps as datetimes, whatever their text format."""
+    return parse_timestamp(event["timestamp"]), str(event["event_id"])
+
+class Subscription:
+    """One connected client: a bounded queue plus its filters."""
+
+    def __init__(self, actor_id: Optional[str] = None, event_types: Optional[Iterable[str]] = None,
+                 maxsize: int = EVENT_HUB_QUEUE_SIZE):
+        self.actor_id = str(actor_id) if actor_id else None
+        self.event_types: Optional[Set[str]] = set(event_types) if event_types else None
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, maxsize))
+        self.lagged = False
+
+    def matches(self, event: dict) -> bool:
+        if self.actor_id and str(event.get("actor_id")) != self.actor_id:
+            return False
+        return not self.event_types or event.get("event_type") in self.event_types
+
+    def offer(self, event: dict) -> None:
+        if self.lagged:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too slow to keep up: stop queueing; the stream tells the client to resume
+            self.lagged = True
+
+class EventHub:
+    """
+    Single source, many subscribers. Every event is delivered in chain order, at most
+    once per hub, to each subscriber whose filters match. Lookups for resuming clients
+    are served from the recent-events buffer when it still covers their cursor.
+    """
+
+    def __init__(self, buffer_size: int = EVENT_HUB_BUFFER, poll_seconds: float = EVENT_HUB_POLL_SECONDS,
+                 page_size: int = EVENT_HUB_PAGE_SIZE):
+        self.poll_seconds = max(0.05, poll_seconds)
+        self.page_size = max(1, page_size)
+        self._subscribers: Set[Subscription] = set()
+        self._recent: deque = deque(maxlen=max(1, buffer_size))
+        self._last = None  # key of the newest event published
+        self._cursor = None  # (timestamp, event_id) as stored, for polling
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.published = 0
+        self.polls = 0
+
+    # --- lifecycle ---
+
+    def start(self) -> None:
+        if self._task and not self._task.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if not self._task:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            if not self._subscribers:
+                # Nobody listening: no polling at all until the next subscribe()
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            try:
+                await self.poll()
+            except Exception as e:
+                print(f"Event hub poll failed: {e}")
+            await asyncio.sleep(self.poll_seconds)
+
+    async def poll(self) -> int:
+        """Publishes events stored by other processes since the newest one seen."""
+        # Shard writers in this process may commit out of timestamp order. Read only
+        # while all of their batches are published and none is linked meanwhile, so a
+        # page never runs ahead of a local event still being written (which is
+        # published here in order anyway).
+        from audit_log import audit_appender
+        mark = audit_appender.publish_mark()
+        if mark is None:
+            return 0
+        store = get_storage()
+        if self._cursor is None:
+            # Start from the current head; history is served by resume / backfill
+            head = await run_db(store.latest_audit_event)
+            if head and audit_appender.publish_mark() == mark:
+                self.publish([head], fan_out=False)
+            self.polls += 1
+            return 0
+        found = 0
+        while True:
+            events = await run_db(store.audit_events_after, self._cursor, self.page_size)
+            if audit_appender.publish_mark() != mark:
+                break
+            found += self.publish(events)
+            if len(events) < self.page_size:
+                break
+        self.polls += 1
+        return found
+
+    # --- producer side ---
+
+    def publish(self, events: List[dict], fan_out: bool = True) -> int:
+        """Adds stored events (in chain order); ones already published are skipped."""
+        count = 0
+        for event in events:
+            key = event_key(event)
+            if self._last is not None and key <= self._last:
+                continue
+            self._last = key
+            self._cursor = (event["timestamp"], event["event_id"])
+            self._recent.append((key, event))
+            count += 1
+            if fan_out:
+                for sub in self._subscribers:
+                    if sub.matches(event):
+                        sub.offer(event)
+        self.published += count
+        return count
+
+    # --- consumer side ---
+
+    def subscribe(self, actor_id: Optional[str] = None, event_types: Optional[Iterable[str]] = None) -> Subscription:
+        sub = Subscription(actor_id, event_types)
+        self._subscribers.add(sub)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        self._subscribers.discard(sub)
+
+    def replay(self, after: tuple) -> Optional[List[dict]]:
+        """
+        Buffered events after the key `after`, or None if the buffer no longer reaches
+        back that far (the caller then reads the gap from the database).
+        """
+        if not self._recent or self._recent[0][0] > after:
+            if self._last is not None and after >= self._last:
+                return []
+            return None
+        return [event for key, event in self._recent if key > after]
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "lagged": sum(1 for s in self._subscribers if s.lagged),
+            "buffered": len(self._recent),
+            "published": self.published,
+            "polls": self.polls,
+        }
+
+event_hub = EventHub()
@@ -0,0 +1,205 @@
+import os
+import time
+import asyncio
+import hashlib
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi import HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+
+from cache import TTLCache
+from canonical import canonical_json
+from database import run_db
+from storage import get_storage
+
+# Idempotency-Key support for /consent/grant and /consent/revoke.
+# The first successful response per key is kept for IDEMPOTENCY_TTL_SECONDS; retries with
+# the same key get it back without touching the database or the signer.
+# IDEMPOTENCY_BACKEND=local (default): per-process bounded map. A retry that lands on
+#   another worker (or after a restart) runs again.
+# IDEMPOTENCY_BACKEND=table: the `idempotency_keys` table as well, shared by all workers;
+#   the first request claims its key there, so duplicates on other workers wait for it.
+IDEMPOTENCY_BACKEND = os.environ.get("IDEMPOTENCY_BACKEND", "local").lower()
+IDEMPOTENCY_TTL_SECONDS = float(os.environ.get("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get("IDEMPOTENCY_CACHE_SIZE", "100000"))
+# How long a claim blocks the key if its process dies before answering
+IDEMPOTENCY_LOCK_SECONDS = float(os.environ.get("IDEMPOTENCY_LOCK_SECONDS", "60"))
+# How long a duplicate waits for the first request running in another process
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get("IDEMPOTENCY_WAIT_SECONDS", "10"))
+IDEMPOTENCY_PURGE_SECONDS = float(os.environ.get("IDEMPOTENCY_PURGE_SECONDS", "300"))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+REPLAY_HEADER = "Idempotent-Replayed"
+
+def _retrieve(task: asyncio.Task) -> None:
+    # Waiters re-raise a failure; mark it retrieved so it is not also logged when nobody waited
+    if not task.cancelled():
+        task.exception()
+
+def _digest(*parts: str) -> str:
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+class IdempotencyStore:
+    """
+    Runs a request handler at most once per (scope, Idempotency-Key).
+
+    - A completed response is replayed from memory (then from the table backend).
+    - Concurrent duplicates in this process share the first request's result
+      (single-flight). The handler runs detached from the request that started it,
+      so a disconnecting client neither fails the duplicates nor frees the key.
+      With the table backend, duplicates on other workers poll the claimed row
+      until it completes.
+    - Only successful responses are stored. If the first request fails, the key is
+      released and a retry runs again.
+    - A key reused with a different request body is rejected with 422.
+    """
+
+    def __init__(self, backend: str = IDEMPOTENCY_BACKEND, maxsize: int = IDEMPOTENCY_CACHE_SIZE,
+                 ttl: float = IDEMPOTENCY_TTL_SECONDS):
+        self.table = backend == "table"
+        self.ttl = ttl
+        self.responses = TTLCache(maxsize=maxsize, ttl=ttl)  # record key -> {fingerprint, response}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._purge_task: Optional[asyncio.Task] = None
+        self._last_purge = 0.0
+        self.executed = 0
+        self.replayed = 0
+        self.waited = 0
+        self.conflicts = 0
+
+    async def run(self, key: Optional[str], scope: str, body: Any, response: Response,
+                  handler: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Returns handler()'s result, or the stored result of an earlier request with the
+        same key. Replays carry the Idempotent-Replayed: true header.
+        """
+        if not key:
+            return await handler()
+        if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            raise HTTPException(status_code=400, detail=f"Idempotency-Key is longer than {IDEMPOTENCY_KEY_MAX_LENGTH} characters")
+
+        record_key = _digest(scope, key)
+        fingerprint = hashlib.sha256(canonical_json(jsonable_encoder(body))).hexdigest()
+
+        # 1. Answered before (by this process)
+        record = self.responses.get(record_key)
+        if record is not None:
+            return self._replay(record, fingerprint, response)
+
+        # 2. Same key in flight in this process: wait for it instead of running again
+        pending = self._inflight.get(record_key)
+        first = pending is None
+        if first:
+            # The handler runs as its own task: cancelling the request that started it
+            # (client disconnect, timeout) must not cancel it for the others waiting, or
+            # release the claimed key so that a retry runs it a second time
+            pending = asyncio.get_running_loop().create_task(
+                self._execute_once(record_key, fingerprint, handler))
+            pending.add_done_callback(_retrieve)
+            self._inflight[record_key] = pending
+        else:
+            self.waited += 1
+        record, result = await asyncio.shield(pending)
+
+        if not first or result is None:
+            # A duplicate, or answered by another process
+            return self._replay(record, fingerprint, response)
+        return result
+
+    async def _execute_once(self, record_key: str, fingerprint: str, handler) -> tuple:
+        try:
+            return await self._execute(record_key, fingerprint, handler)
+        finally:
+            del self._inflight[record_key]
+
+    async def _execute(self, record_key: str, fingerprint: str, handler) -> tuple:
+        """(record, handler result); the result is None when the record came from another process."""
+        store = get_storage()
+        if self.table:
+            claim = {
+                "idempotency_key": record_key,
+                "fingerprint": fingerprint,
+                "expires_at": (datetime.utcnow() + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)).isoformat(),
+            }
+            if not await run_db(store.claim_idempotency_key, claim):
+                record = await self._wait_for(record_key)
+                self.responses.set(record_key, record)
+                return record, None
+            self._maybe_purge()
+
+        try:
+            result = await handler()
+        except BaseException:
+            if self.table:
+                try:
+                    await run_db(store.release_idempotency_key, record_key)
+                except Exception as e:
+                    print(f"Idempotency key release failed: {e}")
+            raise
+        self.executed += 1
+
+        record = {"fingerprint": fingerprint, "response": jsonable_encoder(result)}
+        self.responses.set(record_key, record)
+        if self.table:
+            expires_at = (datetime.utcnow() + timedelta(seconds=self.ttl)).isoformat()
+            try:
+                await run_db(store.complete_idempotency_key, record_key, record["response"], expires_at)
+            except Exception as e:
+                # The response stands; only retries on other workers would run again
+                print(f"Idempotency record write failed: {e}")
+        return record, result
+
+    async def _wait_for(self, record_key: str) -> dict:
+        """Polls a key claimed by another process until its response is stored."""
+        self.waited += 1
+        store = get_storage()
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+        delay = 0.05
+        while True:
+            row = await run_db(store.idempotency_record, record_key)
+            if row and row["state"] == "complete":
+                return {"fingerprint": row["fingerprint"], "response": row["response"]}
+            if row is None:
+                # The first request failed and released the key
+                raise HTTPException(status_code=409, detail="The original request with this Idempotency-Key failed; retry it")
+            if time.monotonic() >= deadline:
+                raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+    def _replay(self, record: dict, fingerprint: str, response: Response) -> Any:
+        if record["fingerprint"] != fingerprint:
+            self.conflicts += 1
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request body")
+        self.replayed += 1
+        response.headers[REPLAY_HEADER] = "true"
+        return record["response"]
+
+    def _maybe_purge(self) -> None:
+        now = time.monotonic()
+        if now - self._last_purge < IDEMPOTENCY_PURGE_SECONDS:
+            return
+        if self._purge_task and not self._purge_task.done():
+            return
+        self._last_purge = now
+        self._purge_task = asyncio.get_running_loop().create_task(self._purge())
+
+    async def _purge(self) -> None:
+        try:
+            await run_db(get_storage().purge_idempotency_keys, datetime.utcnow().isoformat())
+        except Exception as e:
+            print(f"Idempotency key purge failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "backend": "table" if self.table else "local",
+            "executed": self.executed,
+            "replayed": self.replayed,
+            "waited": self.waited,
+            "conflicts": self.conflicts,
+            "in_flight": len(self._inflight),
+            "responses": self.responses.stats(),
+        }
+
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,203 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import urllib.request
+from typing import Optional
+
+import jwt
+from dotenv import load_dotenv
+
+from cache import TTLCache
+
+load_dotenv()
+
+# --- CONFIGURATION ---
+# AUTH_MODE=local  -> verify signature and claims in-process (default)
+# AUTH_MODE=remote -> ask the Supabase auth server for every (uncached) token
+AUTH_MODE = os.environ.get("AUTH_MODE", "local").lower()
+JWT_SECRET = os.environ.get("JWT_SECRET")
+JWT_AUDIENCE = os.environ.get("JWT_AUDIENCE", "authenticated")
+JWT_ISSUER = os.environ.get("JWT_ISSUER")  # Optional, e.g. https://<project>.supabase.co/auth/v1
+JWT_LEEWAY_SECONDS = int(os.environ.get("JWT_LEEWAY_SECONDS", "30"))
+JWKS_URL = os.environ.get("SUPABASE_JWKS_URL") or (
+    os.environ.get("SUPABASE_URL", "").rstrip("/") + "/auth/v1/.well-known/jwks.json"
+    if os.environ.get("SUPABASE_URL") else None
+)
+JWKS_REFRESH_SECONDS = int(os.environ.get("JWKS_REFRESH_SECONDS", "600"))
+AUTH_CACHE_SIZE = int(os.environ.get("AUTH_CACHE_SIZE", "10000"))
+AUTH_CACHE_TTL = float(os.environ.get("AUTH_CACHE_TTL", "60"))
+# When local verification has no key to check against, ask the auth server instead of failing
+AUTH_REMOTE_FALLBACK = os.environ.get("AUTH_REMOTE_FALLBACK", "true").lower() == "true"
+
+SYMMETRIC_ALGORITHMS = ["HS256", "HS384", "HS512"]
+ASYMMETRIC_ALGORITHMS = ["RS256", "RS384", "RS512", "ES256", "ES384", "EdDSA"]
+
+class AuthError(Exception):
+    """Raised when a token cannot be verified. The message is safe to return to clients."""
+
+class KeyUnavailable(AuthError):
+    """Raised when no signing key is configured for the token's algorithm / kid."""
+
+class SigningKeyCache:
+    """
+    Holds the keys used to verify access tokens.
+    - HS* tokens are checked against JWT_SECRET.
+    - RS*/ES*/EdDSA tokens are checked against the project's JWKS, which is
+      fetched once and then refreshed by a daemon thread every JWKS_REFRESH_SECONDS.
+      key_for never touches the network: on an unknown `kid` the caller runs
+      refresh_if_stale (rate-limited) on a worker thread to pick up rotations, then retries.
+    """
+
+    MIN_REFRESH_INTERVAL = 30.0
+
+    def __init__(self, secret: Optional[str] = None, jwks_url: Optional[str] = None,
+                 refresh_seconds: int = JWKS_REFRESH_SECONDS):
+        self.secret = secret
+        self.jwks_url = jwks_url
+        self.refresh_seconds = refresh_seconds
+        self._keys = {}
+        self._lock = threading.Lock()
+        self._last_fetch = 0.0
+        self._refresher = None
+        self._stop = threading.Event()
+
+    def set_keys(self, jwks: dict) -> None:
+        """Installs a JWKS document (also used by tests to inject locally minted keys)."""
+        keys = {}
+        for jwk in jwks.get("keys", []):
+            try:
+                keys[jwk.get("kid")] = jwt.PyJWK(jwk).key
+            except Exception as e:
+                print(f"Skipping unusable JWK {jwk.get('kid')}: {e}")
+        with self._lock:
+            self._keys = keys
+            self._last_fetch = time.monotonic()
+
+    def refresh(self) -> bool:
+        if not self.jwks_url:
+            return False
+        try:
+            with urllib.request.urlopen(self.jwks_url, timeout=5) as resp:
+                self.set_keys(json.loads(resp.read().decode("utf-8")))
+            return True
+        except Exception as e:
+            print(f"JWKS refresh failed: {e}")
+            with self._lock:
+                self._last_fetch = time.monotonic()
+            return False
+
+    def refresh_if_stale(self) -> bool:
+        """
+        Refetches the JWKS unless that happened in the last MIN_REFRESH_INTERVAL seconds.
+        Blocks on the network: call it from a worker thread, never the event loop.
+        Returns True if new keys were fetched.
+        """
+        if not self.jwks_url:
+            return False
+        with self._lock:
+            if time.monotonic() - self._last_fetch <= self.MIN_REFRESH_INTERVAL:
+                return False
+            # Concurrent misses share this fetch instead of each starting one
+            self._last_fetch = time.monotonic()
+        return self.refresh()
+
+    def start(self) -> None:
+        """Starts the background refresher (idempotent)."""
+        if not self.jwks_url or (self._refresher and self._refresher.is_alive()):
+            return
+        self._stop.clear()
+        self._refresher = threading.Thread(target=self._run, name="jwks-refresher", daemon=True)
+        self._refresher.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        if self._keys:
+            # Already fetched before the server started serving
+            self._stop.wait(self.refresh_seconds)
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.refresh_seconds)
+
+    def key_for(self, header: dict):
+        alg = header.get("alg")
+        if alg in SYMMETRIC_ALGORITHMS:
+            if not self.secret:
+                raise KeyUnavailable("JWT_SECRET is not configured")
+            return self.secret
+
+        if alg not in ASYMMETRIC_ALGORITHMS:
+            raise AuthError(f"Unsupported token algorithm: {alg}")
+
+        kid = header.get("kid")
+        key = self._keys.get(kid)
+        if key is None:
+            raise KeyUnavailable(f"No signing key found for kid '{kid}'")
+        return key
+
+signing_keys = SigningKeyCache(secret=JWT_SECRET, jwks_url=JWKS_URL)
+token_cache = TTLCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
+
+def _cache_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def decode_token(token: str, keys: SigningKeyCache = None) -> dict:
+    """
+    Verifies the token signature, expiry, audience (and issuer when configured)
+    locally and returns its claims.
+    """
+    keys = keys or signing_keys
+    try:
+        header = jwt.get_unverified_header(token)
+    except jwt.PyJWTError as e:
+        raise AuthError(f"Malformed token: {e}")
+
+    key = keys.key_for(header)
+    try:
+        return jwt.decode(
+            token,
+            key,
+            algorithms=[header["alg"]],
+            audience=JWT_AUDIENCE,
+            issuer=JWT_ISSUER,
+            leeway=JWT_LEEWAY_SECONDS,
+            options={"require": ["exp", "sub"]},
+        )
+    except jwt.PyJWTError as e:
+        raise AuthError(str(e))
+
+def cached_user(token: str):
+    return token_cache.get(_cache_key(token))
+
+def cache_user(token: str, user, expires_at: Optional[float] = None) -> None:
+    ttl = AUTH_CACHE_TTL
+    if expires_at is not None:
+        # Never serve a cached user past the token's own expiry
+        ttl = min(ttl, expires_at - time.time())
+    token_cache.set(_cache_key(token), user, ttl=ttl)
+
+def mint_token(user_id: str, email: Optional[str] = None, expires_in: int = 3600,
+               secret: Optional[str] = None, **claims) -> str:
+    """
+    Mints an HS256 access token shaped like a Supabase one.
+    Intended for local testing and load generation against AUTH_MODE=local.
+    """
+    secret = secret or JWT_SECRET
+    if not secret:
+        raise ValueError("JWT_SECRET is required to mint tokens")
+    now = int(time.time())
+    payload = {
+        "sub": user_id,
+        "email": email,
+        "aud": JWT_AUDIENCE,
+        "role": "authenticated",
+        "iat": now,
+        "exp": now + expires_in,
+    }
+    if JWT_ISSUER:
+        payload["iss"] = JWT_ISSUER
+    payload.update(claims)
+    return jwt.encode(payload, secret, algorithm="HS256")
@@ -0,0 +1,181 @@
+-- LEDGER FUNCTIONS
+-- Run after schema.sql (Supabase SQL Editor, or psql against any Postgres that has the tables).
+-- Called by the audit appender (audit_log.py) through PostgREST RPC.
+
+-- Writes one batch of already-linked audit events in a single transaction.
+-- Each element of p_events is an audit_events row (event_type, actor_id, actor_type,
+-- event_payload, timestamp, hash_prev, hash_current, hash_version, shard). A CONSENT_GRANTED event may carry
+-- a "grant" object with the rows it certifies:
+--   {"consent":  {consent_id, user_id, app_id, expiry_time, status},
+--    "purposes": [{purpose_code, data_categories}],
+--    "receipt":  {receipt_id, signed_payload, signature}}
+-- A CONSENT_EXPIRED event carries "expire": {"consent_id"}; that consent moves from
+-- active to expired, and the whole batch is rejected if it is no longer active.
+-- Consent rows and audit events are committed together or not at all.
+-- Every API worker runs its own appender, so the function serializes writers per shard
+-- (transaction-scoped advisory lock) and checks that each event links to the shard's
+-- current head. If another writer moved the head, it raises serialization_failure
+-- (SQLSTATE 40001) and nothing is stored; the appender re-reads the head and relinks.
+-- The batch's Merkle leaves are appended in the same transaction (append_merkle_leaves).
+-- Returns the inserted audit_events rows in input order.
+create or replace function append_ledger_batch(p_events jsonb)
+returns setof audit_events
+language plpgsql
+as $$
+declare
+    ev jsonb;
+    g jsonb;
+    stored audit_events;
+    ev_shard smallint;
+    heads jsonb := '{}'::jsonb;
+    head text;
+    event_ids uuid[] := '{}';
+begin
+    for ev in
+        select e.value from jsonb_array_elements(p_events) with ordinality as e(value, n) order by e.n
+    loop
+        ev_shard := coalesce((ev ->> 'shard')::smallint, 0);
+        if heads ? ev_shard::text then
+            head := heads ->> ev_shard::text;
+        else
+            perform pg_advisory_xact_lock(hashtext('audit_events'), ev_shard);
+            select a.hash_current into head from audit_events a
+            where a.shard = ev_shard
+            order by a.timestamp desc, a.event_id desc
+            limit 1;
+            head := coalesce(head, repeat('0', 64));
+        end if;
+        if (ev ->> 'hash_prev') is distinct from head then
+            raise exception using
+                errcode = 'serialization_failure',
+                message = format('audit chain head of shard %s moved: expected hash_prev %s', ev_shard, head);
+        end if;
+        heads := heads || jsonb_build_object(ev_shard::text, ev ->> 'hash_current');
+
+        g := ev -> 'grant';
+        if g is not null and jsonb_typeof(g) = 'object' then
+            insert into consents (consent_id, user_id, app_id, expiry_time, status)
+            values (
+                (g -> 'consent' ->> 'consent_id')::uuid,
+                (g -> 'consent' ->> 'user_id')::uuid,
+                (g -> 'consent' ->> 'app_id')::uuid,
+                (g -> 'consent' ->> 'expiry_time')::timestamptz,
+                coalesce(g -> 'consent' ->> 'status', 'active')
+            );
+
+            insert into consent_purposes (consent_id, purpose_code, data_categories)
+            select
+                (g -> 'consent' ->> 'consent_id')::uuid,
+                p ->> 'purpose_code',
+                array(select jsonb_array_elements_text(p -> 'data_categories'))
+            from jsonb_array_elements(coalesce(g -> 'purposes', '[]'::jsonb)) as p;
+
+            insert into consent_receipts (receipt_id, consent_id, signed_payload, signature)
+            values (
+                coalesce((g -> 'receipt' ->> 'receipt_id')::uuid, uuid_generate_v4()),
+                (g -> 'consent' ->> 'consent_id')::uuid,
+                g -> 'receipt' -> 'signed_payload',
+                g -> 'receipt' ->> 'signature'
+            );
+        end if;
+
+        if ev -> 'expire' is not null then
+            update consents set status = 'expired'
+            where consent_id = (ev -> 'expire' ->> 'consent_id')::uuid and status = 'active';
+            if not found then
+                raise exception 'consent % is not active', ev -> 'expire' ->> 'consent_id';
+            end if;
+        end if;
+
+        insert into audit_events (event_type, actor_id, actor_type, event_payload, timestamp, hash_prev, hash_current, hash_version, shard)
+        values (
+            ev ->> 'event_type',
+            nullif(ev ->> 'actor_id', '')::uuid,
+            ev ->> 'actor_type',
+            ev -> 'event_payload',
+            coalesce((ev ->> 'timestamp')::timestamptz, now()),
+            ev ->> 'hash_prev',
+            ev ->> 'hash_current',
+            coalesce((ev ->> 'hash_version')::smallint, 1),
+            coalesce((ev ->> 'shard')::smallint, 0)
+        )
+        returning * into stored;
+
+        event_ids := event_ids || stored.event_id;
+        return next stored;
+    end loop;
+    -- After every shard lock, so all writers take the locks in the same order
+    perform append_merkle_leaves(event_ids);
+end;
+$$;
+
+-- Appends Merkle leaves for stored audit events, in the given order, skipping events
+-- that already have one. The tree lock serializes every writer (and backfill), so leaf
+-- indexes are assigned here from the stored tree size and each new leaf's interior nodes
+-- are built from nodes already committed, never from a worker's in-memory copy.
+-- Leaf = SHA256(0x00 || "<event_id>:<hash_current>"), node = SHA256(0x01 || left || right),
+-- as in merkle.py. Returns the number of leaves added.
+create or replace function append_merkle_leaves(p_event_ids uuid[])
+returns int
+language plpgsql
+as $$
+declare
+    ev record;
+    size bigint;
+    h bytea;
+    lvl int;
+    idx bigint;
+    added int := 0;
+begin
+    perform pg_advisory_xact_lock(hashtext('merkle_leaves'));
+    select coalesce(max(leaf_index) + 1, 0) into size from merkle_leaves;
+    for ev in
+        select a.event_id, a.hash_current, a.event_payload
+        from unnest(p_event_ids) with ordinality as e(event_id, n)
+        join audit_events a on a.event_id = e.event_id
+        where not exists (select 1 from merkle_leaves l where l.event_id = a.event_id)
+        order by e.n
+    loop
+        h := sha256('\x00'::bytea || convert_to(ev.event_id::text || ':' || ev.hash_current, 'UTF8'));
+        insert into merkle_leaves (leaf_index, event_id, consent_id, leaf_hash)
+        values (
+            size,
+            ev.event_id,
+            case when ev.event_payload ->> 'consent_id' ~* '^[0-9a-f]{8}-([0-9a-f]{4}-){3}[0-9a-f]{12}$'
+                 then (ev.event_payload ->> 'consent_id')::uuid end,
+            encode(h, 'hex')
+        );
+        lvl := 0;
+        idx := size;
+        loop
+            insert into merkle_nodes (level, node_index, hash) values (lvl, idx, encode(h, 'hex'))
+            on conflict (level, node_index) do update set hash = excluded.hash;
+            exit when idx % 2 = 0;
+            select sha256('\x01'::bytea || decode(n.hash, 'hex') || h) into h
+            from merkle_nodes n where n.level = lvl and n.node_index = idx - 1;
+            lvl := lvl + 1;
+            idx := idx / 2;
+        end loop;
+        size := size + 1;
+        added := added + 1;
+    end loop;
+    return added;
+end;
+$$;
+
+-- Appends leaves for up to p_limit audit events that have none yet, in chain order:
+-- events written before the Merkle index existed, or by the non-atomic
+-- AUDIT_WRITE_RPC=false path when its leaf write failed. Returns the number added.
+create or replace function backfill_merkle_leaves(p_limit int)
+returns int
+language plpgsql
+as $$
+begin
+    return append_merkle_leaves(array(
+        select a.event_id from audit_events a
+        where not exists (select 1 from merkle_leaves l where l.event_id = a.event_id)
+        order by a.timestamp, a.event_id
+        limit p_limit
+    ));
+end;
+$$;
@@ -1,8 +1,75 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
+import metrics
 # from routers import auth, consent, audit
 
-app = FastAPI(title="SAKSHAM Consent Manager", version="1.0.0")
+
+@asynccontextmanager
+async def lifespan(app):
+    """
+    Start the background components in dependency order and stop them in
+    reverse once the server drains, closing the database last.
+    """
+    import database
+    from audit_log import audit_appender, merkle_signer
+    from decision_index import DECISION_INDEX_ENABLED, decision_index
+    from event_hub import event_hub
+    from jwt_auth import AUTH_MODE, signing_keys
+    from shards import sharded, shard_anchorer, writer_lease
+    from signing_keys import keyring
+    from status_cache import status_cache
+    from storage import get_storage
+    from sweeper import SWEEPER_ENABLED, expiry_sweeper
+    from workers import shutdown_pool, start_pool
+
+    # Keep the JWKS warm so token verification never waits on the network
+    if AUTH_MODE == "local":
+        if signing_keys.jwks_url:
+            # Fetch the JWKS once before serving, off the event loop
+            await database.run_db(signing_keys.refresh)
+        signing_keys.start()
+    # Load (or create once) the persistent keyring before any worker processes start
+    keyring.load()
+    if sharded():
+        # Fails startup if another process writes the sharded ledger
+        await writer_lease.acquire()
+    audit_appender.start()
+    # Backfill Merkle leaves for events written before the index existed, on the
+    # root signer's own task so grants never wait for it
+    merkle_signer.backfill()
+    # Spawn the CPU workers now rather than on the first batch request
+    await start_pool()
+    # Warms in the background; /consent/check falls back to the database until it is ready
+    if DECISION_INDEX_ENABLED:
+        decision_index.start()
+    # Idle until the first /audit/events/stream subscriber connects
+    event_hub.start()
+    if sharded():
+        shard_anchorer.start()
+    if SWEEPER_ENABLED:
+        expiry_sweeper.start()
+    try:
+        yield
+    finally:
+        # The sweeper stops before the appender, so a sweep in progress can
+        # still write its events
+        await expiry_sweeper.stop()
+        await shard_anchorer.stop()
+        await event_hub.stop()
+        await decision_index.stop()
+        shutdown_pool()
+        # Flush queued audit events before the process exits
+        await audit_appender.stop()
+        await writer_lease.release()
+        signing_keys.stop()
+        await status_cache.close()
+        get_storage().close()
+        database.close_db()
+
+app = FastAPI(title="SAKSHAM Consent Manager", version="1.0.0", lifespan=lifespan)
 
 # CORS - Must be added before routes
 app.add_middleware(
@@ -14,12 +81,22 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+# Per-route latency histograms (outermost, so CORS handling is included)
+if metrics.METRICS_ENABLED:
+    app.add_middleware(metrics.RequestMetricsMiddleware)
+
 @app.get("/")
 async def root():
     return {"message": "SAKSHAM Consent Manager API is running"}
 
-from routers import consent, audit #, auth
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    # Prometheus text exposition format
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+from routers import consent, audit, admin #, auth
 
 app.include_router(consent.router)
 app.include_router(audit.router)
+app.include_router(admin.router)
 # app.include_router(auth.router)
@@ -0,0 +1,228 @@
+import os
+import hashlib
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from storage import get_storage
+from utils import sign_payload, signing_key_id
+
+# RFC 6962 / RFC 9162 style Merkle tree over audit_events (in commit order, which is
+# chain order on a single chain). Leaves commit to (event_id, hash_current); interior
+# nodes are stored per level in merkle_nodes, so any perfect subtree hash is one lookup
+# away. Leaves and nodes are written by the storage backend in the ledger transaction
+# itself (Storage.append_ledger), so every worker extends one tree.
+
+MERKLE_ROOT_INTERVAL = int(os.environ.get("MERKLE_ROOT_INTERVAL", "100"))
+EMPTY_ROOT = hashlib.sha256(b"").hexdigest()
+
+Node = Tuple[int, int]  # (level, node_index)
+
+# --- PURE TREE FUNCTIONS ---
+
+def leaf_hash(event_id, hash_current: str) -> str:
+    return hashlib.sha256(b"\x00" + f"{event_id}:{hash_current}".encode("utf-8")).hexdigest()
+
+def node_hash(left: str, right: str) -> str:
+    return hashlib.sha256(b"\x01" + bytes.fromhex(left) + bytes.fromhex(right)).hexdigest()
+
+def _split(n: int) -> int:
+    """Largest power of two strictly smaller than n (n > 1)."""
+    return 1 << ((n - 1).bit_length() - 1)
+
+def perfect_subtrees(lo: int, hi: int) -> List[Node]:
+    """
+    Decomposes leaves [lo, hi) into stored perfect subtrees, largest first.
+    Every range that appears in an RFC 6962 proof is aligned this way.
+    """
+    nodes = []
+    while lo < hi:
+        size = 1 << ((hi - lo).bit_length() - 1)
+        level = size.bit_length() - 1
+        assert lo % size == 0, "range is not aligned to stored subtrees"
+        nodes.append((level, lo >> level))
+        lo += size
+    return nodes
+
+def range_hash(lo: int, hi: int, nodes: Dict[Node, str]) -> str:
+    """MTH(D[lo:hi]) folded from its perfect subtrees."""
+    if lo == hi:
+        return EMPTY_ROOT
+    hashes = [nodes[n] for n in perfect_subtrees(lo, hi)]
+    result = hashes[-1]
+    for h in reversed(hashes[:-1]):
+        result = node_hash(h, result)
+    return result
+
+def inclusion_ranges(index: int, lo: int, hi: int) -> List[Tuple[int, int]]:
+    """Leaf ranges whose hashes make up PATH(index, D[lo:hi]), in proof order."""
+    n = hi - lo
+    if n <= 1:
+        return []
+    k = _split(n)
+    if index < k:
+        return inclusion_ranges(index, lo, lo + k) + [(lo + k, hi)]
+    return inclusion_ranges(index - k, lo + k, hi) + [(lo, lo + k)]
+
+def consistency_ranges(m: int, lo: int, hi: int, complete: bool = True) -> List[Tuple[int, int]]:
+    """Leaf ranges whose hashes make up SUBPROOF(m, D[lo:hi], complete), in proof order."""
+    n = hi - lo
+    if m == n:
+        return [] if complete else [(lo, hi)]
+    k = _split(n)
+    if m <= k:
+        return consistency_ranges(m, lo, lo + k, complete) + [(lo + k, hi)]
+    return consistency_ranges(m - k, lo + k, hi, False) + [(lo, lo + k)]
+
+def nodes_for(ranges: Iterable[Tuple[int, int]]) -> set:
+    needed = set()
+    for lo, hi in ranges:
+        needed.update(perfect_subtrees(lo, hi))
+    return needed
+
+def verify_inclusion(leaf_index: int, tree_size: int, leaf: str, path: List[str], root: str) -> bool:
+    """RFC 9162 section 2.1.3.2."""
+    if leaf_index >= tree_size:
+        return False
+    fn, sn, r = leaf_index, tree_size - 1, leaf
+    for p in path:
+        if sn == 0:
+            return False
+        if fn & 1 or fn == sn:
+            r = node_hash(p, r)
+            if not fn & 1:
+                while not fn & 1 and fn != 0:
+                    fn >>= 1
+                    sn >>= 1
+        else:
+            r = node_hash(r, p)
+        fn >>= 1
+        sn >>= 1
+    return sn == 0 and r == root
+
+def verify_consistency(first: int, second: int, first_root: str, second_root: str,
+                       path: List[str]) -> bool:
+    """RFC 9162 section 2.1.4.2."""
+    if first > second:
+        return False
+    if first == second:
+        return not path and first_root == second_root
+    if first == 0:
+        return not path
+    if not path:
+        return False
+    if first & (first - 1) == 0:
+        path = [first_root] + list(path)
+    fn, sn = first - 1, second - 1
+    while fn & 1:
+        fn >>= 1
+        sn >>= 1
+    fr = sr = path[0]
+    for c in path[1:]:
+        if sn == 0:
+            return False
+        if fn & 1 or fn == sn:
+            fr = node_hash(c, fr)
+            sr = node_hash(c, sr)
+            if not fn & 1:
+                while not fn & 1 and fn != 0:
+                    fn >>= 1
+                    sn >>= 1
+        else:
+            sr = node_hash(sr, c)
+        fn >>= 1
+        sn >>= 1
+    return fr == first_root and sr == second_root and sn == 0
+
+# --- PERSISTENT ACCUMULATOR ---
+
+class MerkleLog:
+    """
+    Signed roots and proofs over the Merkle index kept alongside audit_events.
+
+    The tree lives in the database only: its size is the number of stored leaves,
+    so every worker sees the same tree. Once MERKLE_ROOT_INTERVAL leaves have been
+    added since the latest signed root, sign_root_if_due() signs the current root
+    with the Consent Manager key and stores it in merkle_roots.
+    """
+
+    def __init__(self, root_interval: int = MERKLE_ROOT_INTERVAL):
+        self.root_interval = max(1, root_interval)
+        self._lock = threading.Lock()
+
+    # --- writes ---
+
+    def sign_root_if_due(self) -> Optional[dict]:
+        """Signs the current root if the tree grew by root_interval leaves; returns the new row."""
+        store = get_storage()
+        with self._lock:
+            size = store.merkle_leaf_count()
+            signed = store.merkle_root()
+            if size - (signed["tree_size"] if signed else 0) < self.root_interval:
+                return None
+            return self._sign_root(store, size)
+
+    def _sign_root(self, store, size: int) -> dict:
+        payload = {
+            "tree_size": size,
+            "root_hash": self.root_at(size),
+            "timestamp": datetime.utcnow().isoformat(),
+            "kid": signing_key_id(),
+        }
+        row = {
+            "tree_size": size,
+            "root_hash": payload["root_hash"],
+            "signed_payload": payload,
+            "signature": sign_payload(payload),
+        }
+        # Workers signing the same size store the same root (the tree is append-only)
+        store.save_merkle_root(row)
+        return row
+
+    def backfill(self, page_size: int = 1000) -> int:
+        """
+        Backfills leaves for audit events that are not in the tree yet (events
+        written before the tree existed). Returns the number of leaves added.
+        """
+        store = get_storage()
+        added = 0
+        while True:
+            n = store.backfill_merkle(page_size)
+            added += n
+            if n < page_size:
+                return added
+
+    # --- reads / proofs ---
+
+    def current_size(self) -> int:
+        return get_storage().merkle_leaf_count()
+
+    def root_at(self, tree_size: int) -> str:
+        return range_hash(0, tree_size, get_storage().merkle_nodes(perfect_subtrees(0, tree_size)))
+
+    def signed_root(self, tree_size: Optional[int] = None) -> Optional[dict]:
+        """The signed root at tree_size, or the latest one. Signs the current root if none exist yet."""
+        store = get_storage()
+        root = store.merkle_root(tree_size)
+        if root or tree_size is not None:
+            return root
+        with self._lock:
+            size = store.merkle_leaf_count()
+            return self._sign_root(store, size) if size else None
+
+    def find_leaves(self, event_id: Optional[str] = None, consent_id: Optional[str] = None) -> List[dict]:
+        return get_storage().find_merkle_leaves(event_id=event_id, consent_id=consent_id)
+
+    def inclusion_proof(self, leaf_index: int, tree_size: int) -> List[str]:
+        ranges = inclusion_ranges(leaf_index, 0, tree_size)
+        nodes = get_storage().merkle_nodes(nodes_for(ranges))
+        return [range_hash(lo, hi, nodes) for lo, hi in ranges]
+
+    def consistency_proof(self, first: int, second: int) -> List[str]:
+        if first == 0 or first == second:
+            return []
+        ranges = consistency_ranges(first, 0, second)
+        nodes = get_storage().merkle_nodes(nodes_for(ranges))
+        return [range_hash(lo, hi, nodes) for lo, hi in ranges]
+
+merkle_log = MerkleLog()
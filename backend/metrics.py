@@ -0,0 +1,211 @@
+import os
+import time
+import bisect
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+# In-process metrics, exposed on GET /metrics in the Prometheus text exposition format.
+# METRICS_ENABLED=false turns every observation into a no-op (and drops the request
+# middleware and storage wrapper entirely).
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Seconds; tuned for sub-millisecond crypto up to multi-second ledger scans
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _num(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, *labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_num(v)}" for k, v in items]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, *labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = value
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: "Histogram", labels: Tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        return False
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple, List[float]] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    def time(self, *labels):
+        """Context manager that observes the elapsed wall time in seconds."""
+        if not METRICS_ENABLED:
+            return _NULL_TIMER
+        return _Timer(self, labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        lines = self.header()
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = 'le="' + _num(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_num(series[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.register(Histogram(
+    "saksham_http_request_duration_seconds", "HTTP request latency by route and status.",
+    ("method", "route", "status")))
+DB_SECONDS = registry.register(Histogram(
+    "saksham_db_call_duration_seconds", "Storage call latency by table and operation.",
+    ("backend", "table", "operation")))
+DB_ERRORS = registry.register(Counter(
+    "saksham_db_call_errors_total", "Storage calls that raised, by table and operation.",
+    ("backend", "table", "operation")))
+SIGN_SECONDS = registry.register(Histogram(
+    "saksham_sign_payload_duration_seconds", "sign_payload latency by key algorithm.", ("algorithm",)))
+VERIFY_SECONDS = registry.register(Histogram(
+    "saksham_verify_signature_duration_seconds", "verify_signature latency (in-process calls only).", ()))
+AUTH_SECONDS = registry.register(Histogram(
+    "saksham_auth_duration_seconds", "Token validation latency for cache misses, by source (local, remote).", ("source",)))
+CHAIN_EVENTS = registry.register(Counter(
+    "saksham_chain_events_verified_total", "Audit events re-hashed and checked by chain verification.", ()))
+CHAIN_SECONDS = registry.register(Histogram(
+    "saksham_chain_verify_page_duration_seconds", "Time to verify one page of audit events.", ()))
+CHAIN_RATE = registry.register(Gauge(
+    "saksham_chain_verify_events_per_second", "Throughput of the most recent verified page.", ()))
+CONSENTS_EXPIRED = registry.register(Counter(
+    "saksham_consents_expired_total", "Consents moved to expired by the expiry sweeper.", ()))
+
+def record_chain_page(events: int, seconds: float) -> None:
+    if not METRICS_ENABLED or not events:
+        return
+    CHAIN_EVENTS.inc(events)
+    CHAIN_SECONDS.observe(seconds)
+    if seconds > 0:
+        CHAIN_RATE.set(round(events / seconds, 1))
+
+class RequestMetricsMiddleware:
+    """
+    Pure ASGI middleware: observes request latency labelled with the matched route
+    template (not the raw path, to keep label cardinality bounded) and status code.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            REQUEST_SECONDS.observe(time.perf_counter() - started, scope.get("method", ""), path, str(status[0]))
@@ -17,6 +17,9 @@ class ConsentGrantRequest(BaseModel):
     expiry_hours: int = 24  # Default expiry
     user_id: Optional[str] = None # In a real app, this comes from JWT, but useful for testing
 
+class ConsentGrantBatchRequest(BaseModel):
+    grants: List[ConsentGrantRequest]
+
 class ConsentRevokeRequest(BaseModel):
     consent_id: str
     reason: Optional[str] = "User revoked"
@@ -24,6 +27,18 @@ class ConsentRevokeRequest(BaseModel):
 class VerifyReceiptRequest(BaseModel):
     receipt: dict # The full JSON receipt
 
+class VerifyReceiptBatchRequest(BaseModel):
+    receipts: List[dict] # Full JSON receipts, as returned by /consent/grant
+
+class ConsentCheckRequest(BaseModel):
+    user_id: str
+    app_id: str # Application UUID
+    purpose_code: str
+    data_categories: List[str] = [] # All of them must be granted for the purpose
+
+class ConsentCheckBatchRequest(BaseModel):
+    checks: List[ConsentCheckRequest]
+
 # --- RESPONSE MODELS ---
 
 class ConsentReceiptResponse(BaseModel):
@@ -33,12 +48,33 @@ class ConsentReceiptResponse(BaseModel):
     signature: str
     timestamp: datetime
 
+class ConsentGrantBatchResult(BaseModel):
+    ok: bool
+    receipt: Optional[ConsentReceiptResponse] = None # Same as the /consent/grant response
+    error: Optional[str] = None
+
 class VerificationResponse(BaseModel):
     valid: bool
     status: str # 'active', 'revoked', 'expired', 'invalid_signature'
     message: str
     auditable_event_id: Optional[str] = None
 
+class ConsentCheckResponse(BaseModel):
+    allowed: bool
+    reason: str # 'granted', 'no_consent', 'expired', 'purpose_not_granted', 'category_not_granted'
+    consent_id: Optional[str] = None # The covering consent (latest expiry) when allowed
+    expiry: Optional[datetime] = None
+
+# --- AUTH MODELS ---
+
+class AuthenticatedUser(BaseModel):
+    id: str
+    email: Optional[str] = None
+    role: Optional[str] = None
+    aud: Optional[str] = None
+    app_metadata: dict = Field(default_factory=dict)
+    user_metadata: dict = Field(default_factory=dict)
+
 # --- DB MODELS (ReadOnly) ---
 
 class ApplicationRead(BaseModel):
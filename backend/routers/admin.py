@@ -0,0 +1,94 @@
+from fastapi import APIRouter, Depends, HTTPException
+from routers.auth import get_current_user, require_role
+from jwt_auth import token_cache
+from status_cache import status_cache
+from app_registry import app_registry
+from sweeper import expiry_sweeper
+from decision_index import decision_index
+from idempotency import idempotency_store
+from signature_cache import signature_cache
+from event_hub import event_hub
+from audit_log import audit_appender
+from shards import sharded, shard_anchorer, writer_lease
+
+router = APIRouter(prefix="/admin", tags=["Admin"])
+
+@router.get("/cache/stats")
+async def get_cache_stats(user = Depends(get_current_user)):
+    """
+    Hit / miss counters and sizes of the in-process caches.
+    """
+    return {
+        "consent_status": status_cache.stats(),
+        "auth_tokens": token_cache.stats(),
+        "apps": app_registry.stats(),
+        "decisions": decision_index.stats(),
+        "idempotency": idempotency_store.stats(),
+        "signatures": signature_cache.stats(),
+    }
+
+@router.post("/cache/status/invalidate")
+async def invalidate_status_cache(consent_id: str = None, user = Depends(require_role("admin"))):
+    """
+    Drops one consent's cached status (or the whole status cache), e.g. after a manual DB fix.
+    Admins only: dropping a revoked status would let workers serve it from stale data.
+    """
+    if consent_id:
+        await status_cache.invalidate(consent_id)
+    else:
+        await status_cache.clear()
+    return {"status": "invalidated", "consent_id": consent_id}
+
+@router.post("/cache/apps/invalidate")
+async def invalidate_app_cache(app: str = None, user = Depends(require_role("admin"))):
+    """
+    Drops one application (by app_id or app_name) from the app registry cache,
+    or the whole cache, e.g. after an app is renamed or deleted.
+    """
+    if app:
+        app_registry.invalidate(app)
+    else:
+        app_registry.clear()
+    return {"status": "invalidated", "app": app}
+
+@router.get("/event-hub")
+async def get_event_hub_stats(user = Depends(get_current_user)):
+    """
+    Subscribers and throughput of the /audit/events/stream fan-out hub.
+    """
+    return event_hub.stats()
+
+@router.get("/shards")
+async def get_shard_stats(user = Depends(get_current_user)):
+    """
+    Shard layout, per-shard writer counters, the writer lease and anchoring progress
+    of a sharded ledger.
+    """
+    stats = shard_anchorer.stats()
+    stats["writers"] = audit_appender.stats() if sharded() else []
+    stats["writer_lease"] = writer_lease.stats() if sharded() else None
+    return stats
+
+@router.post("/shards/anchor")
+async def anchor_shards(user = Depends(require_role("admin"))):
+    """
+    Anchors the current shard heads now instead of waiting for the next interval.
+    """
+    if not sharded():
+        raise HTTPException(status_code=400, detail="The ledger is not sharded (AUDIT_SHARDS=1)")
+    return await shard_anchorer.anchor(force=True)
+
+@router.get("/sweeper")
+async def get_sweeper_stats(user = Depends(get_current_user)):
+    """
+    Progress of the consent expiry sweeper.
+    """
+    return expiry_sweeper.stats()
+
+@router.post("/sweeper/run")
+async def run_sweeper(user = Depends(require_role("admin"))):
+    """
+    Runs one expiry sweep now instead of waiting for the next interval.
+    """
+    expired = await expiry_sweeper.sweep()
+    return {"swept": expired, **expiry_sweeper.stats()}
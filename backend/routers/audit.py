@@ -1,46 +1,251 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List, Optional
-from database import get_db
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from typing import List, Optional, Tuple
+import asyncio
+import base64
+import binascii
+import json
+import time
+from datetime import datetime
+from database import run_db
+from storage import get_storage
+from chain import GENESIS_HASH, ChainVerifier, ShardedChainVerifier, checkpoint_violation
+from merkle import merkle_log
+from shards import AUDIT_SHARDS, sharded, shard_checkpoint_id, verify_anchors
+from event_hub import EVENT_STREAM_HEARTBEAT_SECONDS, event_hub, event_key
 from routers.auth import get_current_user, require_role
+from utils import parse_timestamp
 
 router = APIRouter(prefix="/audit", tags=["Audit"])
 
+EVENT_FIELDS = ("event_id", "event_type", "actor_id", "actor_type", "event_payload", "timestamp",
+                "hash_prev", "hash_current", "hash_version", "shard")
+# Always returned, so the next page can be requested from any projection
+CURSOR_FIELDS = ("event_id", "timestamp")
+MAX_EVENTS_PAGE = 1000
+
+def encode_cursor(event: dict) -> str:
+    raw = json.dumps([str(event["timestamp"]), str(event["event_id"])]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, event_id = json.loads(raw)
+        return str(timestamp), str(event_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _event_columns(fields: Optional[str]) -> Optional[List[str]]:
+    if not fields:
+        return None
+    columns = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [c for c in columns if c not in EVENT_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return list(CURSOR_FIELDS) + [c for c in columns if c not in CURSOR_FIELDS]
+
 @router.get("/events")
 async def get_audit_events(
-    limit: int = 50, 
+    response: Response,
+    limit: int = Query(50, ge=1, le=MAX_EVENTS_PAGE),
     user_id: Optional[str] = None, 
+    actor_id: Optional[str] = None,
+    event_type: Optional[str] = None,
+    consent_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
     user = Depends(get_current_user)
 ):
     """
-    Retrieve audit events. 
+    Retrieve audit events, newest first. 
     In a real system, this would be restricted to Regulators or App Admins.
+    
+    - Filters: `actor_id` (`user_id` is the older name), `event_type`, `consent_id`
+      (from the event payload) and the time range `since` (inclusive) / `until` (exclusive).
+    - Pagination: when a page is full the `X-Next-Cursor` response header holds an opaque
+      cursor; pass it back as `cursor` (with the same filters) for the next, older page.
+      Pages are keyset seeks on (timestamp, event_id), so deep pages cost the same as the first.
+    - `fields`: comma-separated columns to return, e.g. `event_type,actor_id` to leave out
+      payloads and hashes. event_id and timestamp are always included.
+    - The first page carries an `X-Stream-Cursor` header: the stream cursor of its newest
+      event. Open /events/stream with it as `Last-Event-ID` to continue without a gap.
+    """
+    query = {
+        "actor_id": actor_id or user_id,
+        "event_type": event_type,
+        "consent_id": consent_id,
+        "since": parse_timestamp(since).isoformat() if since else None,
+        "until": parse_timestamp(until).isoformat() if until else None,
+        "before": decode_cursor(cursor) if cursor else None,
+        "columns": _event_columns(fields),
+    }
+    rows = await run_db(lambda: get_storage().list_audit_events(limit, **query))
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1])
+    if rows and not cursor:
+        response.headers["X-Stream-Cursor"] = encode_cursor(rows[0])
+    return rows
+
+def _sse_event(event: dict) -> str:
+    return f"id: {encode_cursor(event)}\nevent: audit_event\ndata: {json.dumps(event, default=str)}\n\n"
+
+@router.get("/events/stream")
+async def stream_audit_events(
+    actor_id: Optional[str] = None,
+    event_type: Optional[str] = None,
+    cursor: Optional[str] = None,
+    last_event_id: Optional[str] = Header(None),
+    user = Depends(get_current_user)
+):
     """
-    db = get_db()
-    query = db.table("audit_events").select("*").order("timestamp", desc=True).limit(limit)
+    Live feed of audit events as server-sent events, oldest first, replacing polling of /events.
     
-    if user_id:
-        query = query.eq("actor_id", user_id)
-        
-    res = query.execute()
-    return res.data
+    - Filters: `actor_id`, `event_type` (comma-separated for several).
+    - Each message's `id` is a cursor. To resume after a disconnect send it back as the
+      `Last-Event-ID` header (EventSource does this itself) or `cursor`; missed events are
+      replayed from the hub's in-memory buffer, or from the database if they are older.
+      Without a cursor the stream starts with the next event appended.
+    - A subscriber that falls too far behind gets an `event: reset` carrying its cursor and
+      the stream closes; reconnecting with that cursor continues without gaps.
+    """
+    resume = cursor or last_event_id
+    after = decode_cursor(resume) if resume else None
+    event_types = [t for t in (event_type or "").split(",") if t] or None
+    
+    async def generate():
+        # Subscribe before catching up, so nothing appended meanwhile is lost
+        sub = event_hub.subscribe(actor_id, event_types)
+        position = {"timestamp": after[0], "event_id": after[1]} if after else None  # last event passed
+        try:
+            yield "retry: 2000\n\n"
+            if after:
+                missed = event_hub.replay(event_key(position))
+                if missed is None:
+                    # Older than the buffer: read the gap from the ledger, page by page
+                    missed = []
+                    while True:
+                        events = await run_db(get_storage().audit_events_after,
+                                              (position["timestamp"], position["event_id"]), event_hub.page_size)
+                        for event in events:
+                            if sub.matches(event):
+                                yield _sse_event(event)
+                            position = event
+                        if len(events) < event_hub.page_size:
+                            break
+                for event in missed:
+                    if sub.matches(event):
+                        yield _sse_event(event)
+                    position = event
+            
+            last = event_key(position) if position else None
+            while True:
+                if sub.lagged and sub.queue.empty():
+                    reset = {"cursor": encode_cursor(position) if position else None}
+                    yield f"event: reset\ndata: {json.dumps(reset)}\n\n"
+                    return
+                try:
+                    event = await asyncio.wait_for(sub.queue.get(), timeout=EVENT_STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                key = event_key(event)
+                if last is not None and key <= last:
+                    continue  # already sent during catch-up
+                yield _sse_event(event)
+                position, last = event, key
+        finally:
+            event_hub.unsubscribe(sub)
+    
+    return StreamingResponse(generate(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+CHAIN_CHECKPOINT_ID = "global"
+
+def _save_checkpoint(store, event: dict, verified_count: int, checkpoint_id: str = CHAIN_CHECKPOINT_ID) -> dict:
+    checkpoint = {
+        "checkpoint_id": checkpoint_id,
+        "last_event_id": str(event["event_id"]),
+        "last_timestamp": event["timestamp"],
+        "last_hash": event["hash_current"],
+        "verified_count": verified_count,
+        "updated_at": datetime.utcnow().isoformat()
+    }
+    store.save_checkpoint(checkpoint)
+    return checkpoint
+
+async def _verify_chain(store, page_size: int, full: bool, shard: Optional[int] = None,
+                        checkpoint_id: str = CHAIN_CHECKPOINT_ID) -> Tuple[ChainVerifier, int, Optional[dict]]:
+    """
+    Verifies one chain (the whole ledger, or one shard of a sharded ledger) from its
+    checkpoint, or from genesis with `full`, and moves the checkpoint.
+    Returns (verifier, events verified before this call, checkpoint).
+    """
+    checkpoint = None if full else await run_db(store.get_checkpoint, checkpoint_id)
+    
+    if checkpoint:
+        verifier = ChainVerifier(expected_prev=checkpoint["last_hash"])
+        anchor = await run_db(store.get_audit_event, checkpoint["last_event_id"])
+        violation = checkpoint_violation(checkpoint, anchor)
+        if violation:
+            verifier.add_violation(violation)
+        base_count = checkpoint["verified_count"]
+        cursor = (checkpoint["last_timestamp"], checkpoint["last_event_id"])
+    else:
+        verifier = ChainVerifier(expected_prev=GENESIS_HASH)
+        base_count = 0
+        cursor = None
+    
+    # Walk forward in (timestamp, event_id) order, one page at a time
+    while True:
+        events = await run_db(store.audit_events_after, cursor, page_size, shard)
+        await verifier.feed_async(events)
+        if len(events) < page_size:
+            break
+        cursor = (events[-1]["timestamp"], events[-1]["event_id"])
+    
+    if verifier.good_count > 0:
+        checkpoint = await run_db(_save_checkpoint, store, verifier.last_good_event,
+                                  base_count + verifier.good_count, checkpoint_id)
+    elif full:
+        # Nothing verified cleanly from genesis: drop any stale checkpoint
+        await run_db(store.delete_checkpoint, checkpoint_id)
+    return verifier, base_count, checkpoint
 
 @router.get("/verify-chain")
-async def verify_hash_chain(limit: int = 100):
+async def verify_hash_chain(limit: int = 100, full: bool = False):
     """
     Utility for regulators to verify the integrity of the hash chain.
-    Fetches the last N events and re-computes hashes to ensure no tampering.
+    
+    By default verification is incremental: only events appended after the last
+    checkpoint (audit_checkpoints) are fetched, `limit` rows per page, and re-hashed.
+    The checkpoint then advances to the last event verified without a critical
+    violation, so each call costs O(new events). The checkpointed event itself is
+    re-checked on every call to catch edits to the tip of verified history; edits
+    to events before it are NOT seen by incremental runs.
+    
+    `full=true` re-verifies the whole ledger from genesis (for audits) and resets
+    the checkpoint from the result.
+    
+    On a sharded ledger (AUDIT_SHARDS > 1) every shard's chain is verified on its own,
+    concurrently and with its own checkpoint, and then the sequence of signed anchors
+    committing the shard heads (see /audit/anchor).
     
     Verification checks:
     1. Each event's hash_current matches recalculated hash (data integrity)
     2. Each event's hash_prev matches previous event's hash_current (chain linkage)
     3. No gaps or breaks in the chain
     """
-    db = get_db()
-    # Get events ordered by timestamp (oldest first) for proper chain verification
-    res = db.table("audit_events").select("*").order("timestamp", desc=False).limit(limit).execute()
-    events = res.data
+    store = get_storage()
+    page_size = max(1, limit)
+    if sharded():
+        return await _verify_shards(store, page_size, full)
     
-    if not events or len(events) == 0:
+    verifier, base_count, checkpoint = await _verify_chain(store, page_size, full)
+    
+    if not checkpoint and verifier.count == 0:
         return {
             "verified_count": 0,
             "violations": [],
@@ -48,139 +253,234 @@ async def verify_hash_chain(limit: int = 100):
             "message": "No audit events found"
         }
     
-    violations = []
-    from utils import generate_hash_chain
+    result = verifier.summary(verified_count=base_count + verifier.count)
+    result["mode"] = "full" if full else "incremental"
+    result["new_events_verified"] = verifier.count
+    result["checkpoint"] = checkpoint
+    if verifier.status() == "VALID" and verifier.count == 0:
+        result["message"] = "No new events since last checkpoint"
+    return result
+
+async def _verify_shards(store, page_size: int, full: bool) -> dict:
+    results = await asyncio.gather(*(
+        _verify_chain(store, page_size, full, shard, shard_checkpoint_id(shard)) for shard in range(AUDIT_SHARDS)
+    ))
+    anchors = await verify_anchors(full=full, page_size=page_size)
     
-    # Sort events by timestamp to verify chain in chronological order
-    sorted_events = sorted(events, key=lambda x: x['timestamp'])
+    shards, violations = [], []
+    verified = new = critical = warnings = 0
+    for shard, (verifier, base_count, checkpoint) in enumerate(results):
+        violations.extend({"shard": shard, **v} for v in verifier.violations)
+        shards.append({
+            "shard": shard,
+            "status": verifier.status() if checkpoint or verifier.count else "EMPTY",
+            "verified_count": base_count + verifier.count,
+            "new_events_verified": verifier.count,
+            "checkpoint": checkpoint,
+        })
+        verified += base_count + verifier.count
+        new += verifier.count
+        critical += verifier.critical
+        warnings += verifier.warnings
+    violations.extend(anchors.pop("violations"))
+    critical += anchors["critical_violations"]
+    
+    if not verified and not critical and anchors["status"] == "EMPTY":
+        status, message = "EMPTY", "No audit events found"
+    elif critical or warnings:
+        status, message = "TAMPERED" if critical else "SUSPICIOUS", f"Found {critical + warnings} violation(s)"
+    else:
+        status, message = "VALID", "Chain verified successfully" if new else "No new events since last checkpoint"
+    return {
+        "verified_count": verified,
+        "total_events": verified,
+        "violations": violations,
+        "critical_violations": critical,
+        "warnings": warnings,
+        "status": status,
+        "message": message,
+        "mode": "full" if full else "incremental",
+        "new_events_verified": new,
+        "shards": shards,
+        "anchors": anchors,
+    }
+
+def _stream_line(kind: str, data: dict, fmt: str) -> str:
+    if fmt == "sse":
+        return f"event: {kind}\ndata: {json.dumps(data, default=str)}\n\n"
+    return json.dumps({"type": kind, **data}, default=str) + "\n"
+
+@router.get("/verify-chain/stream")
+async def stream_verify_hash_chain(page_size: int = 1000, format: str = "ndjson"):
+    """
+    Verifies the whole ledger from genesis in bounded memory and streams the outcome.
     
-    # Start with the first event (genesis or earliest in batch)
-    prev_hash_expected = sorted_events[0].get('hash_prev', "0" * 64)
+    Events are walked with keyset pagination on (timestamp, event_id) and verified page
+    by page; only the current page and the previous event are held in memory.
+    Output is NDJSON (default) or server-sent events (`format=sse`) with these records:
+    - start: emitted immediately
+    - violation: as soon as one is found
+    - progress: after every page (events verified so far, position)
+    - result: final summary (same fields as /verify-chain, without the violation list)
+    Streaming does not read or move the verification checkpoint. On a sharded ledger each
+    event is checked against its own shard's chain (anchors are checked by /verify-chain).
+    """
+    fmt = "sse" if format == "sse" else "ndjson"
+    page_size = max(1, min(page_size, 50000))
     
-    for i, event in enumerate(sorted_events):
-        event_id = event['event_id']
-        event_timestamp = event['timestamp']
-        event_type = event['event_type']
-        event_payload = event['event_payload']
-        
-        # IMPORTANT: Use timestamp from event_payload if available
-        # The hash was originally calculated using receipt_payload['timestamp'] (ISO string)
-        # not the database timestamp column
-        hash_timestamp = None
-        if isinstance(event_payload, dict):
-            hash_timestamp = event_payload.get('timestamp')
-            # Ensure it's a string (JSONB might return it in different format)
-            if hash_timestamp and not isinstance(hash_timestamp, str):
-                if hasattr(hash_timestamp, 'isoformat'):
-                    hash_timestamp = hash_timestamp.isoformat()
-                else:
-                    hash_timestamp = str(hash_timestamp)
-        
-        # Fallback: convert database timestamp to ISO string format (for REVOKE events that don't have timestamp in payload)
-        if not hash_timestamp:
-            if isinstance(event_timestamp, str):
-                hash_timestamp = event_timestamp
-            else:
-                # If it's a datetime object, convert to ISO string
-                from datetime import datetime
-                if hasattr(event_timestamp, 'isoformat'):
-                    hash_timestamp = event_timestamp.isoformat()
-                else:
-                    hash_timestamp = str(event_timestamp)
+    async def generate():
+        store = get_storage()
+        # A sharded ledger interleaves independent chains; each is checked on its own
+        verifier = ShardedChainVerifier() if sharded() else ChainVerifier(expected_prev=GENESIS_HASH)
+        cursor = None
+        started = time.monotonic()
+        yield _stream_line("start", {"page_size": page_size, "mode": "full"}, fmt)
         
-        # Check 1: Verify hash_current matches recalculated hash
-        # This detects if the event data was modified
-        # Use the same timestamp that was used when creating the hash
-        recalc_hash = generate_hash_chain(
-            event['hash_prev'], 
-            event_payload, 
-            hash_timestamp
-        )
+        while True:
+            events = await run_db(store.audit_events_after, cursor, page_size)
+            await verifier.feed_async(events)
+            for violation in verifier.drain_violations():
+                yield _stream_line("violation", violation, fmt)
+            if events:
+                cursor = (events[-1]["timestamp"], events[-1]["event_id"])
+                elapsed = time.monotonic() - started
+                yield _stream_line("progress", {
+                    "verified": verifier.count,
+                    "last_event_id": cursor[1],
+                    "last_timestamp": cursor[0],
+                    "events_per_second": round(verifier.count / elapsed, 1) if elapsed > 0 else None
+                }, fmt)
+            if len(events) < page_size:
+                break
         
-        # Debug: Log hash calculation details if mismatch
-        if recalc_hash != event['hash_current']:
-            import json
-            print(f"DEBUG: Hash mismatch for event {event_id}")
-            print(f"  hash_prev: {event['hash_prev']}")
-            print(f"  timestamp used: {hash_timestamp}")
-            print(f"  event_payload type: {type(event_payload)}")
-            print(f"  event_payload keys: {list(event_payload.keys()) if isinstance(event_payload, dict) else 'N/A'}")
-            print(f"  event_payload JSON: {json.dumps(event_payload, sort_keys=True)}")
-            print(f"  expected hash: {recalc_hash}")
-            print(f"  stored hash: {event['hash_current']}")
-        
-        if recalc_hash != event['hash_current']:
-            violations.append({
-                "event_id": str(event_id),
-                "event_type": event_type,
-                "timestamp": event_timestamp,
-                "reason": "Hash Mismatch - Event data may have been tampered with",
-                "details": f"Recalculated hash doesn't match stored hash_current",
-                "expected_hash": recalc_hash,
-                "found_hash": event['hash_current'],
-                "severity": "CRITICAL"
-            })
-        
-        # Check 2: Verify chain linkage (hash_prev matches previous event's hash_current)
-        # This detects if events were deleted, reordered, or inserted
-        if i > 0:  # First event doesn't have a previous event in this batch
-            if event['hash_prev'] != prev_hash_expected:
-                violations.append({
-                    "event_id": str(event_id),
-                    "event_type": event_type,
-                    "timestamp": event_timestamp,
-                    "reason": "Chain Link Broken - Previous event hash mismatch",
-                    "details": f"Event's hash_prev doesn't match previous event's hash_current. Possible deletion, reordering, or insertion.",
-                    "expected_prev_hash": prev_hash_expected,
-                    "found_prev_hash": event['hash_prev'],
-                    "severity": "CRITICAL"
-                })
-        
-        # Update expected previous hash for next iteration
-        prev_hash_expected = event['hash_current']
-    
-    # Check 3: Verify no duplicate timestamps (potential insertion attack)
-    timestamps = [e['timestamp'] for e in sorted_events]
-    if len(timestamps) != len(set(timestamps)):
-        violations.append({
-            "event_id": "MULTIPLE",
-            "reason": "Duplicate Timestamps Detected",
-            "details": "Multiple events have the same timestamp. This may indicate unauthorized insertions.",
-            "severity": "WARNING"
-        })
+        result = verifier.summary()
+        result.pop("violations")
+        if verifier.count == 0:
+            result.update({"status": "EMPTY", "message": "No audit events found"})
+        yield _stream_line("result", result, fmt)
+    
+    media_type = "text/event-stream" if fmt == "sse" else "application/x-ndjson"
+    return StreamingResponse(generate(), media_type=media_type, headers={"Cache-Control": "no-cache"})
+
+@router.get("/merkle/root")
+async def get_merkle_root(tree_size: Optional[int] = None):
+    """
+    Returns a signed Merkle root over the audit ledger (the latest one, or the one
+    recorded at `tree_size`). Roots are signed every MERKLE_ROOT_INTERVAL events.
+    """
+    root = await run_db(merkle_log.signed_root, tree_size)
+    if not root:
+        raise HTTPException(status_code=404, detail="No signed root found")
+    return root
+
+@router.get("/anchor")
+async def get_shard_anchor(anchor_seq: Optional[int] = None):
+    """
+    Returns a signed anchor of a sharded ledger (the latest one, or `anchor_seq`): the
+    head of every shard chain, committed into one root hash together with the previous
+    anchor's root. Anchors are written every AUDIT_ANCHOR_INTERVAL_SECONDS while the ledger grows.
+    """
+    anchor = await run_db(get_storage().audit_anchor, anchor_seq)
+    if not anchor:
+        raise HTTPException(status_code=404, detail="No anchor found")
+    return anchor
+
+@router.get("/merkle/inclusion")
+async def get_inclusion_proof(
+    event_id: Optional[str] = None,
+    consent_id: Optional[str] = None,
+    tree_size: Optional[int] = None
+):
+    """
+    Inclusion proof(s) that an audit event (or every event of a consent) is in the ledger.
+    Verify with: leaf_hash = SHA256(0x00 || "<event_id>:<hash_current>"), then fold the
+    audit_path per RFC 9162 and compare with root_hash. Proof size is O(log n).
+    Defaults to the latest signed root that covers the leaves, else the current tree.
+    """
+    if not event_id and not consent_id:
+        raise HTTPException(status_code=400, detail="Provide event_id or consent_id")
+    
+    leaves = await run_db(lambda: merkle_log.find_leaves(event_id=event_id, consent_id=consent_id))
+    if not leaves:
+        raise HTTPException(status_code=404, detail="Event not found in Merkle index")
     
-    # Determine overall status
-    critical_violations = [v for v in violations if v.get('severity') == 'CRITICAL']
-    status = "VALID" if not violations else ("TAMPERED" if critical_violations else "SUSPICIOUS")
+    needed = leaves[-1]["leaf_index"] + 1
+    signed = None
+    if tree_size is None:
+        latest = await run_db(merkle_log.signed_root)
+        if latest and latest["tree_size"] >= needed:
+            signed = latest
+            tree_size = latest["tree_size"]
+        else:
+            tree_size = await run_db(merkle_log.current_size)
+    else:
+        signed = await run_db(merkle_log.signed_root, tree_size)
+    
+    if tree_size < needed or tree_size > await run_db(merkle_log.current_size):
+        raise HTTPException(status_code=400, detail=f"tree_size must be between {needed} and the current tree size")
     
     return {
-        "verified_count": len(events),
-        "total_events": len(events),
-        "violations": violations,
-        "critical_violations": len(critical_violations),
-        "warnings": len([v for v in violations if v.get('severity') == 'WARNING']),
-        "status": status,
-        "message": "Chain verified successfully" if status == "VALID" else f"Found {len(violations)} violation(s)"
+        "tree_size": tree_size,
+        "root_hash": signed["root_hash"] if signed else await run_db(merkle_log.root_at, tree_size),
+        "signed_root": signed,
+        "proofs": [
+            {
+                "event_id": leaf["event_id"],
+                "consent_id": leaf.get("consent_id"),
+                "leaf_index": leaf["leaf_index"],
+                "leaf_hash": leaf["leaf_hash"],
+                "audit_path": await run_db(merkle_log.inclusion_proof, leaf["leaf_index"], tree_size)
+            }
+            for leaf in leaves
+        ]
+    }
+
+@router.get("/merkle/consistency")
+async def get_consistency_proof(first: int, second: Optional[int] = None):
+    """
+    Consistency proof between two tree sizes: shows the ledger at `second` is an
+    append-only extension of the ledger at `first` (RFC 9162).
+    """
+    current = await run_db(merkle_log.current_size)
+    second = current if second is None else second
+    if first < 0 or first > second or second > current:
+        raise HTTPException(status_code=400, detail=f"Require 0 <= first <= second <= {current}")
+    
+    return {
+        "first": first,
+        "second": second,
+        "first_root": await run_db(merkle_log.root_at, first),
+        "second_root": await run_db(merkle_log.root_at, second),
+        "proof": await run_db(merkle_log.consistency_proof, first, second)
     }
 
+async def _drop_checkpoints(store) -> None:
+    """
+    Forgets what was verified, so the next incremental /verify-chain starts from genesis
+    and sees an edit anywhere in the ledger, not only at the checkpointed event.
+    """
+    for checkpoint_id in [CHAIN_CHECKPOINT_ID] + [shard_checkpoint_id(s) for s in range(AUDIT_SHARDS)]:
+        await run_db(store.delete_checkpoint, checkpoint_id)
+
 @router.post("/tamper")
 async def tamper_log(user = Depends(get_current_user)):
     """
     SIMULATION ONLY: Corrupts the last audit event to demonstrate the verification engine.
     This modifies the 'hash_current' of the most recent event in the DB, breaking the chain.
     """
-    db = get_db()
+    store = get_storage()
     # Get last event
-    last_event = db.table("audit_events").select("event_id").order("timestamp", desc=True).limit(1).execute()
-    if not last_event.data:
+    last_event = await run_db(store.latest_audit_event)
+    if not last_event:
         raise HTTPException(status_code=404, detail="No events to tamper with")
         
-    event_id = last_event.data[0]['event_id']
+    event_id = last_event['event_id']
     
     # Corrupt it efficiently
-    db.table("audit_events").update({
+    await run_db(store.update_audit_event, event_id, {
         "hash_current": "DEADBEEF00000000000000000000000000000000000000000000000000000000"
-    }).eq("event_id", event_id).execute()
+    })
+    await _drop_checkpoints(store)
     
     return {"status": "tampered", "message": "The ledger has been corrupted. Run verification to detect."}
 
@@ -191,23 +491,22 @@ async def simulate_tampering(event_id: str, user = Depends(get_current_user)):
     This is for demonstration purposes to show how tampering detection works.
     In production, this endpoint should NOT exist.
     """
-    db = get_db()
+    store = get_storage()
     
     # Get the event
-    res = db.table("audit_events").select("*").eq("event_id", event_id).execute()
-    if not res.data or len(res.data) == 0:
+    event = await run_db(store.get_audit_event, event_id)
+    if not event:
         raise HTTPException(status_code=404, detail="Event not found")
     
-    event = res.data[0]
-    
     # Simulate tampering by modifying the hash_current
     # This creates a hash mismatch that will be detected
     tampered_hash = "0" * 64  # Obviously wrong hash
     
     # Update the event with tampered hash
-    db.table("audit_events").update({
+    await run_db(store.update_audit_event, event_id, {
         "hash_current": tampered_hash
-    }).eq("event_id", event_id).execute()
+    })
+    await _drop_checkpoints(store)
     
     return {
         "message": "Tampering simulated successfully",
@@ -223,14 +522,12 @@ async def simulate_data_tampering(event_id: str, user = Depends(get_current_user
     DEMO ONLY: Simulates tampering by modifying event payload data.
     This changes the actual data, which will cause hash mismatch.
     """
-    db = get_db()
+    store = get_storage()
     
     # Get the event
-    res = db.table("audit_events").select("*").eq("event_id", event_id).execute()
-    if not res.data or len(res.data) == 0:
+    event = await run_db(store.get_audit_event, event_id)
+    if not event:
         raise HTTPException(status_code=404, detail="Event not found")
-    
-    event = res.data[0]
     event_payload = event['event_payload']
     
     # Modify the payload (simulate data tampering)
@@ -242,9 +539,10 @@ async def simulate_data_tampering(event_id: str, user = Depends(get_current_user
             event_payload['action'] = "TAMPERED_" + event_payload.get('action', '')
     
     # Update the event with tampered payload
-    db.table("audit_events").update({
+    await run_db(store.update_audit_event, event_id, {
         "event_payload": event_payload
-    }).eq("event_id", event_id).execute()
+    })
+    await _drop_checkpoints(store)
     
     return {
         "message": "Data tampering simulated successfully",
@@ -259,22 +557,21 @@ async def simulate_chain_tampering(event_id: str, user = Depends(get_current_use
     DEMO ONLY: Simulates chain tampering by breaking the hash_prev link.
     This simulates deletion or reordering of events.
     """
-    db = get_db()
+    store = get_storage()
     
     # Get the event
-    res = db.table("audit_events").select("*").eq("event_id", event_id).execute()
-    if not res.data or len(res.data) == 0:
+    event = await run_db(store.get_audit_event, event_id)
+    if not event:
         raise HTTPException(status_code=404, detail="Event not found")
     
-    event = res.data[0]
-    
     # Break the chain by setting wrong hash_prev
     broken_hash_prev = "BROKEN_CHAIN_" + "0" * 50
     
     # Update the event with broken chain link
-    db.table("audit_events").update({
+    await run_db(store.update_audit_event, event_id, {
         "hash_prev": broken_hash_prev
-    }).eq("event_id", event_id).execute()
+    })
+    await _drop_checkpoints(store)
     
     return {
         "message": "Chain tampering simulated successfully",
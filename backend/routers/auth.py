@@ -1,12 +1,58 @@
 from fastapi import Depends, HTTPException, Header
 from typing import Optional
-from database import get_db
+from database import run_db
+from storage import get_storage
+from jwt_auth import (
+    AUTH_MODE, AUTH_REMOTE_FALLBACK, AuthError, KeyUnavailable,
+    cache_user, cached_user, decode_token, signing_keys
+)
+from models import AuthenticatedUser
+from metrics import AUTH_SECONDS
+
+def _user_from_claims(claims: dict) -> AuthenticatedUser:
+    return AuthenticatedUser(
+        id=claims["sub"],
+        email=claims.get("email"),
+        role=claims.get("role"),
+        aud=claims.get("aud") if isinstance(claims.get("aud"), str) else None,
+        app_metadata=claims.get("app_metadata") or {},
+        user_metadata=claims.get("user_metadata") or {},
+    )
+
+def _remote_user(token: str) -> AuthenticatedUser:
+    """
+    Fallback mode: asks the Supabase auth server about the token (one network round trip).
+    """
+    remote = get_storage().get_auth_user(token)
+    if not remote:
+        raise AuthError("Invalid Authentication Token")
+
+    return AuthenticatedUser(
+        id=str(remote.id),
+        email=getattr(remote, "email", None),
+        role=getattr(remote, "role", None),
+        aud=getattr(remote, "aud", None),
+        app_metadata=getattr(remote, "app_metadata", None) or {},
+        user_metadata=getattr(remote, "user_metadata", None) or {},
+    )
+
+async def _verify_locally(token: str) -> dict:
+    try:
+        return decode_token(token)
+    except KeyUnavailable:
+        # Unknown kid: the signing key may have been rotated since the last refresh.
+        # Refetch the JWKS (rate-limited) on a worker thread, never on the event loop.
+        if not await run_db(signing_keys.refresh_if_stale):
+            raise
+        return decode_token(token)
 
 async def get_current_user(authorization: Optional[str] = Header(None)):
     """
     Validates Supabase JWT and returns the user object.
-    In a real production environment, we should verify the JWT signature locally
-    to save network calls, or use the Supabase Admin client if needed.
+    In local mode (default) the signature and claims are verified in-process against a
+    cached secret / JWKS, so no network call is made. AUTH_MODE=remote keeps the old
+    behaviour of asking the auth server. Validated tokens are cached until they expire
+    (bounded by AUTH_CACHE_TTL).
     """
     if not authorization:
         raise HTTPException(status_code=401, detail="Missing Authorization Header")
@@ -15,31 +61,57 @@ async def get_current_user(authorization: Optional[str] = Header(None)):
     
     if not token:
         raise HTTPException(status_code=401, detail="Invalid Authorization Header format")
-    
+
+    user = cached_user(token)
+    if user is not None:
+        return user
+
     try:
-        # Verify with Supabase
-        db = get_db()
-        user_response = db.auth.get_user(token)
-        
-        if not user_response or not user_response.user:
-            raise HTTPException(status_code=401, detail="Invalid Authentication Token")
-            
-        return user_response.user
+        if AUTH_MODE == "remote":
+            with AUTH_SECONDS.time("remote"):
+                user = await run_db(_remote_user, token)
+            cache_user(token, user)
+            return user
+
+        try:
+            with AUTH_SECONDS.time("local"):
+                claims = await _verify_locally(token)
+        except KeyUnavailable:
+            if not AUTH_REMOTE_FALLBACK:
+                raise
+            with AUTH_SECONDS.time("remote"):
+                user = await run_db(_remote_user, token)
+            cache_user(token, user)
+            return user
+
+        user = _user_from_claims(claims)
+        cache_user(token, user, expires_at=claims.get("exp"))
+        return user
     except Exception as e:
         # Log the error for debugging
         print(f"Auth error: {str(e)}")
         raise HTTPException(status_code=401, detail=f"Authentication failed: {str(e)}")
 
+def user_roles(user: AuthenticatedUser) -> set:
+    """
+    The token's `role` claim plus `app_metadata.role` / `app_metadata.roles`.
+    app_metadata can only be set with the service key, so users cannot grant themselves roles.
+    """
+    roles = {user.role} if user.role else set()
+    metadata = user.app_metadata or {}
+    if isinstance(metadata.get("role"), str):
+        roles.add(metadata["role"])
+    if isinstance(metadata.get("roles"), list):
+        roles.update(r for r in metadata["roles"] if isinstance(r, str))
+    return roles
+
 def require_role(role: str):
     """
-    Dependency to check if the user has a specific role (stored in app_metadata or tables).
-    For this MVP, we might mock this or check a 'roles' table if we had one.
-    To allow testing without complex setup, we will skip strict role check enforcement 
-    via DB for now or assume claims are in metadata.
+    Dependency that authenticates the caller and requires `role` (see user_roles), e.g.
+    set app_metadata = {"role": "admin"} on the operators' Supabase users.
     """
     async def role_checker(user = Depends(get_current_user)):
-        # Simplified: In real app, check user.app_metadata.get('role') == role
-        # For Hackathon MVP: We trust the user is authenticated. 
-        # If we need specific roles, we'd check here.
+        if role not in user_roles(user):
+            raise HTTPException(status_code=403, detail=f"Requires the '{role}' role")
         return user
     return role_checker
@@ -1,156 +1,172 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from typing import List, Optional
 from datetime import datetime, timedelta
+import asyncio
 import json
+import os
 import uuid
 
-from database import get_db
+from database import run_db
+from storage import get_storage
 from models import (
     ConsentGrantRequest, ConsentReceiptResponse, 
-    VerifyReceiptRequest, VerificationResponse, ConsentRevokeRequest
+    VerifyReceiptRequest, VerificationResponse, ConsentRevokeRequest,
+    VerifyReceiptBatchRequest, ConsentCheckRequest, ConsentCheckBatchRequest, ConsentCheckResponse,
+    ConsentGrantBatchRequest, ConsentGrantBatchResult
 )
 from routers.auth import get_current_user
-from utils import sign_payload, generate_hash_chain, verify_signature
+from audit_log import audit_appender
+from shards import shard_for
+from app_registry import app_registry
+from status_cache import status_cache
+from decision_index import decision_index
+from idempotency import idempotency_store
+from utils import sign_payload, signing_key_id, signature_memo_key, signature_memoized, verify_signature
+from signature_cache import signature_cache
+from canonical import canonical_json
+from signing_keys import keyring
+from workers import chunked, map_chunks
 
 router = APIRouter(prefix="/consent", tags=["Consent"])
 
+VERIFY_BATCH_MAX = int(os.environ.get("VERIFY_BATCH_MAX", "10000"))
+VERIFY_BATCH_CHUNK_SIZE = int(os.environ.get("VERIFY_BATCH_CHUNK_SIZE", "250"))
+VERIFY_BATCH_STATUS_CHUNK = int(os.environ.get("VERIFY_BATCH_STATUS_CHUNK", "200"))
+CHECK_BATCH_MAX = int(os.environ.get("CHECK_BATCH_MAX", "10000"))
+GRANT_BATCH_MAX = int(os.environ.get("GRANT_BATCH_MAX", "10000"))
+GRANT_BATCH_SIGN_CHUNK = int(os.environ.get("GRANT_BATCH_SIGN_CHUNK", "250"))
+
+def _build_grant(request: ConsentGrantRequest, user_id: str, app_id: str, app_name: Optional[str]) -> dict:
+    """
+    Consent row, purpose rows and the (unsigned) receipt payload for one grant.
+    IDs are generated here so the receipt can be signed before anything is written.
+    """
+    expiry_time = datetime.utcnow() + timedelta(hours=request.expiry_hours)
+    consent_id = str(uuid.uuid4())
+    consent_data = {
+        "consent_id": consent_id,
+        "user_id": user_id,
+        "app_id": str(app_id),  # Now guaranteed to be a valid UUID
+        "expiry_time": expiry_time.isoformat(),
+        "status": "active"
+    }
+    
+    pk_purposes = []
+    receipt_purposes = []
+    for p in request.purposes:
+        pk_purposes.append({
+            "purpose_code": p.purpose_code,
+            "data_categories": p.data_categories
+        })
+        receipt_purposes.append({
+            "purpose": p.purpose_code,
+            "categories": p.data_categories
+        })
+    
+    receipt_payload = {
+        "version": "1.0",
+        "consent_id": consent_id,
+        "user_id": user_id,
+        "app_id": str(app_id),  # Use resolved UUID
+        "app_name": app_name or str(app_id),  # Include app name for readability
+        "timestamp": datetime.utcnow().isoformat(),
+        "expiry": expiry_time.isoformat(),
+        "purposes": receipt_purposes,
+        "kid": signing_key_id()  # Which keyring key signs (and later verifies) this receipt
+    }
+    return {
+        "consent": consent_data,
+        "purposes": pk_purposes,
+        "receipt_id": str(uuid.uuid4()),
+        "receipt_payload": receipt_payload,
+        "expiry_time": expiry_time,
+    }
+
+def _grant_event(grant: dict, signature: str, receipt_bytes: bytes) -> dict:
+    """The CONSENT_GRANTED audit event that carries a grant's rows (see AuditAppender.append_many)."""
+    consent = grant["consent"]
+    return {
+        "event_type": "CONSENT_GRANTED",
+        "actor_id": consent["user_id"],
+        "actor_type": "USER",
+        "event_payload": grant["receipt_payload"],
+        "grant": {
+            "consent": consent,
+            "purposes": grant["purposes"],
+            "receipt": {
+                "receipt_id": grant["receipt_id"],
+                "signed_payload": grant["receipt_payload"],
+                "signature": signature
+            }
+        },
+        "canonical": receipt_bytes,
+        "shard": shard_for(user_id=consent["user_id"], app_id=consent["app_id"]),
+    }
+
+def _remember_grant(grant: dict) -> None:
+    # Write-through: verifications and checks see the new consent without a DB read
+    consent = grant["consent"]
+    decision_index.add(consent["consent_id"], consent["user_id"], consent["app_id"], grant["expiry_time"], [
+        (p["purpose_code"], p["data_categories"]) for p in grant["purposes"]
+    ])
+
+def _receipt_response(grant: dict, signature: str) -> ConsentReceiptResponse:
+    return ConsentReceiptResponse(
+        receipt_id=grant["receipt_id"],
+        consent_id=grant["consent"]["consent_id"],
+        receipt_payload=grant["receipt_payload"],
+        signature=signature,
+        timestamp=datetime.utcnow()
+    )
+
 @router.post("/grant", response_model=ConsentReceiptResponse)
-async def grant_consent(request: ConsentGrantRequest, user = Depends(get_current_user)):
+async def grant_consent(request: ConsentGrantRequest, response: Response, user = Depends(get_current_user),
+                        idempotency_key: Optional[str] = Header(None)):
     """
     User grants consent to an App.
     Generates a signed receipt and logs the audit event.
+    Consent, purposes, receipt and audit event are written in one database
+    transaction (append_ledger_batch), so a failure leaves nothing behind.
+    With an Idempotency-Key header, a retry returns the first receipt instead of granting again.
     """
+    return await idempotency_store.run(idempotency_key, f"grant:{user.id if user else ''}", request, response,
+                                       lambda: _grant_consent(request, user))
+
+async def _grant_consent(request: ConsentGrantRequest, user) -> ConsentReceiptResponse:
     try:
-        db = get_db()
-        
         # 1. Resolve App ID (handle both UUID and text identifiers)
-        app_id = request.app_id
-        
-        # Check if app_id is a valid UUID
-        try:
-            uuid.UUID(app_id)
-            # It's a valid UUID, check if application exists
-            app_check = db.table("applications").select("app_id").eq("app_id", app_id).execute()
-            if not app_check.data or len(app_check.data) == 0:
-                raise HTTPException(
-                    status_code=404, 
-                    detail=f"Application with ID {app_id} not found. Please create the application first."
-                )
-        except ValueError:
-            # Not a valid UUID, treat as app identifier/name
-            # Look up by app_name or create new application
-            app_lookup = db.table("applications").select("app_id").eq("app_name", app_id).execute()
-            
-            if app_lookup.data and len(app_lookup.data) > 0:
-                # Application exists, use its UUID
-                app_id = app_lookup.data[0]['app_id']
-            else:
-                # Create new application with this identifier as name
-                new_app = db.table("applications").insert({
-                    "app_name": app_id,
-                    "owner_user_id": user.id if user else None,
-                    "verification_status": "pending"
-                }).execute()
-                
-                if not new_app.data:
-                    raise HTTPException(status_code=500, detail="Failed to create application record")
-                
-                app_id = new_app.data[0]['app_id']
-        
-        # 2. Create Consent Record
-        expiry_time = datetime.utcnow() + timedelta(hours=request.expiry_hours)
+        # A UUID must be a registered application; any other string is an app
+        # name, created on first use. Served from the in-memory app registry.
+        app = await app_registry.resolve(request.app_id, owner_user_id=user.id if user else None)
+        if app is None:
+            raise HTTPException(
+                status_code=404, 
+                detail=f"Application with ID {request.app_id} not found. Please create the application first."
+            )
+        app_id, app_name = app
         
         # Use user.id from auth token in production, for now allow request override for testing or use auth
         user_id = user.id if user else request.user_id 
         if not user_id:
             raise HTTPException(status_code=400, detail="User ID required")
 
-        consent_data = {
-            "user_id": user_id,
-            "app_id": app_id,  # Now guaranteed to be a valid UUID
-            "expiry_time": expiry_time.isoformat(),
-            "status": "active"
-        }
-        
-        # Insert into 'consents'
-        res = db.table("consents").insert(consent_data).execute()
-        if not res.data:
-            raise HTTPException(status_code=500, detail="Failed to create consent record")
+        # 2. Prepare Consent Record, Purposes and Receipt Payload
+        grant = _build_grant(request, user_id, app_id, app_name)
         
-        consent_id = res.data[0]['consent_id']
+        # 3. Sign Receipt
+        # Serialized once: the same canonical bytes are signed and hashed into the chain
+        receipt_bytes = canonical_json(grant["receipt_payload"])
+        signature = sign_payload(grant["receipt_payload"], data=receipt_bytes)
         
-        # 3. Add Purposes
-        pk_purposes = []
-        receipt_purposes = []
-        
-        for p in request.purposes:
-            pk_purposes.append({
-                "consent_id": consent_id,
-                "purpose_code": p.purpose_code,
-                "data_categories": p.data_categories
-            })
-            receipt_purposes.append({
-                "purpose": p.purpose_code,
-                "categories": p.data_categories
-            })
-            
-        db.table("consent_purposes").insert(pk_purposes).execute()
+        # 4. Store Consent, Purposes, Receipt and Audit Log (Hash Chaining) atomically
+        # The appender links this event to the chain head it keeps in memory and
+        # group-commits it together with the grant rows; we return once all of it
+        # is durably stored.
+        await audit_appender.append_many([_grant_event(grant, signature, receipt_bytes)])
+        await status_cache.put(grant["consent"]["consent_id"], "active")
+        _remember_grant(grant)
         
-        # 4. Generate Receipt Payload
-        # Get app name for receipt (for readability)
-        app_info = db.table("applications").select("app_name").eq("app_id", app_id).execute()
-        app_name = app_info.data[0]['app_name'] if app_info.data and len(app_info.data) > 0 else str(app_id)
-        
-        receipt_payload = {
-            "version": "1.0",
-            "consent_id": consent_id,
-            "user_id": user_id,
-            "app_id": str(app_id),  # Use resolved UUID
-            "app_name": app_name,  # Include app name for readability
-            "timestamp": datetime.utcnow().isoformat(),
-            "expiry": expiry_time.isoformat(),
-            "purposes": receipt_purposes
-        }
-        
-        # 5. Sign Receipt
-        signature = sign_payload(receipt_payload)
-        
-        # 6. Store Receipt
-        db.table("consent_receipts").insert({
-            "consent_id": consent_id,
-            "signed_payload": receipt_payload,
-            "signature": signature
-        }).execute()
-        
-        # 7. Audit Log (Hash Chaining)
-        # Fetch last event hash
-        try:
-            last_event = db.table("audit_events").select("hash_current").order("timestamp", desc=True).limit(1).execute()
-            prev_hash = last_event.data[0]['hash_current'] if last_event.data and len(last_event.data) > 0 else "0" * 64
-        except Exception as e:
-            # If no events exist yet, start with zero hash
-            prev_hash = "0" * 64
-        
-        current_hash = generate_hash_chain(prev_hash, receipt_payload, receipt_payload['timestamp'])
-        
-        audit_payload = {
-            "event_type": "CONSENT_GRANTED",
-            "actor_id": user_id,
-            "actor_type": "USER",
-            "event_payload": receipt_payload,
-            "hash_prev": prev_hash,
-            "hash_current": current_hash
-        }
-        
-        db.table("audit_events").insert(audit_payload).execute()
-        
-        return ConsentReceiptResponse(
-            receipt_id=str(uuid.uuid4()), # Just a placeholder, actual ID is in DB if needed
-            consent_id=consent_id,
-            receipt_payload=receipt_payload,
-            signature=signature,
-            timestamp=datetime.utcnow()
-        )
+        return _receipt_response(grant, signature)
     except HTTPException:
         # Re-raise HTTP exceptions (like auth errors)
         raise
@@ -161,6 +177,75 @@ async def grant_consent(request: ConsentGrantRequest, user = Depends(get_current
         print(f"Error in grant_consent: {error_details}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+def _sign_receipt_chunk(payloads: List[dict]) -> List[tuple]:
+    # Runs in a worker process: [payload] -> [(canonical bytes, signature)]
+    signed = []
+    for payload in payloads:
+        data = canonical_json(payload)
+        signed.append((data, sign_payload(payload, data=data)))
+    return signed
+
+@router.post("/grant-batch", response_model=List[ConsentGrantBatchResult])
+async def grant_consent_batch(request: ConsentGrantBatchRequest, user = Depends(get_current_user)):
+    """
+    Grants many consents at once (onboarding flows, imports from legacy consent systems).
+    Each item gets the same receipt as /grant, or an error that does not affect the
+    other items. Results are returned in input order.
+    
+    - Every distinct app is resolved once, concurrently, through the app registry.
+    - Receipts are signed in the worker pool, GRANT_BATCH_SIGN_CHUNK per task.
+    - All audit events are queued back to back, so they form one contiguous chain
+      segment (per shard), and are group-committed AUDIT_BATCH_MAX_SIZE at a time, each
+      batch inserting its consents, purposes and receipts in the same transaction.
+      A batch the database rejects is retried event by event, so only bad items fail.
+    """
+    if len(request.grants) > GRANT_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {GRANT_BATCH_MAX} grants per batch")
+    
+    results: List[Optional[ConsentGrantBatchResult]] = [None] * len(request.grants)
+    owner_user_id = user.id if user else None
+    
+    # 1. Resolve App IDs, one lookup per distinct app
+    app_refs = list(dict.fromkeys(g.app_id for g in request.grants))
+    resolved = await asyncio.gather(
+        *(app_registry.resolve(ref, owner_user_id=owner_user_id) for ref in app_refs), return_exceptions=True
+    )
+    apps = dict(zip(app_refs, resolved))
+    
+    # 2. Prepare Consent Records, Purposes and Receipt Payloads
+    pending = []  # (index, grant)
+    for i, item in enumerate(request.grants):
+        app = apps[item.app_id]
+        user_id = user.id if user else item.user_id
+        if isinstance(app, BaseException):
+            results[i] = ConsentGrantBatchResult(ok=False, error=f"Application lookup failed: {app}")
+        elif app is None:
+            results[i] = ConsentGrantBatchResult(ok=False, error=f"Application with ID {item.app_id} not found")
+        elif not user_id:
+            results[i] = ConsentGrantBatchResult(ok=False, error="User ID required")
+        else:
+            pending.append((i, _build_grant(item, user_id, *app)))
+    
+    # 3. Sign Receipts, parallel across worker processes
+    chunks = chunked([grant["receipt_payload"] for _, grant in pending], GRANT_BATCH_SIGN_CHUNK)
+    signed = [s for chunk in await map_chunks(_sign_receipt_chunk, chunks) for s in chunk]
+    
+    # 4. Store everything through the appender as one run of events
+    events = [_grant_event(grant, signature, data) for (_, grant), (data, signature) in zip(pending, signed)]
+    stored = await audit_appender.append_many(events, return_exceptions=True)
+    
+    granted = {}
+    for (i, grant), (_, signature), row in zip(pending, signed, stored):
+        if isinstance(row, BaseException):
+            results[i] = ConsentGrantBatchResult(ok=False, error=f"Grant failed: {row}")
+            continue
+        granted[grant["consent"]["consent_id"]] = "active"
+        _remember_grant(grant)
+        results[i] = ConsentGrantBatchResult(ok=True, receipt=_receipt_response(grant, signature))
+    await status_cache.put_many(granted)
+    
+    return results
+
 @router.post("/verify", response_model=VerificationResponse)
 async def verify_receipt(request: VerifyReceiptRequest):
     """
@@ -185,31 +270,46 @@ async def verify_receipt(request: VerifyReceiptRequest):
     # Attempt to extract signature if embedded, or fail.
     # Retrying logic: Let's assume the client sends the output of /grant.
     
-    if "receipt_payload" not in payload or "signature" not in payload:
-         return VerificationResponse(valid=False, status="invalid_format", message="Missing payload or signature")
-         
-    actual_payload = payload["receipt_payload"]
-    signature = payload["signature"]
+    parts = _receipt_parts(payload)
+    if isinstance(parts, VerificationResponse):
+        return parts
+    actual_payload, signature = parts
     
     if not verify_signature(actual_payload, signature):
         return VerificationResponse(valid=False, status="invalid_signature", message="Cryptographic verification failed")
         
     # 2. Expiry Check
-    expiry_str = actual_payload.get("expiry")
+    expired = _expiry_result(actual_payload)
+    if expired:
+        return expired
+            
+    # 3. Status Check (Revocation) - Stateful, served from the status cache when possible
+    consent_id = str(actual_payload.get("consent_id"))
+    status = await status_cache.get(consent_id)
+    if status is None:
+        status = (await run_db(get_storage().consent_statuses, [consent_id])).get(consent_id)
+        if status is not None:
+            await status_cache.put(consent_id, status)
+    return _status_result(status)
+
+def _receipt_parts(receipt: dict):
+    """Splits a /grant response into (payload, signature), or returns the invalid_format result."""
+    if not isinstance(receipt, dict) or not isinstance(receipt.get("receipt_payload"), dict) or "signature" not in receipt:
+         return VerificationResponse(valid=False, status="invalid_format", message="Missing payload or signature")
+    return receipt["receipt_payload"], receipt["signature"]
+
+def _expiry_result(payload: dict) -> Optional[VerificationResponse]:
+    expiry_str = payload.get("expiry")
     if expiry_str:
         expiry = datetime.fromisoformat(expiry_str)
         if datetime.utcnow() > expiry:
             return VerificationResponse(valid=False, status="expired", message="Consent has expired")
-            
-    # 3. Status Check (Revocation) - Stateful
-    consent_id = actual_payload.get("consent_id")
-    db = get_db()
-    
-    res = db.table("consents").select("status").eq("consent_id", consent_id).execute()
-    if not res.data:
+    return None
+
+def _status_result(status: Optional[str]) -> VerificationResponse:
+    if status is None:
         return VerificationResponse(valid=False, status="unknown", message="Consent ID not found in ledger")
         
-    status = res.data[0]['status']
     if status == 'revoked':
         return VerificationResponse(valid=False, status="revoked", message="Consent has been revoked by user")
         
@@ -218,48 +318,166 @@ async def verify_receipt(request: VerifyReceiptRequest):
         
     return VerificationResponse(valid=True, status="active", message="Consent is valid and active")
 
+def _verify_signature_chunk(items: List[tuple]) -> List[bool]:
+    # Runs in a worker process: [(payload, signature)] -> [valid]. The signature cache
+    # lives in the API process (see verify_receipts_batch), so workers don't memoize.
+    return [verify_signature(payload, signature, memoize=False) for payload, signature in items]
+
+def _memoized_signatures(items: List[tuple]) -> tuple:
+    """
+    Signature cache lookups for [(payload, signature)]: returns ([hit], [cache key]).
+    A key is None where the cache is off or the payload can't be serialized.
+    """
+    hits, keys = [], []
+    for payload, signature in items:
+        kid = payload.get("kid")
+        try:
+            key = signature_memo_key(canonical_json(payload), signature, kid)
+        except Exception:
+            key = None
+        keys.append(key)
+        hits.append(key is not None and signature_memoized(key, kid))
+    return hits, keys
+
+async def _fetch_statuses(consent_ids: List[str]) -> dict:
+    """consent_id -> status from the status cache, then one `in` query per chunk of misses."""
+    statuses = await status_cache.get_many(consent_ids)
+    missing = [c for c in consent_ids if c not in statuses]
+    store = get_storage()
+    for chunk in chunked(missing, VERIFY_BATCH_STATUS_CHUNK):
+        found = await run_db(store.consent_statuses, list(chunk))
+        statuses.update(found)
+        await status_cache.put_many(found)
+    return statuses
+
+@router.post("/verify-batch", response_model=List[VerificationResponse])
+async def verify_receipts_batch(request: VerifyReceiptBatchRequest):
+    """
+    Verifies many receipts at once (e.g. before a data-processing job).
+    Same checks as /verify, but signatures not in the signature cache are checked in
+    the worker pool and revocation statuses are resolved with one `in` query per chunk of consent IDs.
+    Results are returned in input order.
+    """
+    if len(request.receipts) > VERIFY_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {VERIFY_BATCH_MAX} receipts per batch")
+    
+    results: List[Optional[VerificationResponse]] = [None] * len(request.receipts)
+    pending = []  # (index, payload, signature)
+    for i, receipt in enumerate(request.receipts):
+        parts = _receipt_parts(receipt)
+        if isinstance(parts, VerificationResponse):
+            results[i] = parts
+        else:
+            pending.append((i, *parts))
+    
+    # 1. Crypto Check: receipts verified before come from the signature cache,
+    # the rest are checked in parallel across worker processes
+    items = [(payload, signature) for _, payload, signature in pending]
+    checks, memo_keys = await asyncio.to_thread(_memoized_signatures, items)
+    misses = [j for j, hit in enumerate(checks) if not hit]
+    signature_chunks = chunked([items[j] for j in misses], VERIFY_BATCH_CHUNK_SIZE)
+    verified = [ok for chunk in await map_chunks(_verify_signature_chunk, signature_chunks) for ok in chunk]
+    for j, ok in zip(misses, verified):
+        checks[j] = ok
+        if ok and memo_keys[j] is not None:
+            signature_cache.remember(memo_keys[j])
+    
+    # 2. Expiry Check
+    needs_status = []
+    for (i, payload, _), ok in zip(pending, checks):
+        if not ok:
+            results[i] = VerificationResponse(valid=False, status="invalid_signature", message="Cryptographic verification failed")
+            continue
+        results[i] = _expiry_result(payload)
+        if results[i] is None:
+            needs_status.append((i, str(payload.get("consent_id"))))
+    
+    # 3. Status Check (Revocation), batched
+    if needs_status:
+        statuses = await _fetch_statuses(list({cid for _, cid in needs_status}))
+        for i, consent_id in needs_status:
+            results[i] = _status_result(statuses.get(consent_id))
+    
+    return results
+
+async def _authorize_checks(user, checks: List[ConsentCheckRequest]) -> None:
+    """
+    Decisions reveal who consented to what, so a caller only gets them for its own
+    consents (user_id) or for applications it owns (applications.owner_user_id).
+    """
+    caller = str(user.id).lower()
+    apps = {c.app_id for c in checks if str(c.user_id).lower() != caller}
+    owners = await asyncio.gather(*(app_registry.owner(app_id) for app_id in apps))
+    if any(owner is None or owner.lower() != caller for owner in owners):
+        raise HTTPException(
+            status_code=403,
+            detail="Consent decisions are only available for your own consents or applications you own"
+        )
+
+@router.post("/check", response_model=ConsentCheckResponse)
+async def check_consent(request: ConsentCheckRequest, user = Depends(get_current_user)):
+    """
+    May app `app_id` process `data_categories` of user `user_id` for `purpose_code` right now?
+    Answered from the in-memory decision index (decision_index.py); falls back to the
+    database only while the index is warming up. Callers must be the user or own the app.
+    """
+    await _authorize_checks(user, [request])
+    return await decision_index.check(request.user_id, request.app_id, request.purpose_code, request.data_categories)
+
+@router.post("/check-batch", response_model=List[ConsentCheckResponse])
+async def check_consent_batch(request: ConsentCheckBatchRequest, user = Depends(get_current_user)):
+    """
+    Up to CHECK_BATCH_MAX decisions at once, returned in input order.
+    The whole batch is refused (403) if any check is for another user's consent to an
+    application the caller does not own.
+    """
+    if len(request.checks) > CHECK_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {CHECK_BATCH_MAX} checks per batch")
+    await _authorize_checks(user, request.checks)
+    return await decision_index.check_many([c.model_dump() for c in request.checks])
+
+@router.get("/keys")
+async def get_signing_keys():
+    """
+    Public keys for offline receipt verification, indexed by the `kid` stamped into receipts.
+    Ed25519 keys sign the canonical JSON directly; RSA keys use PSS with SHA-256.
+    """
+    return {"keys": keyring.public_keys()}
+
 @router.post("/revoke")
-async def revoke_consent(request: ConsentRevokeRequest, user = Depends(get_current_user)):
+async def revoke_consent(request: ConsentRevokeRequest, response: Response, user = Depends(get_current_user),
+                         idempotency_key: Optional[str] = Header(None)):
     """
     Revokes a consent.
+    With an Idempotency-Key header, a retry returns the first response instead of revoking again.
     """
-    db = get_db()
-    
+    return await idempotency_store.run(idempotency_key, f"revoke:{user.id if user else ''}", request, response,
+                                       lambda: _revoke_consent(request, user))
+
+async def _revoke_consent(request: ConsentRevokeRequest, user) -> dict:
     # Update status
-    res = db.table("consents").update({
-        "status": "revoked",
-        "revoked_at": datetime.utcnow().isoformat()
-    }).eq("consent_id", request.consent_id).execute()
+    revoked = await run_db(get_storage().revoke_consent, request.consent_id, datetime.utcnow().isoformat())
     
-    if not res.data:
+    if not revoked:
         raise HTTPException(status_code=404, detail="Consent not found")
-        
-    # Audit Log
-    # Fetch last event hash
-    try:
-        last_event = db.table("audit_events").select("hash_current").order("timestamp", desc=True).limit(1).execute()
-        prev_hash = last_event.data[0]['hash_current'] if last_event.data and len(last_event.data) > 0 else "0" * 64
-    except Exception as e:
-        # If no events exist yet, start with zero hash
-        prev_hash = "0" * 64
     
+    # Write-through: later verifications see the revocation without a DB read
+    await status_cache.put(request.consent_id, "revoked")
+    decision_index.remove(request.consent_id)
+        
+    # Audit Log (linked and group-committed by the single-writer appender)
     event_payload = {
         "consent_id": request.consent_id,
         "action": "REVOKE",
         "reason": request.reason
     }
     
-    timestamp = datetime.utcnow().isoformat()
-    current_hash = generate_hash_chain(prev_hash, event_payload, timestamp)
-    
-    db.table("audit_events").insert({
-        "event_type": "CONSENT_REVOKED",
-        "actor_id": user.id if user else "system",
-        "actor_type": "USER",
-        "event_payload": event_payload,
-        "timestamp": timestamp,
-        "hash_prev": prev_hash,
-        "hash_current": current_hash
-    }).execute()
+    await audit_appender.append(
+        event_type="CONSENT_REVOKED",
+        actor_id=user.id if user else "system",
+        actor_type="USER",
+        event_payload=event_payload,
+        shard=shard_for(user_id=revoked.get("user_id"), app_id=revoked.get("app_id")),
+    )
     
     return {"status": "revoked", "consent_id": request.consent_id}
@@ -11,6 +11,10 @@ create table if not exists applications (
     created_at timestamptz default now()
 );
 
+-- One application per name: API workers that create the same app concurrently
+-- collide here, and the loser selects the winner's row
+create unique index if not exists applications_name_key on applications (app_name);
+
 -- 2. PURPOSES TABLE
 -- Standardized purposes for consent (Data Minimization principle)
 create table if not exists purposes (
@@ -38,6 +42,11 @@ create table if not exists consents (
     revoked_at timestamptz
 );
 
+-- Expiry sweeper (sweeper.py): active consents past expiry_time, oldest first
+create index if not exists consents_status_expiry_idx on consents (status, expiry_time);
+-- /consent/check fallback lookups by (user, app)
+create index if not exists consents_user_app_idx on consents (user_id, app_id);
+
 -- 4. CONSENT PURPOSES
 -- Many-to-Many link between Consent and Purposes, defining scope
 create table if not exists consent_purposes (
@@ -47,6 +56,8 @@ create table if not exists consent_purposes (
     data_categories text[] not null -- Array of strings e.g., ['email', 'location']
 );
 
+create index if not exists consent_purposes_consent_idx on consent_purposes (consent_id);
+
 -- 5. CONSENT RECEIPTS
 -- Immutable cryptographic proof of the consent grant
 create table if not exists consent_receipts (
@@ -67,9 +78,100 @@ create table if not exists audit_events (
     event_payload jsonb not null, -- Context of the event
     timestamp timestamptz default now(),
     hash_prev text, -- Hash of the previous event (Hash Chain)
-    hash_current text not null -- Hash of this event + prev_hash
+    hash_current text not null, -- Hash of this event + prev_hash
+    hash_version smallint not null default 1, -- Hash format (canonical.py): 1 legacy, 2 streaming over canonical JSON
+    shard smallint not null default 0 -- Which chain the event links into (AUDIT_SHARDS, shards.py); 0 when unsharded
+);
+
+-- For ledgers created before hash versions existed (their events are all format 1)
+alter table audit_events add column if not exists hash_version smallint not null default 1;
+-- For ledgers created before sharding (every existing event is on shard 0)
+alter table audit_events add column if not exists shard smallint not null default 0;
+
+-- 7. AUDIT CHECKPOINTS
+-- Progress marker for incremental hash-chain verification (/audit/verify-chain).
+-- Verification resumes after last_event_id instead of re-hashing the whole ledger.
+create table if not exists audit_checkpoints (
+    checkpoint_id text primary key, -- 'global' for the main chain; 'shard-N' and 'anchors' on sharded ledgers
+    last_event_id uuid,
+    last_timestamp timestamptz not null,
+    last_hash text not null, -- hash_current of last_event_id when it was verified
+    verified_count bigint not null default 0, -- Events verified from genesis up to last_event_id
+    updated_at timestamptz default now()
+);
+
+-- Keyset order used by chain verification (and unfiltered /audit/events, scanned backwards)
+create index if not exists audit_events_chain_order_idx on audit_events (timestamp, event_id);
+
+-- /audit/events filters: each one seeks straight to its newest page in (timestamp, event_id) order
+create index if not exists audit_events_actor_idx on audit_events (actor_id, timestamp, event_id);
+create index if not exists audit_events_type_idx on audit_events (event_type, timestamp, event_id);
+create index if not exists audit_events_consent_idx on audit_events ((event_payload ->> 'consent_id'), timestamp, event_id);
+
+-- Per-shard chain order: shard heads and per-shard verification
+create index if not exists audit_events_shard_idx on audit_events (shard, timestamp, event_id);
+
+-- Signed commitments to every shard head (sharded ledgers only, see shards.py).
+-- root_hash = SHA256 over (anchor_seq, prev_root, shard head hashes); prev_root links each anchor to the one before.
+create table if not exists audit_anchors (
+    anchor_seq bigint primary key, -- 1, 2, 3... without gaps
+    root_hash text not null,
+    signed_payload jsonb not null, -- {anchor_seq, prev_root, root_hash, heads: [{shard, event_id, timestamp, hash}], timestamp, kid}
+    signature text not null,
+    created_at timestamptz default now()
+);
+
+-- Only the process holding the lease writes a sharded ledger (see shards.py)
+create table if not exists writer_leases (
+    name text primary key,
+    owner text not null, -- host:pid:nonce of the holder
+    expires_at timestamptz not null
+);
+
+-- 8. MERKLE INDEX
+-- Append-only Merkle tree over audit_events (in commit order) for O(log n) proofs.
+-- Written with each ledger batch by append_merkle_leaves() (ledger_functions.sql).
+-- Leaf = SHA256(0x00 || "<event_id>:<hash_current>"), node = SHA256(0x01 || left || right).
+create table if not exists merkle_leaves (
+    leaf_index bigint primary key, -- Position in commit order, starting at 0
+    event_id uuid not null unique,
+    consent_id uuid, -- Copied from event_payload for consent lookups
+    leaf_hash text not null
 );
 
+create index if not exists merkle_leaves_consent_idx on merkle_leaves (consent_id);
+
+-- Perfect subtree hashes per level (level 0 = leaves)
+create table if not exists merkle_nodes (
+    level int not null,
+    node_index bigint not null,
+    hash text not null,
+    primary key (level, node_index)
+);
+
+-- Periodically signed tree heads
+create table if not exists merkle_roots (
+    tree_size bigint primary key,
+    root_hash text not null,
+    signed_payload jsonb not null, -- {tree_size, root_hash, timestamp, kid}
+    signature text not null,
+    created_at timestamptz default now()
+);
+
+-- 9. IDEMPOTENCY KEYS
+-- First response per Idempotency-Key on /consent/grant and /consent/revoke (IDEMPOTENCY_BACKEND=table).
+-- A 'pending' row claims the key while the first request runs; expired rows are purged.
+create table if not exists idempotency_keys (
+    idempotency_key text primary key, -- SHA256 of route, caller and the client's key
+    fingerprint text not null, -- SHA256 of the request body; a reused key with another body is rejected
+    state text not null default 'pending' check (state in ('pending', 'complete')),
+    response jsonb, -- Response body, once complete
+    expires_at timestamptz not null,
+    created_at timestamptz default now()
+);
+
+create index if not exists idempotency_keys_expires_idx on idempotency_keys (expires_at);
+
 -- RLS POLICIES (Example: Users can only see their own consents)
 alter table consents enable row level security;
 
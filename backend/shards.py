@@ -0,0 +1,401 @@
+"""
+Partitioned audit ledger.
+
+With AUDIT_SHARDS > 1, audit_events holds that many independent hash chains: every
+event is routed by a stable hash of its app_id (or user_id) to one shard and links to
+that shard's head only, so writes to different shards proceed in parallel. A periodic
+anchor commits every shard head into a signed global root; each anchor also commits
+the previous anchor's root, so the anchors form a chain of their own.
+
+The shard writers keep one global (timestamp, event_id) order only within a process:
+they share a clock, and batches are published in link order. Writers in several
+processes would commit events out of that order, and the tailers that page by it (the
+live stream poller, the decision index sync) would skip late commits for good. A
+sharded ledger therefore has a single writer process, enforced by a lease in
+writer_leases (WriterLease).
+"""
+import os
+import time
+import uuid
+import socket
+import asyncio
+import hashlib
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from database import run_db
+from storage import get_storage
+from canonical import canonical_json
+from chain import GENESIS_HASH, recompute_hash
+from utils import parse_timestamp, sign_payload, signing_key_id, verify_signature
+
+AUDIT_SHARDS = max(1, int(os.environ.get("AUDIT_SHARDS", "1")))
+# "app" (default) keeps all events of an application on one chain; "user" spreads them by data principal
+AUDIT_SHARD_KEY = os.environ.get("AUDIT_SHARD_KEY", "app").lower()
+AUDIT_ANCHOR_INTERVAL_SECONDS = float(os.environ.get("AUDIT_ANCHOR_INTERVAL_SECONDS", "60"))
+# How long the writer lease outlives its holder (renewed every third of it)
+AUDIT_WRITER_LEASE_SECONDS = float(os.environ.get("AUDIT_WRITER_LEASE_SECONDS", "30"))
+
+ANCHOR_CHECKPOINT_ID = "anchors"
+WRITER_LEASE_NAME = "audit-writer"
+
+class WriterLeaseError(RuntimeError):
+    """The lease for writing a sharded ledger is held by another process (or was lost to one)."""
+
+def sharded() -> bool:
+    return AUDIT_SHARDS > 1
+
+def shard_for(user_id=None, app_id=None, shards: int = AUDIT_SHARDS) -> int:
+    """
+    The shard an event belongs to. Stable across processes and restarts (SHA-256 of the
+    key, not Python's hash()). Events without the key (e.g. system events) go to shard 0.
+    """
+    key = user_id if AUDIT_SHARD_KEY == "user" else app_id
+    if shards <= 1 or not key:
+        return 0
+    digest = hashlib.sha256(str(key).lower().encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % shards
+
+def shard_checkpoint_id(shard: int) -> str:
+    return f"shard-{shard}"
+
+def anchor_root(anchor_seq: int, prev_root: str, heads: List[dict]) -> str:
+    """SHA-256 over the anchor's position, the previous root and every shard head hash (in shard order)."""
+    committed = {
+        "anchor_seq": anchor_seq,
+        "prev_root": prev_root,
+        "heads": [[h["shard"], h["hash"]] for h in heads],
+    }
+    return hashlib.sha256(canonical_json(committed)).hexdigest()
+
+# --- anchoring ---
+
+def _shard_heads(store, shards: int) -> List[dict]:
+    heads = []
+    for shard in range(shards):
+        head = store.latest_audit_event(shard)
+        heads.append({
+            "shard": shard,
+            "event_id": str(head["event_id"]) if head else None,
+            "timestamp": str(head["timestamp"]) if head else None,
+            "hash": head["hash_current"] if head else GENESIS_HASH,
+        })
+    return heads
+
+def create_anchor(store=None, shards: int = AUDIT_SHARDS, force: bool = False) -> Optional[dict]:
+    """
+    Signs the current shard heads as the next anchor and stores it.
+    Returns None (and stores nothing) when no head moved since the last anchor, unless `force`.
+    """
+    store = store or get_storage()
+    last = store.audit_anchor()
+    heads = _shard_heads(store, shards)
+    if last and not force and [h["hash"] for h in last["signed_payload"]["heads"]] == [h["hash"] for h in heads]:
+        return None
+    anchor_seq = last["anchor_seq"] + 1 if last else 1
+    prev_root = last["root_hash"] if last else GENESIS_HASH
+    payload = {
+        "anchor_seq": anchor_seq,
+        "prev_root": prev_root,
+        "root_hash": anchor_root(anchor_seq, prev_root, heads),
+        "heads": heads,
+        "timestamp": datetime.utcnow().isoformat(),
+        "kid": signing_key_id(),
+    }
+    anchor = {
+        "anchor_seq": anchor_seq,
+        "root_hash": payload["root_hash"],
+        "signed_payload": payload,
+        "signature": sign_payload(payload),
+    }
+    # Insert, never upsert: if another process took this anchor_seq first, ours is dropped
+    store.save_audit_anchor(anchor)
+    return anchor
+
+class ShardAnchorer:
+    """Background task that anchors the shard heads every `interval` seconds (while they move)."""
+
+    def __init__(self, interval: float = AUDIT_ANCHOR_INTERVAL_SECONDS):
+        self.interval = max(1.0, interval)
+        self._task: Optional[asyncio.Task] = None
+        self.anchors = 0
+        self.last_anchor: Optional[int] = None
+
+    def start(self) -> None:
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if not self._task:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.anchor()
+            except Exception as e:
+                print(f"Shard anchoring failed (retried in {self.interval:g}s): {e}")
+
+    async def anchor(self, force: bool = False) -> Optional[dict]:
+        anchor = await run_db(lambda: create_anchor(force=force))
+        if anchor:
+            self.anchors += 1
+            self.last_anchor = anchor["anchor_seq"]
+        return anchor
+
+    def stats(self) -> dict:
+        return {
+            "shards": AUDIT_SHARDS,
+            "shard_key": AUDIT_SHARD_KEY,
+            "running": bool(self._task and not self._task.done()),
+            "anchors_created": self.anchors,
+            "last_anchor": self.last_anchor,
+            "interval_seconds": self.interval,
+        }
+
+shard_anchorer = ShardAnchorer()
+
+# --- single writer ---
+
+class WriterLease:
+    """
+    Makes this process the only writer of a sharded ledger.
+
+    acquire() claims the writer_leases row (WriterLeaseError if another live process
+    holds it) and renews it in the background. Shard writers call check() before every
+    write; it fails once the lease may have expired unrenewed, a third of the lease
+    before another process could take it over, so two processes never write at once.
+    """
+
+    def __init__(self, ttl: float = AUDIT_WRITER_LEASE_SECONDS, name: str = WRITER_LEASE_NAME):
+        self.ttl = max(3.0, ttl)
+        self.name = name
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._valid_until = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self.renewals = 0
+
+    def _claim(self) -> bool:
+        started = time.monotonic()
+        expires_at = datetime.utcnow() + timedelta(seconds=self.ttl)
+        held = get_storage().claim_writer_lease({"name": self.name, "owner": self.owner,
+                                                 "expires_at": expires_at.isoformat()})
+        self._valid_until = started + self.ttl * 2 / 3 if held else 0.0
+        return held
+
+    def held(self) -> bool:
+        return time.monotonic() < self._valid_until
+
+    def check(self) -> None:
+        if not self.held():
+            raise WriterLeaseError("This process does not hold the writer lease of the sharded audit ledger")
+
+    async def acquire(self) -> None:
+        if not await run_db(self._claim):
+            raise WriterLeaseError(
+                f"Another process holds the writer lease of the sharded audit ledger (AUDIT_SHARDS={AUDIT_SHARDS}). "
+                "Run a sharded ledger from a single API process."
+            )
+        if not self._task or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def release(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._valid_until:
+            self._valid_until = 0.0
+            await run_db(get_storage().release_writer_lease, self.name, self.owner)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            try:
+                if await run_db(self._claim):
+                    self.renewals += 1
+                else:
+                    print("Audit writer lease was taken by another process; sharded writes are refused")
+            except Exception as e:
+                print(f"Audit writer lease renewal failed (retried in {self.ttl / 3:g}s): {e}")
+
+    def stats(self) -> dict:
+        return {
+            "owner": self.owner,
+            "held": self.held(),
+            "renewals": self.renewals,
+            "ttl_seconds": self.ttl,
+        }
+
+writer_lease = WriterLease()
+
+# --- verification ---
+
+class AnchorVerifier:
+    """
+    Verifies the anchor sequence fed in anchor_seq order, page by page.
+
+    Checks:
+    1. Anchors are numbered without gaps (none deleted)
+    2. Each anchor's prev_root matches the previous anchor's root (anchor linkage)
+    3. Each root_hash matches the recomputed root over its shard heads
+    4. Each anchor's signature verifies
+    5. No shard head moves backwards between anchors (history was not rolled back)
+    """
+
+    def __init__(self, prev: Optional[dict] = None):
+        self.prev = prev
+        self.count = 0
+        self.violations: List[dict] = []
+        self.critical = 0
+
+    def feed(self, anchors: List[dict], signatures_ok: List[bool]) -> None:
+        for anchor, signature_ok in zip(anchors, signatures_ok):
+            self._check(anchor, signature_ok)
+
+    def _check(self, anchor: dict, signature_ok: bool) -> None:
+        seq = anchor["anchor_seq"]
+        payload = anchor["signed_payload"]
+        expected_seq = self.prev["anchor_seq"] + 1 if self.prev else 1
+        expected_prev = self.prev["root_hash"] if self.prev else GENESIS_HASH
+
+        if seq != expected_seq:
+            self._violation(seq, "Anchor Missing - Anchor sequence has a gap",
+                            f"Expected anchor {expected_seq}, found {seq}. Possible deletion.")
+        if payload.get("prev_root") != expected_prev:
+            self._violation(seq, "Anchor Link Broken - Previous root mismatch",
+                            "The anchor does not commit the previous anchor's root.")
+        heads = payload.get("heads") or []
+        recomputed = anchor_root(seq, payload.get("prev_root"), heads)
+        if recomputed != anchor["root_hash"] or recomputed != payload.get("root_hash"):
+            self._violation(seq, "Anchor Root Mismatch",
+                            "The root hash does not match the shard heads it claims to commit.")
+        if not signature_ok:
+            self._violation(seq, "Anchor Signature Invalid",
+                            "The anchor's signature does not verify against its signed payload.")
+        if self.prev:
+            before = {h["shard"]: h for h in self.prev["signed_payload"].get("heads") or []}
+            for head in heads:
+                old = before.get(head["shard"])
+                if not old or not old["timestamp"]:
+                    continue
+                if not head["timestamp"] or parse_timestamp(head["timestamp"]) < parse_timestamp(old["timestamp"]):
+                    self._violation(seq, "Shard Head Moved Backwards",
+                                    f"Shard {head['shard']}'s head is older than in anchor {self.prev['anchor_seq']}. "
+                                    "Anchored history may have been rolled back.")
+
+        self.prev = anchor
+        self.count += 1
+
+    def _violation(self, anchor_seq: int, reason: str, details: str) -> None:
+        self.add_violation({"anchor_seq": anchor_seq, "reason": reason, "details": details, "severity": "CRITICAL"})
+
+    def add_violation(self, violation: dict) -> None:
+        if violation.get("severity") == "CRITICAL":
+            self.critical += 1
+        self.violations.append(violation)
+
+def head_violations(anchor: dict, store) -> List[dict]:
+    """
+    Checks that every shard head committed by `anchor` is still in the ledger, on its
+    shard, with the hash it had when anchored. Rewriting anything before a head changes
+    the head's hash, so this covers all anchored history.
+    """
+    violations = []
+    for head in anchor["signed_payload"].get("heads") or []:
+        if not head.get("event_id"):
+            continue
+        event = store.get_audit_event(head["event_id"])
+        if event is None:
+            violations.append({
+                "anchor_seq": anchor["anchor_seq"],
+                "shard": head["shard"],
+                "event_id": head["event_id"],
+                "reason": "Anchored Event Missing",
+                "details": "A shard head committed by the latest anchor no longer exists. Possible deletion.",
+                "severity": "CRITICAL"
+            })
+            continue
+        moved = (event.get("shard") or 0) != head["shard"]
+        if moved or event["hash_current"] != head["hash"] or recompute_hash(event) != head["hash"]:
+            violations.append({
+                "anchor_seq": anchor["anchor_seq"],
+                "shard": head["shard"],
+                "event_id": head["event_id"],
+                "reason": "Anchor Mismatch - Anchored history was modified",
+                "details": "A shard head no longer matches the hash committed by the latest anchor.",
+                "expected_hash": head["hash"],
+                "found_hash": event["hash_current"],
+                "severity": "CRITICAL"
+            })
+    return violations
+
+def _verify_signatures(anchors: List[dict]) -> List[bool]:
+    # Integrity audits always run the crypto (no signature cache)
+    return [verify_signature(a["signed_payload"], a["signature"], memoize=False) for a in anchors]
+
+async def verify_anchors(full: bool = False, page_size: int = 1000) -> dict:
+    """
+    Verifies anchors appended since the anchor checkpoint (all of them with `full`),
+    then re-checks the latest anchor's shard heads against the ledger.
+    """
+    store = get_storage()
+    checkpoint = None if full else await run_db(store.get_checkpoint, ANCHOR_CHECKPOINT_ID)
+    prev = None
+    if checkpoint:
+        prev = await run_db(store.audit_anchor, checkpoint["verified_count"])
+    verifier = AnchorVerifier(prev)
+    if checkpoint and (prev is None or prev["root_hash"] != checkpoint["last_hash"]):
+        verifier.add_violation({
+            "anchor_seq": checkpoint["verified_count"],
+            "reason": "Anchor Checkpoint Mismatch - Verified anchors were modified",
+            "details": "The last verified anchor is missing or its root changed. Run a full re-verification.",
+            "severity": "CRITICAL"
+        })
+
+    seq = checkpoint["verified_count"] if checkpoint else 0
+    while True:
+        anchors = await run_db(store.audit_anchors_after, seq, page_size)
+        verifier.feed(anchors, await run_db(_verify_signatures, anchors))
+        if len(anchors) < page_size:
+            break
+        seq = anchors[-1]["anchor_seq"]
+
+    latest = verifier.prev
+    if latest:
+        for violation in await run_db(head_violations, latest, store):
+            verifier.add_violation(violation)
+
+    if latest and verifier.critical == 0:
+        # Only a fully clean run moves the checkpoint
+        await run_db(store.save_checkpoint, {
+            "checkpoint_id": ANCHOR_CHECKPOINT_ID,
+            "last_event_id": None,
+            "last_timestamp": latest["signed_payload"]["timestamp"],
+            "last_hash": latest["root_hash"],
+            "verified_count": latest["anchor_seq"],
+            "updated_at": datetime.utcnow().isoformat()
+        })
+    elif full:
+        # The anchor sequence does not verify from the first anchor: drop any stale checkpoint
+        await run_db(store.delete_checkpoint, ANCHOR_CHECKPOINT_ID)
+
+    return {
+        "anchors_verified": verifier.count,
+        "latest_anchor": latest["anchor_seq"] if latest else None,
+        "root_hash": latest["root_hash"] if latest else None,
+        "violations": verifier.violations,
+        "critical_violations": verifier.critical,
+        "status": "TAMPERED" if verifier.critical else ("VALID" if latest else "EMPTY"),
+    }
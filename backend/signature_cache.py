@@ -0,0 +1,60 @@
+import os
+import sys
+import hashlib
+from typing import Optional
+
+from cache import TTLCache
+
+# Memo of receipt signatures that verified, so a receipt presented again and again to
+# /consent/verify costs a SHA-256 instead of a public-key verification.
+# SIGNATURE_CACHE_SIZE=0 disables it.
+SIGNATURE_CACHE_SIZE = int(os.environ.get("SIGNATURE_CACHE_SIZE", "100000"))
+SIGNATURE_CACHE_TTL = float(os.environ.get("SIGNATURE_CACHE_TTL", "3600"))
+
+# Per-entry bookkeeping of the LRU map beyond key and value objects (hash table slot
+# plus ordering links); used for the memory estimate only
+_ENTRY_OVERHEAD_BYTES = 104
+
+class SignatureCache:
+    """
+    Bounded LRU/TTL set of digests over (canonical payload, signature, kid) that passed
+    signature verification. A hit means these exact bytes were verified with this key
+    before, so the crypto (and the Base64 decode) is skipped. Only successes are stored.
+    Nothing time-dependent is cached: callers still check expiry and revocation on
+    every request.
+    """
+
+    def __init__(self, maxsize: int = SIGNATURE_CACHE_SIZE, ttl: float = SIGNATURE_CACHE_TTL):
+        self.enabled = maxsize > 0
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    @staticmethod
+    def digest(data: bytes, signature_b64: str, kid: Optional[str]) -> bytes:
+        h = hashlib.sha256()
+        h.update(len(data).to_bytes(8, "big"))
+        h.update(data)
+        h.update(b"\x00")
+        h.update(str(signature_b64).encode("utf-8"))
+        h.update(b"\x00")
+        h.update(str(kid or "").encode("utf-8"))
+        return h.digest()
+
+    def seen(self, digest: bytes) -> bool:
+        return self.enabled and self.cache.get(digest) is not None
+
+    def remember(self, digest: bytes) -> None:
+        if self.enabled:
+            self.cache.set(digest, True)
+
+    def clear(self) -> None:
+        self.cache.clear()
+
+    def memory_bytes(self) -> int:
+        """Approximate memory held by the entries."""
+        entry = sys.getsizeof(bytes(32)) + sys.getsizeof((True, 0.0)) + sys.getsizeof(0.0) + _ENTRY_OVERHEAD_BYTES
+        return len(self.cache) * entry
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, **self.cache.stats(), "approx_memory_bytes": self.memory_bytes()}
+
+signature_cache = SignatureCache()
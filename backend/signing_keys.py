@@ -0,0 +1,185 @@
+import os
+import time
+import hashlib
+import threading
+from typing import Dict, List, Optional
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, padding, rsa
+
+# --- KEYRING CONFIGURATION ---
+# Keys are PEM files in SIGNING_KEYS_DIR, shared by every worker and kept across restarts:
+#   *.pem      private keys (PKCS8) - can sign and verify
+#   *.pub.pem  public keys of retired signers - verify only
+# If the directory holds no private key, one is generated on first use with
+# SIGNING_ALGORITHM ("Ed25519" or "RSA-PSS"). SIGNING_KEY_ID picks the active
+# signer when several private keys are present (default: the newest file).
+SIGNING_KEYS_DIR = os.environ.get(
+    "SIGNING_KEYS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "keys")
+)
+SIGNING_KEY_ID = os.environ.get("SIGNING_KEY_ID")
+SIGNING_ALGORITHM = os.environ.get("SIGNING_ALGORITHM", "Ed25519")
+
+ED25519 = "Ed25519"
+RSA_PSS = "RSA-PSS"
+
+_GENERATED_KEY_FILE = "signing-key.pem"
+
+def _pss():
+    return padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH)
+
+def key_id(public_key) -> str:
+    """Stable key ID: first 16 hex chars of SHA-256 over the SubjectPublicKeyInfo DER."""
+    der = public_key.public_bytes(
+        encoding=serialization.Encoding.DER,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return hashlib.sha256(der).hexdigest()[:16]
+
+class SigningKey:
+    def __init__(self, public_key, private_key=None, source: Optional[str] = None):
+        self.public_key = public_key
+        self.private_key = private_key
+        self.kid = key_id(public_key)
+        self.source = source
+        if isinstance(public_key, ed25519.Ed25519PublicKey):
+            self.algorithm = ED25519
+        elif isinstance(public_key, rsa.RSAPublicKey):
+            self.algorithm = RSA_PSS
+        else:
+            raise ValueError(f"Unsupported key type: {type(public_key).__name__}")
+
+    def sign(self, data: bytes) -> bytes:
+        if self.private_key is None:
+            raise ValueError(f"Key {self.kid} is verify-only")
+        if self.algorithm == ED25519:
+            return self.private_key.sign(data)
+        return self.private_key.sign(data, _pss(), hashes.SHA256())
+
+    def verify(self, signature: bytes, data: bytes) -> None:
+        """Raises cryptography.exceptions.InvalidSignature on mismatch."""
+        if self.algorithm == ED25519:
+            self.public_key.verify(signature, data)
+        else:
+            self.public_key.verify(signature, data, _pss(), hashes.SHA256())
+
+    def public_pem(self) -> str:
+        return self.public_key.public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo
+        ).decode("utf-8")
+
+def _generate_private_key(algorithm: str):
+    if algorithm.lower() in ("ed25519", "eddsa"):
+        return ed25519.Ed25519PrivateKey.generate()
+    if algorithm.upper() in ("RSA-PSS", "RSA", "PS256"):
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    raise ValueError(f"Unsupported SIGNING_ALGORITHM: {algorithm}")
+
+class KeyRing:
+    """
+    Signing keys loaded from disk, indexed by key ID (`kid`).
+    Receipts carry the kid of the key that signed them; receipts issued before
+    key IDs existed (no kid) are verified against the RSA keys in the ring.
+    """
+
+    def __init__(self, directory: str = SIGNING_KEYS_DIR, active_kid: Optional[str] = SIGNING_KEY_ID,
+                 algorithm: str = SIGNING_ALGORITHM):
+        self.directory = directory
+        self.requested_kid = active_kid
+        self.algorithm = algorithm
+        self.keys: Dict[str, SigningKey] = {}
+        self.active: Optional[SigningKey] = None
+        self._lock = threading.Lock()
+
+    def _read(self) -> List[tuple]:
+        found = []
+        if not os.path.isdir(self.directory):
+            return found
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if not name.endswith(".pem") or not os.path.isfile(path):
+                continue
+            with open(path, "rb") as f:
+                data = f.read()
+            if not data:
+                continue  # Being written by another worker
+            try:
+                if name.endswith(".pub.pem"):
+                    key = SigningKey(serialization.load_pem_public_key(data), source=path)
+                else:
+                    private = serialization.load_pem_private_key(data, password=None)
+                    key = SigningKey(private.public_key(), private, source=path)
+            except Exception as e:
+                print(f"Skipping unreadable key file {path}: {e}")
+                continue
+            found.append((os.path.getmtime(path), key))
+        return found
+
+    def _generate(self) -> None:
+        """Creates the first signing key. O_EXCL makes concurrent workers agree on one key."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, _GENERATED_KEY_FILE)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            # Another worker is generating it; wait until the file is complete
+            for _ in range(100):
+                if os.path.getsize(path) > 0:
+                    return
+                time.sleep(0.05)
+            return
+        private = _generate_private_key(self.algorithm)
+        pem = private.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption()
+        )
+        with os.fdopen(fd, "wb") as f:
+            f.write(pem)
+        print(f"Generated new {self.algorithm} signing key in {path}")
+
+    def load(self) -> "KeyRing":
+        with self._lock:
+            found = self._read()
+            if not any(k.private_key for _, k in found):
+                self._generate()
+                found = self._read()
+
+            self.keys = {k.kid: k for _, k in found}
+            signers = sorted((item for item in found if item[1].private_key), key=lambda item: item[0])
+            if self.requested_kid:
+                self.active = self.keys.get(self.requested_kid)
+                if not self.active or not self.active.private_key:
+                    raise ValueError(f"SIGNING_KEY_ID {self.requested_kid} has no private key in {self.directory}")
+            elif signers:
+                self.active = signers[-1][1]
+            if not self.active:
+                raise ValueError(f"No signing key available in {self.directory}")
+        return self
+
+    def _ensure_loaded(self) -> None:
+        if self.active is None:
+            self.load()
+
+    def signer(self) -> SigningKey:
+        self._ensure_loaded()
+        return self.active
+
+    def get(self, kid: str) -> Optional[SigningKey]:
+        self._ensure_loaded()
+        return self.keys.get(kid)
+
+    def legacy_keys(self) -> List[SigningKey]:
+        """Candidates for receipts without a kid (always RSA-PSS)."""
+        self._ensure_loaded()
+        return [k for k in self.keys.values() if k.algorithm == RSA_PSS]
+
+    def public_keys(self) -> List[dict]:
+        self._ensure_loaded()
+        return [
+            {"kid": k.kid, "alg": k.algorithm, "active": k is self.active, "public_key_pem": k.public_pem()}
+            for k in self.keys.values()
+        ]
+
+keyring = KeyRing()
@@ -0,0 +1,182 @@
+import os
+import uuid
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+from cache import TTLCache
+
+# consent_id -> status cache in front of the `consents` table for /consent/verify.
+# STATUS_CACHE_BACKEND=local (default): per-process LRU with TTL. Other workers see a
+#   revocation at the latest after STATUS_CACHE_TTL seconds: until then a worker that
+#   cached the consent as active keeps answering "active". Use redis with several workers.
+# STATUS_CACHE_BACKEND=redis: shared by all workers (needs the optional `redis` package
+#   and REDIS_URL), so a revocation is visible everywhere immediately. Uses the asyncio
+#   client, so cache round trips never block the event loop.
+STATUS_CACHE_BACKEND = os.environ.get("STATUS_CACHE_BACKEND", "local").lower()
+STATUS_CACHE_SIZE = int(os.environ.get("STATUS_CACHE_SIZE", "100000"))
+STATUS_CACHE_TTL = float(os.environ.get("STATUS_CACHE_TTL", "30"))
+# Revoked / expired never change back, so they can be kept much longer
+STATUS_CACHE_TERMINAL_TTL = float(os.environ.get("STATUS_CACHE_TERMINAL_TTL", "86400"))
+REVOKED_SET_MAX = int(os.environ.get("REVOKED_SET_MAX", "1000000"))
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+
+TERMINAL_STATUSES = ("revoked", "expired")
+
+class LocalStatusBackend:
+    def __init__(self, maxsize: int = STATUS_CACHE_SIZE, ttl: float = STATUS_CACHE_TTL):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get_many(self, consent_ids: Iterable[str]) -> Dict[str, str]:
+        found = {}
+        for consent_id in consent_ids:
+            status = self.cache.get(consent_id)
+            if status is not None:
+                found[consent_id] = status
+        return found
+
+    async def set_many(self, statuses: Dict[str, Tuple[str, float]]) -> None:
+        for consent_id, (status, ttl) in statuses.items():
+            self.cache.set(consent_id, status, ttl=ttl)
+
+    async def delete(self, consent_id: str) -> None:
+        self.cache.pop(consent_id)
+
+    async def clear(self) -> None:
+        self.cache.clear()
+
+    async def close(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        return {"backend": "local", **self.cache.stats()}
+
+class RedisStatusBackend:
+    def __init__(self, url: str = REDIS_URL, prefix: str = "saksham:consent_status:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("STATUS_CACHE_BACKEND=redis requires the 'redis' package (pip install redis)")
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+
+    async def get_many(self, consent_ids: Iterable[str]) -> Dict[str, str]:
+        consent_ids = list(consent_ids)
+        if not consent_ids:
+            return {}
+        values = await self.client.mget([self.prefix + c for c in consent_ids])
+        return {c: v for c, v in zip(consent_ids, values) if v is not None}
+
+    async def set_many(self, statuses: Dict[str, Tuple[str, float]]) -> None:
+        # One round trip for the whole batch
+        async with self.client.pipeline(transaction=False) as pipe:
+            for consent_id, (status, ttl) in statuses.items():
+                pipe.set(self.prefix + consent_id, status, ex=max(1, int(ttl)))
+            await pipe.execute()
+
+    async def delete(self, consent_id: str) -> None:
+        await self.client.delete(self.prefix + consent_id)
+
+    async def clear(self) -> None:
+        async for key in self.client.scan_iter(self.prefix + "*"):
+            await self.client.delete(key)
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+    def stats(self) -> dict:
+        return {"backend": "redis"}
+
+class StatusCache:
+    """
+    Revocation status cache with write-through from the grant / revoke paths.
+
+    Lookups check a compact in-process set of revoked consent IDs (16-byte UUIDs;
+    revocation is final, so entries never go stale) and then the backend.
+    Active statuses expire after STATUS_CACHE_TTL; terminal ones after
+    STATUS_CACHE_TERMINAL_TTL.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or LocalStatusBackend()
+        self._revoked = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _compact(consent_id: str):
+        try:
+            return uuid.UUID(str(consent_id)).bytes
+        except ValueError:
+            return str(consent_id)
+
+    async def get_many(self, consent_ids: Iterable[str]) -> Dict[str, str]:
+        found, rest = {}, []
+        for consent_id in consent_ids:
+            if self._compact(consent_id) in self._revoked:
+                found[consent_id] = "revoked"
+            else:
+                rest.append(consent_id)
+        cached = {}
+        if rest:
+            try:
+                cached = await self.backend.get_many(rest)
+            except Exception as e:
+                print(f"Status cache lookup failed: {e}")
+        found.update(cached)
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(rest) - len(cached)
+        return found
+
+    async def get(self, consent_id: str) -> Optional[str]:
+        return (await self.get_many([consent_id])).get(consent_id)
+
+    async def put(self, consent_id: str, status: str) -> None:
+        await self.put_many({consent_id: status})
+
+    async def put_many(self, statuses: Dict[str, str]) -> None:
+        if not statuses:
+            return
+        entries = {}
+        for consent_id, status in statuses.items():
+            consent_id = str(consent_id)
+            if status == "revoked" and len(self._revoked) < REVOKED_SET_MAX:
+                self._revoked.add(self._compact(consent_id))
+            ttl = STATUS_CACHE_TERMINAL_TTL if status in TERMINAL_STATUSES else STATUS_CACHE_TTL
+            entries[consent_id] = (status, ttl)
+        try:
+            await self.backend.set_many(entries)
+        except Exception as e:
+            print(f"Status cache write failed: {e}")
+
+    async def invalidate(self, consent_id: str) -> None:
+        self._revoked.discard(self._compact(consent_id))
+        try:
+            await self.backend.delete(str(consent_id))
+        except Exception as e:
+            print(f"Status cache invalidation failed: {e}")
+
+    async def clear(self) -> None:
+        self._revoked.clear()
+        await self.backend.clear()
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "revoked_set_size": len(self._revoked),
+            "backend": self.backend.stats(),
+        }
+
+def _make_backend():
+    if STATUS_CACHE_BACKEND == "redis":
+        return RedisStatusBackend()
+    return LocalStatusBackend()
+
+status_cache = StatusCache(_make_backend())
@@ -0,0 +1,45 @@
+import os
+import threading
+from typing import Optional
+
+from storage.base import ApplicationExists, Cursor, LedgerConflict, LedgerRejected, Node, Storage
+
+# Where the API keeps its data:
+#   supabase (default) - the hosted Postgres project (SUPABASE_URL / SUPABASE_KEY)
+#   sqlite             - embedded database at STORAGE_SQLITE_PATH, for offline runs and benchmarks
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "supabase").lower()
+
+_storage: Optional[Storage] = None
+_lock = threading.Lock()
+
+def create_storage(backend: str = STORAGE_BACKEND) -> Storage:
+    if backend == "sqlite":
+        from storage.sqlite_storage import SQLiteStorage
+        return SQLiteStorage()
+    if backend == "supabase":
+        from storage.supabase_storage import SupabaseStorage
+        return SupabaseStorage()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+def get_storage() -> Storage:
+    """The process-wide storage backend, created on first use."""
+    global _storage
+    if _storage is None:
+        with _lock:
+            if _storage is None:
+                _storage = _instrument(create_storage())
+    return _storage
+
+def _instrument(storage: Storage) -> Storage:
+    from metrics import METRICS_ENABLED
+    if not METRICS_ENABLED:
+        return storage
+    from storage.instrumented import InstrumentedStorage
+    return InstrumentedStorage(storage)
+
+def set_storage(storage: Optional[Storage]) -> None:
+    """Swaps the backend (e.g. an in-memory SQLiteStorage for benchmarks)."""
+    global _storage
+    _storage = _instrument(storage) if storage is not None else None
+
+__all__ = ["Cursor", "LedgerConflict", "LedgerRejected", "Node", "Storage", "create_storage", "get_storage", "set_storage"]
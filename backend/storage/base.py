@@ -0,0 +1,243 @@
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# (timestamp, event_id) of the last event seen; pages continue strictly after it
+Cursor = Tuple[str, str]
+# (level, node_index) of a Merkle tree node
+Node = Tuple[int, int]
+
+class LedgerRejected(Exception):
+    """
+    The backend refused a ledger batch and rolled all of it back (constraint
+    violation, bad reference...). Nothing from the batch was stored.
+    """
+
+class LedgerConflict(LedgerRejected):
+    """
+    A row's hash_prev is not the current head of its shard: another writer (e.g. another
+    API worker) appended first. The batch was rolled back; relink it on the new head.
+    """
+
+class ApplicationExists(Exception):
+    """Another application already has this app_name (unique index); select it instead."""
+
+class Storage(ABC):
+    """
+    Repository interface for everything the API persists.
+
+    Methods are blocking; async code calls them through database.run_db().
+    Rows are plain dicts shaped like the tables in schema.sql, with JSON columns
+    decoded and UUIDs / timestamps as strings.
+    """
+
+    name = "abstract"
+
+    # --- applications ---
+
+    @abstractmethod
+    def get_application(self, app_id: str) -> Optional[dict]:
+        """app_id, app_name and owner_user_id of one application, or None."""
+
+    @abstractmethod
+    def find_application(self, app_name: str) -> Optional[dict]:
+        """Like get_application, looked up by app_name."""
+
+    @abstractmethod
+    def create_application(self, app: dict) -> dict:
+        """
+        Inserts an applications row and returns it (with the generated app_id).
+        Raises ApplicationExists if the app_name is taken, e.g. by another worker
+        that created the same app a moment earlier.
+        """
+
+    # --- consents ---
+
+    @abstractmethod
+    def consent_statuses(self, consent_ids: List[str]) -> Dict[str, str]:
+        """consent_id -> status for the consents that exist."""
+
+    @abstractmethod
+    def revoke_consent(self, consent_id: str, revoked_at: str) -> Optional[dict]:
+        """Marks a consent revoked. Returns the updated row, or None if it does not exist."""
+
+    @abstractmethod
+    def expired_consents(self, now: str, limit: int) -> List[dict]:
+        """
+        Active consents whose expiry_time is at or before `now`, earliest expiry first
+        (consent_id, user_id, app_id, expiry_time). Served by the (status, expiry_time) index.
+        """
+
+    @abstractmethod
+    def active_grants(self, now: str, limit: int, after: Optional[str] = None,
+                      user_id: Optional[str] = None, app_id: Optional[str] = None) -> List[dict]:
+        """
+        Active consents with expiry_time after `now`, ordered by consent_id and strictly
+        after `after` (keyset pages), optionally for one (user_id, app_id). Each row has
+        consent_id, user_id, app_id, expiry_time and "purposes": [{purpose_code, data_categories}].
+        """
+
+    @abstractmethod
+    def active_grants_for(self, now: str, pairs: Sequence[Tuple[str, str]]) -> List[dict]:
+        """
+        Every active consent with expiry_time after `now` of the given (user_id, app_id)
+        pairs, in a few batched queries rather than one per pair. Rows are shaped like
+        active_grants() rows, in no particular order.
+        """
+
+    # --- ledger writes ---
+
+    @abstractmethod
+    def append_ledger(self, rows: List[dict]) -> List[dict]:
+        """
+        Stores linked audit_events rows in order. A row may carry a "grant" with the
+        consent, purposes and receipt it certifies (see ledger_functions.sql), which
+        are stored with it, or an "expire" ({consent_id}) naming an active consent to
+        mark expired with it. Returns the stored audit_events rows. Raises
+        LedgerRejected if the batch was refused as a whole (including when an
+        "expire" consent is no longer active), and LedgerConflict if the first row
+        of a shard does not link to that shard's current head (each later row must
+        link to the row before it). The head check and the insert are atomic, and
+        the batch's Merkle leaves are appended in the same transaction, under a
+        lock on the tree, at indexes taken from the stored tree size.
+        """
+
+    # --- audit events ---
+
+    @abstractmethod
+    def get_audit_event(self, event_id: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def latest_audit_event(self, shard: Optional[int] = None) -> Optional[dict]:
+        """The chain head: the event with the greatest timestamp (on `shard`, if given)."""
+
+    @abstractmethod
+    def list_audit_events(self, limit: int, actor_id: Optional[str] = None, event_type: Optional[str] = None,
+                          consent_id: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None,
+                          before: Optional[Cursor] = None, columns: Optional[Sequence[str]] = None) -> List[dict]:
+        """
+        Newest first ((timestamp, event_id) descending), strictly before `before`.
+        Filters combine with AND; since/until bound the timestamp (inclusive / exclusive);
+        consent_id matches event_payload->>'consent_id'. `columns` limits the columns returned.
+        """
+
+    @abstractmethod
+    def audit_events_after(self, cursor: Optional[Cursor], limit: int, shard: Optional[int] = None) -> List[dict]:
+        """
+        One page in chain order ((timestamp, event_id) ascending), strictly after cursor.
+        With `shard`, only that shard's chain (served by the (shard, timestamp, event_id) index).
+        """
+
+    @abstractmethod
+    def update_audit_event(self, event_id: str, fields: dict) -> None:
+        """Only used by the tamper simulation endpoints."""
+
+    # --- verification checkpoints ---
+
+    @abstractmethod
+    def get_checkpoint(self, checkpoint_id: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def save_checkpoint(self, checkpoint: dict) -> None:
+        ...
+
+    @abstractmethod
+    def delete_checkpoint(self, checkpoint_id: str) -> None:
+        ...
+
+    # --- shard anchors ---
+
+    @abstractmethod
+    def audit_anchor(self, anchor_seq: Optional[int] = None) -> Optional[dict]:
+        """The anchor with anchor_seq, or the latest one."""
+
+    @abstractmethod
+    def audit_anchors_after(self, anchor_seq: int, limit: int) -> List[dict]:
+        """Anchors with a greater anchor_seq, in anchor_seq order."""
+
+    @abstractmethod
+    def save_audit_anchor(self, anchor: dict) -> None:
+        """Inserts an anchor; fails if its anchor_seq is taken (anchors are never overwritten)."""
+
+    # --- writer lease ---
+
+    @abstractmethod
+    def claim_writer_lease(self, lease: dict) -> bool:
+        """
+        Takes the lease {name, owner, expires_at} unless an unexpired lease of another
+        owner holds it (an expired one is replaced), or extends it when `owner` already
+        holds it. Returns whether `owner` holds the lease now.
+        """
+
+    @abstractmethod
+    def release_writer_lease(self, name: str, owner: str) -> None:
+        """Drops the lease if `owner` holds it."""
+
+    # --- idempotency keys ---
+
+    @abstractmethod
+    def idempotency_record(self, key: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def claim_idempotency_key(self, record: dict) -> bool:
+        """
+        Inserts a pending record unless an unexpired record holds its key (an expired
+        one is replaced). Returns whether the key was claimed.
+        """
+
+    @abstractmethod
+    def complete_idempotency_key(self, key: str, response: dict, expires_at: str) -> None:
+        ...
+
+    @abstractmethod
+    def release_idempotency_key(self, key: str) -> None:
+        """Drops a claim whose request failed, so a retry runs again."""
+
+    @abstractmethod
+    def purge_idempotency_keys(self, now: str) -> int:
+        """Deletes records that expired at or before `now`; returns how many."""
+
+    # --- merkle index ---
+
+    @abstractmethod
+    def merkle_leaf_count(self) -> int:
+        ...
+
+    @abstractmethod
+    def merkle_leaf(self, leaf_index: int) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def find_merkle_leaves(self, event_id: Optional[str] = None, consent_id: Optional[str] = None) -> List[dict]:
+        """Matching leaves in leaf_index order."""
+
+    @abstractmethod
+    def merkle_nodes(self, needed: Iterable[Node]) -> Dict[Node, str]:
+        """(level, node_index) -> hash for the stored nodes among `needed`."""
+
+    @abstractmethod
+    def backfill_merkle(self, limit: int) -> int:
+        """
+        Appends Merkle leaves (and their nodes) for up to `limit` audit events that
+        have none yet, in chain order, the same way append_ledger does. Returns the
+        number of leaves added.
+        """
+
+    @abstractmethod
+    def merkle_root(self, tree_size: Optional[int] = None) -> Optional[dict]:
+        """The signed root at tree_size, or the latest one."""
+
+    @abstractmethod
+    def save_merkle_root(self, root: dict) -> None:
+        ...
+
+    # --- auth ---
+
+    def get_auth_user(self, token: str):
+        """Asks the backend's auth server about a token (AUTH_MODE=remote)."""
+        raise NotImplementedError(f"The {self.name} storage backend has no auth server")
+
+    def close(self) -> None:
+        pass
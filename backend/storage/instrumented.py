@@ -0,0 +1,69 @@
+from metrics import DB_ERRORS, DB_SECONDS
+
+# Storage method -> (table, operation) labels for the DB latency histogram
+CALL_LABELS = {
+    "get_application": ("applications", "select"),
+    "find_application": ("applications", "select"),
+    "create_application": ("applications", "insert"),
+    "consent_statuses": ("consents", "select"),
+    "revoke_consent": ("consents", "update"),
+    "expired_consents": ("consents", "select"),
+    "active_grants": ("consents", "scan"),
+    "active_grants_for": ("consents", "select"),
+    "append_ledger": ("audit_events", "append"),
+    "get_audit_event": ("audit_events", "select"),
+    "latest_audit_event": ("audit_events", "select"),
+    "list_audit_events": ("audit_events", "select"),
+    "audit_events_after": ("audit_events", "scan"),
+    "update_audit_event": ("audit_events", "update"),
+    "get_checkpoint": ("audit_checkpoints", "select"),
+    "save_checkpoint": ("audit_checkpoints", "upsert"),
+    "delete_checkpoint": ("audit_checkpoints", "delete"),
+    "audit_anchor": ("audit_anchors", "select"),
+    "audit_anchors_after": ("audit_anchors", "scan"),
+    "save_audit_anchor": ("audit_anchors", "insert"),
+    "claim_writer_lease": ("writer_leases", "upsert"),
+    "release_writer_lease": ("writer_leases", "delete"),
+    "idempotency_record": ("idempotency_keys", "select"),
+    "claim_idempotency_key": ("idempotency_keys", "insert"),
+    "complete_idempotency_key": ("idempotency_keys", "update"),
+    "release_idempotency_key": ("idempotency_keys", "delete"),
+    "purge_idempotency_keys": ("idempotency_keys", "delete"),
+    "merkle_leaf_count": ("merkle_leaves", "select"),
+    "merkle_leaf": ("merkle_leaves", "select"),
+    "find_merkle_leaves": ("merkle_leaves", "select"),
+    "merkle_nodes": ("merkle_nodes", "select"),
+    "backfill_merkle": ("merkle_leaves", "append"),
+    "merkle_root": ("merkle_roots", "select"),
+    "save_merkle_root": ("merkle_roots", "upsert"),
+    "get_auth_user": ("auth", "get_user"),
+}
+
+class InstrumentedStorage:
+    """
+    Wraps a Storage so every call is timed into saksham_db_call_duration_seconds.
+    Only installed when METRICS_ENABLED, so the disabled path has no wrapper at all.
+    """
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.name = inner.name
+
+    def __getattr__(self, attr):
+        target = getattr(self.inner, attr)
+        labels = CALL_LABELS.get(attr)
+        if labels is None or not callable(target):
+            return target
+        labels = (self.name, *labels)
+
+        def timed(*args, **kwargs):
+            with DB_SECONDS.time(*labels):
+                try:
+                    return target(*args, **kwargs)
+                except Exception:
+                    DB_ERRORS.inc(1, *labels)
+                    raise
+
+        # Cache the wrapper so later lookups skip __getattr__
+        setattr(self, attr, timed)
+        return timed
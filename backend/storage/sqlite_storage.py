@@ -0,0 +1,622 @@
+import os
+import json
+import uuid
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from chain import GENESIS_HASH
+from merkle import leaf_hash, node_hash
+from storage.base import ApplicationExists, Cursor, LedgerConflict, LedgerRejected, Node, Storage
+
+# Embedded database for running the API and its benchmarks offline.
+# ":memory:" keeps everything in the process; a file path persists across restarts.
+STORAGE_SQLITE_PATH = os.environ.get("STORAGE_SQLITE_PATH", "saksham.db")
+
+# Keys per batched lookup query, well under SQLite's bound-parameter limit
+LOOKUP_BATCH_SIZE = 400
+
+# The tables of schema.sql in portable SQL (no auth.users, no RLS): UUIDs and
+# timestamps are ISO text, jsonb / text[] columns hold JSON text.
+SCHEMA = """
+create table if not exists applications (
+    app_id text primary key,
+    app_name text not null,
+    owner_user_id text,
+    verification_status text default 'pending' check (verification_status in ('pending', 'verified', 'rejected')),
+    created_at text
+);
+create unique index if not exists applications_name_key on applications (app_name);
+
+create table if not exists purposes (
+    purpose_code text primary key,
+    legal_basis text not null,
+    description_plain text not null
+);
+insert or ignore into purposes (purpose_code, legal_basis, description_plain) values
+('CORE_FUNCTION', 'CONTRACT', 'Necessary for the core functionality of the application'),
+('ANALYTICS', 'CONSENT', 'Anonymous usage analytics to improve service'),
+('MARKETING', 'CONSENT', 'Sending promotional offers and updates');
+
+create table if not exists consents (
+    consent_id text primary key,
+    user_id text not null,
+    app_id text not null references applications(app_id),
+    status text default 'active' check (status in ('active', 'revoked', 'expired')),
+    granted_at text,
+    expiry_time text not null,
+    revoked_at text
+);
+create index if not exists consents_status_expiry_idx on consents (status, expiry_time);
+create index if not exists consents_user_app_idx on consents (user_id, app_id);
+
+create table if not exists consent_purposes (
+    id integer primary key autoincrement,
+    consent_id text not null references consents(consent_id),
+    purpose_code text not null references purposes(purpose_code),
+    data_categories text not null
+);
+create index if not exists consent_purposes_consent_idx on consent_purposes (consent_id);
+
+create table if not exists consent_receipts (
+    receipt_id text primary key,
+    consent_id text not null references consents(consent_id),
+    signed_payload text not null,
+    signature text not null,
+    created_at text
+);
+
+create table if not exists audit_events (
+    event_id text primary key,
+    event_type text not null,
+    actor_id text,
+    actor_type text not null,
+    event_payload text not null,
+    timestamp text not null,
+    hash_prev text,
+    hash_current text not null,
+    hash_version integer not null default 1,
+    shard integer not null default 0
+);
+create index if not exists audit_events_chain_order_idx on audit_events (timestamp, event_id);
+create index if not exists audit_events_actor_idx on audit_events (actor_id, timestamp, event_id);
+create index if not exists audit_events_type_idx on audit_events (event_type, timestamp, event_id);
+create index if not exists audit_events_consent_idx on audit_events
+    (json_extract(event_payload, '$.consent_id'), timestamp, event_id);
+
+create table if not exists audit_checkpoints (
+    checkpoint_id text primary key,
+    last_event_id text,
+    last_timestamp text not null,
+    last_hash text not null,
+    verified_count integer not null default 0,
+    updated_at text
+);
+
+create table if not exists audit_anchors (
+    anchor_seq integer primary key,
+    root_hash text not null,
+    signed_payload text not null,
+    signature text not null,
+    created_at text
+);
+
+create table if not exists writer_leases (
+    name text primary key,
+    owner text not null,
+    expires_at text not null
+);
+
+create table if not exists idempotency_keys (
+    idempotency_key text primary key,
+    fingerprint text not null,
+    state text not null default 'pending' check (state in ('pending', 'complete')),
+    response text,
+    expires_at text not null,
+    created_at text
+);
+create index if not exists idempotency_keys_expires_idx on idempotency_keys (expires_at);
+
+create table if not exists merkle_leaves (
+    leaf_index integer primary key,
+    event_id text not null unique,
+    consent_id text,
+    leaf_hash text not null
+);
+create index if not exists merkle_leaves_consent_idx on merkle_leaves (consent_id);
+
+create table if not exists merkle_nodes (
+    level integer not null,
+    node_index integer not null,
+    hash text not null,
+    primary key (level, node_index)
+);
+
+create table if not exists merkle_roots (
+    tree_size integer primary key,
+    root_hash text not null,
+    signed_payload text not null,
+    signature text not null,
+    created_at text
+);
+"""
+
+JSON_COLUMNS = ("event_payload", "signed_payload", "data_categories", "response")
+
+AUDIT_COLUMNS = ("event_id", "event_type", "actor_id", "actor_type", "event_payload", "timestamp", "hash_prev", "hash_current",
+                 "hash_version", "shard")
+
+# Columns added after a table was first created: (table, column, definition)
+MIGRATIONS = (
+    ("audit_events", "hash_version", "integer not null default 1"),
+    ("audit_events", "shard", "integer not null default 0"),
+)
+
+# Indexes on migrated columns, created once the columns exist
+MIGRATED_INDEXES = (
+    "create index if not exists audit_events_shard_idx on audit_events (shard, timestamp, event_id)",
+    # Superseded by the unique applications_name_key
+    "drop index if exists applications_name_idx",
+)
+
+def _now() -> str:
+    return datetime.utcnow().isoformat()
+
+def _decode(row: Optional[sqlite3.Row]) -> Optional[dict]:
+    if row is None:
+        return None
+    out = dict(row)
+    for column in JSON_COLUMNS:
+        if isinstance(out.get(column), str):
+            out[column] = json.loads(out[column])
+    return out
+
+def _json(value) -> str:
+    return json.dumps(value, default=str)
+
+class SQLiteStorage(Storage):
+    """
+    Embedded SQL implementation (stdlib sqlite3). One connection shared by the DB
+    pool threads behind a lock; a ledger batch is one transaction, like
+    append_ledger_batch() on Postgres.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = STORAGE_SQLITE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("pragma foreign_keys = on")
+        if path != ":memory:":
+            self._conn.execute("pragma journal_mode = wal")
+            self._conn.execute("pragma synchronous = normal")
+        self._conn.executescript(SCHEMA)
+        for table, column, definition in MIGRATIONS:
+            existing = {r["name"] for r in self._conn.execute(f"pragma table_info({table})")}
+            if column not in existing:
+                self._conn.execute(f"alter table {table} add column {column} {definition}")
+        for sql in MIGRATED_INDEXES:
+            self._conn.execute(sql)
+
+    def _one(self, sql: str, params=()) -> Optional[dict]:
+        with self._lock:
+            return _decode(self._conn.execute(sql, params).fetchone())
+
+    def _all(self, sql: str, params=()) -> List[dict]:
+        with self._lock:
+            return [_decode(r) for r in self._conn.execute(sql, params).fetchall()]
+
+    def _run(self, sql: str, params=()) -> int:
+        with self._lock:
+            return self._conn.execute(sql, params).rowcount
+
+    # --- applications ---
+
+    def get_application(self, app_id: str) -> Optional[dict]:
+        return self._one("select app_id, app_name, owner_user_id from applications where app_id = ?", (str(app_id),))
+
+    def find_application(self, app_name: str) -> Optional[dict]:
+        return self._one("select app_id, app_name, owner_user_id from applications where app_name = ? limit 1", (app_name,))
+
+    def create_application(self, app: dict) -> dict:
+        row = {
+            "app_id": str(app.get("app_id") or uuid.uuid4()),
+            "app_name": app["app_name"],
+            "owner_user_id": app.get("owner_user_id"),
+            "verification_status": app.get("verification_status", "pending"),
+            "created_at": _now(),
+        }
+        try:
+            self._run(
+                "insert into applications (app_id, app_name, owner_user_id, verification_status, created_at) "
+                "values (:app_id, :app_name, :owner_user_id, :verification_status, :created_at)", row
+            )
+        except sqlite3.IntegrityError as e:
+            if "applications.app_name" in str(e):
+                raise ApplicationExists(row["app_name"])
+            raise
+        return row
+
+    # --- consents ---
+
+    def consent_statuses(self, consent_ids: List[str]) -> Dict[str, str]:
+        if not consent_ids:
+            return {}
+        marks = ",".join("?" * len(consent_ids))
+        rows = self._all(f"select consent_id, status from consents where consent_id in ({marks})",
+                         [str(c) for c in consent_ids])
+        return {r["consent_id"]: r["status"] for r in rows}
+
+    def revoke_consent(self, consent_id: str, revoked_at: str) -> Optional[dict]:
+        with self._lock:
+            updated = self._conn.execute(
+                "update consents set status = 'revoked', revoked_at = ? where consent_id = ?",
+                (revoked_at, str(consent_id))
+            ).rowcount
+            if not updated:
+                return None
+            return _decode(self._conn.execute("select * from consents where consent_id = ?", (str(consent_id),)).fetchone())
+
+    def expired_consents(self, now: str, limit: int) -> List[dict]:
+        return self._all(
+            "select consent_id, user_id, app_id, expiry_time from consents "
+            "where status = 'active' and expiry_time <= ? order by expiry_time limit ?",
+            (now, limit)
+        )
+
+    def active_grants(self, now: str, limit: int, after: Optional[str] = None,
+                      user_id: Optional[str] = None, app_id: Optional[str] = None) -> List[dict]:
+        where, params = ["status = 'active'", "expiry_time > ?"], [now]
+        if after:
+            where.append("consent_id > ?")
+            params.append(str(after))
+        if user_id:
+            where.append("user_id = ?")
+            params.append(str(user_id))
+        if app_id:
+            where.append("app_id = ?")
+            params.append(str(app_id))
+        consents = self._all(
+            "select consent_id, user_id, app_id, expiry_time from consents "
+            f"where {' and '.join(where)} order by consent_id limit ?", (*params, limit)
+        )
+        return self._with_purposes(consents)
+
+    def active_grants_for(self, now: str, pairs: Sequence[Tuple[str, str]]) -> List[dict]:
+        out = []
+        for i in range(0, len(pairs), LOOKUP_BATCH_SIZE):
+            chunk = pairs[i:i + LOOKUP_BATCH_SIZE]
+            values = ",".join(["(?, ?)"] * len(chunk))
+            out += self._all(
+                "select consent_id, user_id, app_id, expiry_time from consents "
+                f"where status = 'active' and expiry_time > ? and (user_id, app_id) in (values {values})",
+                [now, *(str(v) for pair in chunk for v in pair)]
+            )
+        return self._with_purposes(out)
+
+    def _with_purposes(self, consents: List[dict]) -> List[dict]:
+        """Adds "purposes": [{purpose_code, data_categories}] to consents rows."""
+        if not consents:
+            return []
+        by_consent = {c["consent_id"]: c for c in consents}
+        for c in consents:
+            c["purposes"] = []
+        ids = list(by_consent)
+        for i in range(0, len(ids), LOOKUP_BATCH_SIZE):
+            chunk = ids[i:i + LOOKUP_BATCH_SIZE]
+            purposes = self._all(
+                "select consent_id, purpose_code, data_categories from consent_purposes "
+                f"where consent_id in ({','.join('?' * len(chunk))})", chunk
+            )
+            for p in purposes:
+                by_consent[p.pop("consent_id")]["purposes"].append(p)
+        return consents
+
+    # --- ledger writes ---
+
+    def append_ledger(self, rows: List[dict]) -> List[dict]:
+        stored = []
+        heads: Dict[int, str] = {}
+        with self._lock:
+            conn = self._conn
+            # "begin immediate" takes the write lock, so no other process can move a head
+            # between the check below and the commit
+            conn.execute("begin immediate")
+            try:
+                for row in rows:
+                    shard = row.get("shard") or 0
+                    if shard not in heads:
+                        head = conn.execute(
+                            "select hash_current from audit_events where shard = ? "
+                            "order by timestamp desc, event_id desc limit 1", (shard,)
+                        ).fetchone()
+                        heads[shard] = head[0] if head else GENESIS_HASH
+                    if row.get("hash_prev") != heads[shard]:
+                        raise LedgerConflict(f"Audit chain head of shard {shard} moved: expected hash_prev {heads[shard]}")
+                    heads[shard] = row.get("hash_current")
+                    grant = row.get("grant")
+                    if grant:
+                        consent = grant["consent"]
+                        conn.execute(
+                            "insert into consents (consent_id, user_id, app_id, status, granted_at, expiry_time) "
+                            "values (?, ?, ?, ?, ?, ?)",
+                            (consent["consent_id"], consent["user_id"], str(consent["app_id"]),
+                             consent.get("status", "active"), _now(), consent["expiry_time"])
+                        )
+                        conn.executemany(
+                            "insert into consent_purposes (consent_id, purpose_code, data_categories) values (?, ?, ?)",
+                            [(consent["consent_id"], p["purpose_code"], _json(p["data_categories"]))
+                             for p in grant.get("purposes") or []]
+                        )
+                        receipt = grant["receipt"]
+                        conn.execute(
+                            "insert into consent_receipts (receipt_id, consent_id, signed_payload, signature, created_at) "
+                            "values (?, ?, ?, ?, ?)",
+                            (receipt.get("receipt_id") or str(uuid.uuid4()), consent["consent_id"],
+                             _json(receipt["signed_payload"]), receipt["signature"], _now())
+                        )
+                    expire = row.get("expire")
+                    if expire:
+                        changed = conn.execute(
+                            "update consents set status = 'expired' where consent_id = ? and status = 'active'",
+                            (str(expire["consent_id"]),)
+                        ).rowcount
+                        if not changed:
+                            raise LedgerRejected(f"Consent {expire['consent_id']} is not active")
+                    event = {k: row.get(k) for k in AUDIT_COLUMNS}
+                    event["event_id"] = str(event["event_id"] or uuid.uuid4())
+                    event["hash_version"] = event["hash_version"] or 1
+                    event["shard"] = event["shard"] or 0
+                    conn.execute(
+                        "insert into audit_events (event_id, event_type, actor_id, actor_type, event_payload, "
+                        "timestamp, hash_prev, hash_current, hash_version, shard) values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (event["event_id"], event["event_type"], event["actor_id"], event["actor_type"],
+                         _json(event["event_payload"]), event["timestamp"], event["hash_prev"], event["hash_current"],
+                         event["hash_version"], event["shard"])
+                    )
+                    stored.append(event)
+                self._append_merkle_leaves(conn, stored)
+                conn.execute("commit")
+            except sqlite3.IntegrityError as e:
+                conn.execute("rollback")
+                raise LedgerRejected(str(e)) from e
+            except BaseException:
+                conn.execute("rollback")
+                raise
+        return stored
+
+    # --- audit events ---
+
+    def get_audit_event(self, event_id: str) -> Optional[dict]:
+        return self._one("select * from audit_events where event_id = ?", (str(event_id),))
+
+    def latest_audit_event(self, shard: Optional[int] = None) -> Optional[dict]:
+        if shard is not None:
+            return self._one("select * from audit_events where shard = ? order by timestamp desc, event_id desc limit 1",
+                             (shard,))
+        return self._one("select * from audit_events order by timestamp desc, event_id desc limit 1")
+
+    def list_audit_events(self, limit: int, actor_id: Optional[str] = None, event_type: Optional[str] = None,
+                          consent_id: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None,
+                          before: Optional[Cursor] = None, columns: Optional[Sequence[str]] = None) -> List[dict]:
+        unknown = set(columns or ()) - set(AUDIT_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown audit_events columns: {sorted(unknown)}")
+        where, params = [], []
+        if actor_id:
+            where.append("actor_id = ?")
+            params.append(str(actor_id))
+        if event_type:
+            where.append("event_type = ?")
+            params.append(event_type)
+        if consent_id:
+            where.append("json_extract(event_payload, '$.consent_id') = ?")
+            params.append(str(consent_id))
+        if since:
+            where.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            where.append("timestamp < ?")
+            params.append(until)
+        if before:
+            where.append("(timestamp < ? or (timestamp = ? and event_id < ?))")
+            params.extend((before[0], before[0], str(before[1])))
+        sql = f"select {', '.join(columns) if columns else '*'} from audit_events"
+        if where:
+            sql += " where " + " and ".join(where)
+        return self._all(sql + " order by timestamp desc, event_id desc limit ?", (*params, limit))
+
+    def audit_events_after(self, cursor: Optional[Cursor], limit: int, shard: Optional[int] = None) -> List[dict]:
+        where, params = [], []
+        if shard is not None:
+            where.append("shard = ?")
+            params.append(shard)
+        if cursor:
+            where.append("(timestamp > ? or (timestamp = ? and event_id > ?))")
+            params.extend((cursor[0], cursor[0], str(cursor[1])))
+        sql = "select * from audit_events"
+        if where:
+            sql += " where " + " and ".join(where)
+        return self._all(sql + " order by timestamp, event_id limit ?", (*params, limit))
+
+    def update_audit_event(self, event_id: str, fields: dict) -> None:
+        columns = [c for c in fields if c in AUDIT_COLUMNS and c != "event_id"]
+        if not columns:
+            return
+        values = [_json(fields[c]) if c in JSON_COLUMNS else fields[c] for c in columns]
+        self._run(f"update audit_events set {', '.join(c + ' = ?' for c in columns)} where event_id = ?",
+                  (*values, str(event_id)))
+
+    # --- verification checkpoints ---
+
+    def get_checkpoint(self, checkpoint_id: str) -> Optional[dict]:
+        return self._one("select * from audit_checkpoints where checkpoint_id = ?", (checkpoint_id,))
+
+    def save_checkpoint(self, checkpoint: dict) -> None:
+        self._run(
+            "insert or replace into audit_checkpoints "
+            "(checkpoint_id, last_event_id, last_timestamp, last_hash, verified_count, updated_at) "
+            "values (:checkpoint_id, :last_event_id, :last_timestamp, :last_hash, :verified_count, :updated_at)",
+            checkpoint
+        )
+
+    def delete_checkpoint(self, checkpoint_id: str) -> None:
+        self._run("delete from audit_checkpoints where checkpoint_id = ?", (checkpoint_id,))
+
+    # --- shard anchors ---
+
+    def audit_anchor(self, anchor_seq: Optional[int] = None) -> Optional[dict]:
+        if anchor_seq is not None:
+            return self._one("select * from audit_anchors where anchor_seq = ?", (anchor_seq,))
+        return self._one("select * from audit_anchors order by anchor_seq desc limit 1")
+
+    def audit_anchors_after(self, anchor_seq: int, limit: int) -> List[dict]:
+        return self._all("select * from audit_anchors where anchor_seq > ? order by anchor_seq limit ?", (anchor_seq, limit))
+
+    def save_audit_anchor(self, anchor: dict) -> None:
+        self._run(
+            "insert into audit_anchors (anchor_seq, root_hash, signed_payload, signature, created_at) values (?, ?, ?, ?, ?)",
+            (anchor["anchor_seq"], anchor["root_hash"], _json(anchor["signed_payload"]), anchor["signature"], _now())
+        )
+
+    # --- writer lease ---
+
+    def claim_writer_lease(self, lease: dict) -> bool:
+        with self._lock:
+            self._conn.execute("delete from writer_leases where name = ? and expires_at <= ?", (lease["name"], _now()))
+            return self._conn.execute(
+                "insert into writer_leases (name, owner, expires_at) values (?, ?, ?) "
+                "on conflict (name) do update set expires_at = excluded.expires_at where owner = excluded.owner",
+                (lease["name"], lease["owner"], lease["expires_at"])
+            ).rowcount == 1
+
+    def release_writer_lease(self, name: str, owner: str) -> None:
+        self._run("delete from writer_leases where name = ? and owner = ?", (name, owner))
+
+    # --- idempotency keys ---
+
+    def idempotency_record(self, key: str) -> Optional[dict]:
+        return self._one("select * from idempotency_keys where idempotency_key = ?", (key,))
+
+    def claim_idempotency_key(self, record: dict) -> bool:
+        with self._lock:
+            self._conn.execute("delete from idempotency_keys where idempotency_key = ? and expires_at <= ?",
+                               (record["idempotency_key"], _now()))
+            return self._conn.execute(
+                "insert or ignore into idempotency_keys (idempotency_key, fingerprint, state, expires_at, created_at) "
+                "values (?, ?, 'pending', ?, ?)",
+                (record["idempotency_key"], record["fingerprint"], record["expires_at"], _now())
+            ).rowcount == 1
+
+    def complete_idempotency_key(self, key: str, response: dict, expires_at: str) -> None:
+        self._run("update idempotency_keys set state = 'complete', response = ?, expires_at = ? where idempotency_key = ?",
+                  (_json(response), expires_at, key))
+
+    def release_idempotency_key(self, key: str) -> None:
+        self._run("delete from idempotency_keys where idempotency_key = ? and state = 'pending'", (key,))
+
+    def purge_idempotency_keys(self, now: str) -> int:
+        return self._run("delete from idempotency_keys where expires_at <= ?", (now,))
+
+    # --- merkle index ---
+
+    def merkle_leaf_count(self) -> int:
+        row = self._one("select max(leaf_index) as last from merkle_leaves")
+        return row["last"] + 1 if row and row["last"] is not None else 0
+
+    def merkle_leaf(self, leaf_index: int) -> Optional[dict]:
+        return self._one("select * from merkle_leaves where leaf_index = ?", (leaf_index,))
+
+    def find_merkle_leaves(self, event_id: Optional[str] = None, consent_id: Optional[str] = None) -> List[dict]:
+        clauses, params = [], []
+        if event_id:
+            clauses.append("event_id = ?")
+            params.append(str(event_id))
+        if consent_id:
+            clauses.append("consent_id = ?")
+            params.append(str(consent_id))
+        where = f" where {' and '.join(clauses)}" if clauses else ""
+        return self._all(f"select * from merkle_leaves{where} order by leaf_index", params)
+
+    def merkle_nodes(self, needed: Iterable[Node]) -> Dict[Node, str]:
+        needed = list(needed)
+        if not needed:
+            return {}
+        found = {}
+        with self._lock:
+            for level, idx in needed:
+                row = self._conn.execute(
+                    "select hash from merkle_nodes where level = ? and node_index = ?", (level, idx)
+                ).fetchone()
+                if row is not None:
+                    found[(level, idx)] = row["hash"]
+        return found
+
+    def backfill_merkle(self, limit: int) -> int:
+        with self._lock:
+            conn = self._conn
+            conn.execute("begin immediate")
+            try:
+                events = [_decode(r) for r in conn.execute(
+                    "select event_id, hash_current, event_payload from audit_events a "
+                    "where not exists (select 1 from merkle_leaves l where l.event_id = a.event_id) "
+                    "order by timestamp, event_id limit ?", (limit,)
+                ).fetchall()]
+                added = self._append_merkle_leaves(conn, events)
+                conn.execute("commit")
+            except BaseException:
+                conn.execute("rollback")
+                raise
+        return added
+
+    def _append_merkle_leaves(self, conn: sqlite3.Connection, events: List[dict]) -> int:
+        """
+        Appends leaves for stored events inside the caller's write transaction, which
+        also serializes every other process, so indexes follow the stored tree size and
+        new nodes are built from committed ones (append_merkle_leaves in ledger_functions.sql).
+        """
+        last = conn.execute("select max(leaf_index) from merkle_leaves").fetchone()[0]
+        size = last + 1 if last is not None else 0
+        added = 0
+        for event in events:
+            event_id = str(event["event_id"])
+            if conn.execute("select 1 from merkle_leaves where event_id = ?", (event_id,)).fetchone():
+                continue
+            h = leaf_hash(event_id, event["hash_current"])
+            payload = event.get("event_payload")
+            conn.execute(
+                "insert into merkle_leaves (leaf_index, event_id, consent_id, leaf_hash) values (?, ?, ?, ?)",
+                (size, event_id, payload.get("consent_id") if isinstance(payload, dict) else None, h)
+            )
+            level, idx = 0, size
+            while True:
+                conn.execute("insert or replace into merkle_nodes (level, node_index, hash) values (?, ?, ?)",
+                             (level, idx, h))
+                if not idx & 1:
+                    break
+                left = conn.execute("select hash from merkle_nodes where level = ? and node_index = ?",
+                                    (level, idx - 1)).fetchone()[0]
+                h = node_hash(left, h)
+                level, idx = level + 1, idx >> 1
+            size += 1
+            added += 1
+        return added
+
+    def merkle_root(self, tree_size: Optional[int] = None) -> Optional[dict]:
+        if tree_size is not None:
+            return self._one("select * from merkle_roots where tree_size = ?", (tree_size,))
+        return self._one("select * from merkle_roots order by tree_size desc limit 1")
+
+    def save_merkle_root(self, root: dict) -> None:
+        self._run(
+            "insert or replace into merkle_roots (tree_size, root_hash, signed_payload, signature, created_at) "
+            "values (?, ?, ?, ?, ?)",
+            (root["tree_size"], root["root_hash"], _json(root["signed_payload"]), root["signature"], _now())
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,360 @@
+import os
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from postgrest.exceptions import APIError
+
+from chain import GENESIS_HASH
+from database import get_db
+from storage.base import ApplicationExists, Cursor, LedgerConflict, LedgerRejected, Node, Storage
+
+# Write ledger batches through the append_ledger_batch() function (ledger_functions.sql): one
+# round trip, and a grant's consent, purposes and receipt commit atomically with its
+# audit event. Set to false on databases where the function is not installed.
+AUDIT_WRITE_RPC = os.environ.get("AUDIT_WRITE_RPC", "true").lower() in ("1", "true", "yes")
+
+# (user, app) pairs per batched lookup (bounds the request URL) and rows per page
+LOOKUP_BATCH_SIZE = 100
+LOOKUP_PAGE_SIZE = 1000
+
+AUDIT_COLUMNS = ("event_type", "actor_id", "actor_type", "event_payload", "timestamp", "hash_prev", "hash_current",
+                 "hash_version", "shard")
+
+def keyset_after(query, timestamp, event_id):
+    """
+    Keyset filter for audit_events: rows strictly after (timestamp, event_id) in chain order.
+    Pair it with .order("timestamp").order("event_id").
+    """
+    return query.or_(
+        f'timestamp.gt."{timestamp}",and(timestamp.eq."{timestamp}",event_id.gt.{event_id})'
+    )
+
+def keyset_before(query, timestamp, event_id):
+    """
+    Keyset filter for audit_events: rows strictly before (timestamp, event_id) in chain order.
+    Pair it with .order("timestamp", desc=True).order("event_id", desc=True).
+    """
+    return query.or_(
+        f'timestamp.lt."{timestamp}",and(timestamp.eq."{timestamp}",event_id.lt.{event_id})'
+    )
+
+def _first(res) -> Optional[dict]:
+    return res.data[0] if res.data else None
+
+class SupabaseStorage(Storage):
+    """Hosted Postgres through the supabase-py query builder (PostgREST)."""
+
+    name = "supabase"
+
+    def __init__(self, client=None):
+        self._client = client
+
+    @property
+    def db(self):
+        return self._client or get_db()
+
+    # --- applications ---
+
+    def get_application(self, app_id: str) -> Optional[dict]:
+        return _first(self.db.table("applications").select("app_id, app_name, owner_user_id").eq("app_id", app_id).execute())
+
+    def find_application(self, app_name: str) -> Optional[dict]:
+        return _first(self.db.table("applications").select("app_id, app_name, owner_user_id").eq("app_name", app_name).limit(1).execute())
+
+    def create_application(self, app: dict) -> dict:
+        try:
+            res = self.db.table("applications").insert(app).execute()
+        except APIError as e:
+            if e.code == "23505":  # unique_violation on applications_name_key
+                raise ApplicationExists(app["app_name"])
+            raise
+        if not res.data:
+            raise RuntimeError("Failed to create application record")
+        return res.data[0]
+
+    # --- consents ---
+
+    def consent_statuses(self, consent_ids: List[str]) -> Dict[str, str]:
+        if not consent_ids:
+            return {}
+        query = self.db.table("consents").select("consent_id, status")
+        if len(consent_ids) == 1:
+            query = query.eq("consent_id", consent_ids[0])
+        else:
+            query = query.in_("consent_id", list(consent_ids))
+        return {str(r["consent_id"]): r["status"] for r in query.execute().data or []}
+
+    def revoke_consent(self, consent_id: str, revoked_at: str) -> Optional[dict]:
+        return _first(self.db.table("consents").update({
+            "status": "revoked",
+            "revoked_at": revoked_at
+        }).eq("consent_id", consent_id).execute())
+
+    def expired_consents(self, now: str, limit: int) -> List[dict]:
+        query = self.db.table("consents").select("consent_id, user_id, app_id, expiry_time")
+        query = query.eq("status", "active").lte("expiry_time", now)
+        return query.order("expiry_time", desc=False).limit(limit).execute().data or []
+
+    def active_grants(self, now: str, limit: int, after: Optional[str] = None,
+                      user_id: Optional[str] = None, app_id: Optional[str] = None) -> List[dict]:
+        query = self.db.table("consents").select("consent_id, user_id, app_id, expiry_time")
+        query = query.eq("status", "active").gt("expiry_time", now)
+        if after:
+            query = query.gt("consent_id", after)
+        if user_id:
+            query = query.eq("user_id", user_id)
+        if app_id:
+            query = query.eq("app_id", app_id)
+        consents = query.order("consent_id", desc=False).limit(limit).execute().data or []
+        return self._with_purposes(consents)
+
+    def active_grants_for(self, now: str, pairs: Sequence[Tuple[str, str]]) -> List[dict]:
+        # PostgREST has no row-value IN: filter by both ID lists (a superset) and keep the pairs
+        out = []
+        for i in range(0, len(pairs), LOOKUP_BATCH_SIZE):
+            chunk = pairs[i:i + LOOKUP_BATCH_SIZE]
+            wanted = {(str(u), str(a)) for u, a in chunk}
+            after = None
+            while True:
+                query = self.db.table("consents").select("consent_id, user_id, app_id, expiry_time")
+                query = query.eq("status", "active").gt("expiry_time", now)
+                query = query.in_("user_id", sorted({u for u, _ in wanted})).in_("app_id", sorted({a for _, a in wanted}))
+                if after:
+                    query = query.gt("consent_id", after)
+                rows = query.order("consent_id", desc=False).limit(LOOKUP_PAGE_SIZE).execute().data or []
+                out += [r for r in rows if (str(r["user_id"]), str(r["app_id"])) in wanted]
+                if len(rows) < LOOKUP_PAGE_SIZE:
+                    break
+                after = str(rows[-1]["consent_id"])
+        return self._with_purposes(out)
+
+    def _with_purposes(self, consents: List[dict]) -> List[dict]:
+        """Adds "purposes": [{purpose_code, data_categories}] to consents rows."""
+        if not consents:
+            return []
+        by_consent = {str(c["consent_id"]): c for c in consents}
+        for c in consents:
+            c["purposes"] = []
+        ids = list(by_consent)
+        for i in range(0, len(ids), LOOKUP_PAGE_SIZE):
+            purposes = self.db.table("consent_purposes").select("consent_id, purpose_code, data_categories")
+            res = purposes.in_("consent_id", ids[i:i + LOOKUP_PAGE_SIZE]).execute()
+            for p in res.data or []:
+                by_consent[str(p.pop("consent_id"))]["purposes"].append(p)
+        return consents
+
+    # --- ledger writes ---
+
+    def append_ledger(self, rows: List[dict]) -> List[dict]:
+        db = self.db
+        if AUDIT_WRITE_RPC:
+            try:
+                res = db.rpc("append_ledger_batch", {"p_events": rows}).execute()
+            except APIError as e:
+                # The function runs in one transaction, so nothing from the batch landed
+                if e.code == "40001":  # serialization_failure: another writer moved the chain head
+                    raise LedgerConflict(str(e)) from e
+                raise LedgerRejected(str(e)) from e
+        else:
+            # Table-by-table fallback: not atomic, a failure can leave a consent without its
+            # event. The head check is a plain read, so two workers can still race past it.
+            shard = rows[0].get("shard") or 0
+            head = self.latest_audit_event(shard)
+            expected = head["hash_current"] if head else GENESIS_HASH
+            if rows[0].get("hash_prev") != expected:
+                raise LedgerConflict(f"Audit chain head of shard {shard} moved: expected hash_prev {expected}")
+            for row in rows:
+                grant = row.get("grant")
+                if grant:
+                    db.table("consents").insert(grant["consent"]).execute()
+                    if grant.get("purposes"):
+                        db.table("consent_purposes").insert([
+                            {"consent_id": grant["consent"]["consent_id"], **p} for p in grant["purposes"]
+                        ]).execute()
+                    db.table("consent_receipts").insert({
+                        "consent_id": grant["consent"]["consent_id"], **grant["receipt"]
+                    }).execute()
+                expire = row.get("expire")
+                if expire:
+                    changed = db.table("consents").update({"status": "expired"}).eq(
+                        "consent_id", expire["consent_id"]).eq("status", "active").execute()
+                    if not changed.data:
+                        raise LedgerRejected(f"Consent {expire['consent_id']} is not active")
+            res = db.table("audit_events").insert([
+                {k: row[k] for k in AUDIT_COLUMNS if k in row} for row in rows
+            ]).execute()
+            try:
+                # Its own transaction here; leaves missed on failure are backfilled at startup
+                db.rpc("append_merkle_leaves", {"p_event_ids": [e["event_id"] for e in res.data or []]}).execute()
+            except APIError as e:
+                print(f"Merkle leaf append failed: {e}")
+        if res.data and len(res.data) == len(rows):
+            return res.data
+        return [{k: row[k] for k in AUDIT_COLUMNS if k in row} for row in rows]
+
+    # --- audit events ---
+
+    def get_audit_event(self, event_id: str) -> Optional[dict]:
+        return _first(self.db.table("audit_events").select("*").eq("event_id", event_id).execute())
+
+    def latest_audit_event(self, shard: Optional[int] = None) -> Optional[dict]:
+        query = self.db.table("audit_events").select("*")
+        if shard is not None:
+            query = query.eq("shard", shard)
+        return _first(query.order("timestamp", desc=True).order("event_id", desc=True).limit(1).execute())
+
+    def list_audit_events(self, limit: int, actor_id: Optional[str] = None, event_type: Optional[str] = None,
+                          consent_id: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None,
+                          before: Optional[Cursor] = None, columns: Optional[Sequence[str]] = None) -> List[dict]:
+        query = self.db.table("audit_events").select(",".join(columns) if columns else "*")
+        if actor_id:
+            query = query.eq("actor_id", actor_id)
+        if event_type:
+            query = query.eq("event_type", event_type)
+        if consent_id:
+            query = query.eq("event_payload->>consent_id", consent_id)
+        if since:
+            query = query.gte("timestamp", since)
+        if until:
+            query = query.lt("timestamp", until)
+        if before:
+            query = keyset_before(query, *before)
+        res = query.order("timestamp", desc=True).order("event_id", desc=True).limit(limit).execute()
+        return res.data or []
+
+    def audit_events_after(self, cursor: Optional[Cursor], limit: int, shard: Optional[int] = None) -> List[dict]:
+        query = self.db.table("audit_events").select("*")
+        if shard is not None:
+            query = query.eq("shard", shard)
+        if cursor:
+            query = keyset_after(query, *cursor)
+        res = query.order("timestamp", desc=False).order("event_id", desc=False).limit(limit).execute()
+        return res.data or []
+
+    def update_audit_event(self, event_id: str, fields: dict) -> None:
+        self.db.table("audit_events").update(fields).eq("event_id", event_id).execute()
+
+    # --- verification checkpoints ---
+
+    def get_checkpoint(self, checkpoint_id: str) -> Optional[dict]:
+        return _first(self.db.table("audit_checkpoints").select("*").eq("checkpoint_id", checkpoint_id).execute())
+
+    def save_checkpoint(self, checkpoint: dict) -> None:
+        self.db.table("audit_checkpoints").upsert(checkpoint).execute()
+
+    def delete_checkpoint(self, checkpoint_id: str) -> None:
+        self.db.table("audit_checkpoints").delete().eq("checkpoint_id", checkpoint_id).execute()
+
+    # --- shard anchors ---
+
+    def audit_anchor(self, anchor_seq: Optional[int] = None) -> Optional[dict]:
+        query = self.db.table("audit_anchors").select("*")
+        if anchor_seq is not None:
+            return _first(query.eq("anchor_seq", anchor_seq).execute())
+        return _first(query.order("anchor_seq", desc=True).limit(1).execute())
+
+    def audit_anchors_after(self, anchor_seq: int, limit: int) -> List[dict]:
+        query = self.db.table("audit_anchors").select("*").gt("anchor_seq", anchor_seq)
+        return query.order("anchor_seq", desc=False).limit(limit).execute().data or []
+
+    def save_audit_anchor(self, anchor: dict) -> None:
+        self.db.table("audit_anchors").insert(anchor).execute()
+
+    # --- writer lease ---
+
+    def claim_writer_lease(self, lease: dict) -> bool:
+        db = self.db
+        db.table("writer_leases").delete().eq("name", lease["name"]).lte(
+            "expires_at", datetime.utcnow().isoformat()).execute()
+        renewed = db.table("writer_leases").update({"expires_at": lease["expires_at"]}).eq(
+            "name", lease["name"]).eq("owner", lease["owner"]).execute()
+        if renewed.data:
+            return True
+        try:
+            db.table("writer_leases").insert(lease).execute()
+        except APIError as e:
+            if e.code == "23505":  # unique_violation: another process holds the lease
+                return False
+            raise
+        return True
+
+    def release_writer_lease(self, name: str, owner: str) -> None:
+        self.db.table("writer_leases").delete().eq("name", name).eq("owner", owner).execute()
+
+    # --- idempotency keys ---
+
+    def idempotency_record(self, key: str) -> Optional[dict]:
+        return _first(self.db.table("idempotency_keys").select("*").eq("idempotency_key", key).execute())
+
+    def claim_idempotency_key(self, record: dict) -> bool:
+        db = self.db
+        db.table("idempotency_keys").delete().eq("idempotency_key", record["idempotency_key"]).lte(
+            "expires_at", datetime.utcnow().isoformat()).execute()
+        try:
+            db.table("idempotency_keys").insert({**record, "state": "pending"}).execute()
+        except APIError as e:
+            if e.code == "23505":  # unique_violation: the key is held by a live record
+                return False
+            raise
+        return True
+
+    def complete_idempotency_key(self, key: str, response: dict, expires_at: str) -> None:
+        self.db.table("idempotency_keys").update({
+            "state": "complete", "response": response, "expires_at": expires_at
+        }).eq("idempotency_key", key).execute()
+
+    def release_idempotency_key(self, key: str) -> None:
+        self.db.table("idempotency_keys").delete().eq("idempotency_key", key).eq("state", "pending").execute()
+
+    def purge_idempotency_keys(self, now: str) -> int:
+        res = self.db.table("idempotency_keys").delete().lte("expires_at", now).execute()
+        return len(res.data or [])
+
+    # --- merkle index ---
+
+    def merkle_leaf_count(self) -> int:
+        res = self.db.table("merkle_leaves").select("leaf_index").order("leaf_index", desc=True).limit(1).execute()
+        return res.data[0]["leaf_index"] + 1 if res.data else 0
+
+    def merkle_leaf(self, leaf_index: int) -> Optional[dict]:
+        return _first(self.db.table("merkle_leaves").select("*").eq("leaf_index", leaf_index).execute())
+
+    def find_merkle_leaves(self, event_id: Optional[str] = None, consent_id: Optional[str] = None) -> List[dict]:
+        query = self.db.table("merkle_leaves").select("*")
+        if event_id:
+            query = query.eq("event_id", event_id)
+        if consent_id:
+            query = query.eq("consent_id", consent_id)
+        return query.order("leaf_index", desc=False).execute().data or []
+
+    def merkle_nodes(self, needed: Iterable[Node]) -> Dict[Node, str]:
+        by_level: Dict[int, List[int]] = {}
+        for level, idx in needed:
+            by_level.setdefault(level, []).append(idx)
+        if not by_level:
+            return {}
+        # One request: or=(and(level.eq.0,node_index.in.(...)),and(level.eq.1,...),...)
+        clauses = ",".join(
+            f"and(level.eq.{level},node_index.in.({','.join(str(i) for i in sorted(idxs))}))"
+            for level, idxs in sorted(by_level.items())
+        )
+        res = self.db.table("merkle_nodes").select("level, node_index, hash").or_(clauses).execute()
+        return {(r["level"], r["node_index"]): r["hash"] for r in res.data or []}
+
+    def backfill_merkle(self, limit: int) -> int:
+        return self.db.rpc("backfill_merkle_leaves", {"p_limit": limit}).execute().data or 0
+
+    def merkle_root(self, tree_size: Optional[int] = None) -> Optional[dict]:
+        query = self.db.table("merkle_roots").select("*")
+        if tree_size is not None:
+            return _first(query.eq("tree_size", tree_size).execute())
+        return _first(query.order("tree_size", desc=True).limit(1).execute())
+
+    def save_merkle_root(self, root: dict) -> None:
+        self.db.table("merkle_roots").upsert(root).execute()
+
+    # --- auth ---
+
+    def get_auth_user(self, token: str):
+        response = self.db.auth.get_user(token)
+        return response.user if response else None
@@ -0,0 +1,163 @@
+"""
+Consent expiry sweeper.
+
+Moves active consents whose expiry_time has passed to `expired` and records a
+CONSENT_EXPIRED audit event for each one. Runs inside the API process (started on
+startup unless SWEEPER_ENABLED=false) or once from the command line:
+
+    cd backend
+    python -m sweeper [--batch-size 200] [--max-rate 500]
+
+A sharded ledger has a single writer process, so there the command-line sweep only
+runs while the API is down; keep the sweeper inside the API process instead.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+from datetime import datetime
+from typing import Optional
+
+from database import run_db
+from storage import get_storage
+from audit_log import audit_appender
+from shards import sharded, shard_for, writer_lease
+from status_cache import status_cache
+from metrics import CONSENTS_EXPIRED
+
+SWEEPER_ENABLED = os.environ.get("SWEEPER_ENABLED", "true").lower() in ("1", "true", "yes")
+SWEEP_INTERVAL_SECONDS = float(os.environ.get("SWEEP_INTERVAL_SECONDS", "60"))
+SWEEP_BATCH_SIZE = int(os.environ.get("SWEEP_BATCH_SIZE", "200"))
+# Upper bound on consents expired per second, so a backlog never crowds out requests
+SWEEP_MAX_PER_SECOND = float(os.environ.get("SWEEP_MAX_PER_SECOND", "500"))
+
+class ExpirySweeper:
+    """
+    Finds expired active consents through the (status, expiry_time) index, `batch_size`
+    at a time. Each batch goes to the audit appender as one contiguous run of
+    CONSENT_EXPIRED events; every event carries an "expire" marker, so the status change
+    is committed in the same transaction as its event. A consent revoked in the meantime
+    is no longer active: its event is rejected on its own and the rest of the batch lands.
+    """
+
+    def __init__(self, batch_size: int = SWEEP_BATCH_SIZE, interval: float = SWEEP_INTERVAL_SECONDS,
+                 max_per_second: float = SWEEP_MAX_PER_SECOND):
+        self.batch_size = max(1, batch_size)
+        self.interval = max(1.0, interval)
+        self.max_per_second = max_per_second
+        self._task: Optional[asyncio.Task] = None
+        self.sweeps = 0
+        self.expired = 0
+        self.skipped = 0
+        self.last_sweep: Optional[str] = None
+
+    # --- lifecycle ---
+
+    def start(self) -> None:
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if not self._task:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"Expiry sweep failed (retried in {self.interval:g}s): {e}")
+            await asyncio.sleep(self.interval)
+
+    # --- sweeping ---
+
+    async def sweep(self) -> int:
+        """Expires everything that was due when the sweep started. Returns the number expired."""
+        store = get_storage()
+        # Fixed cutoff: consents that expire while we sweep wait for the next run
+        cutoff = datetime.utcnow().isoformat()
+        total = 0
+        while True:
+            started = time.perf_counter()
+            due = await run_db(store.expired_consents, cutoff, self.batch_size)
+            if not due:
+                break
+            total += await self._expire_batch(due)
+            if len(due) < self.batch_size:
+                break
+            # Rate limit between batches (and always yield to request handlers)
+            pause = len(due) / self.max_per_second if self.max_per_second > 0 else 0
+            await asyncio.sleep(max(0.0, pause - (time.perf_counter() - started)))
+        self.sweeps += 1
+        self.last_sweep = cutoff
+        return total
+
+    async def _expire_batch(self, due: list) -> int:
+        events = [{
+            "event_type": "CONSENT_EXPIRED",
+            "actor_id": None,
+            "actor_type": "SYSTEM",
+            "event_payload": {
+                "consent_id": str(c["consent_id"]),
+                "action": "EXPIRE",
+                "expiry_time": str(c["expiry_time"]),
+            },
+            "expire": {"consent_id": str(c["consent_id"])},
+            "shard": shard_for(user_id=c["user_id"], app_id=c["app_id"]),
+        } for c in due]
+        results = await audit_appender.append_many(events, return_exceptions=True)
+
+        expired = [e["expire"]["consent_id"] for e, r in zip(events, results) if not isinstance(r, BaseException)]
+        await status_cache.put_many({consent_id: "expired" for consent_id in expired})
+        CONSENTS_EXPIRED.inc(len(expired))
+        self.expired += len(expired)
+        self.skipped += len(due) - len(expired)
+        return len(expired)
+
+    def stats(self) -> dict:
+        return {
+            "running": bool(self._task and not self._task.done()),
+            "sweeps": self.sweeps,
+            "expired": self.expired,
+            "skipped": self.skipped,
+            "last_sweep": self.last_sweep,
+            "batch_size": self.batch_size,
+            "max_per_second": self.max_per_second,
+        }
+
+expiry_sweeper = ExpirySweeper()
+
+async def _sweep_once(sweeper: ExpirySweeper) -> int:
+    if sharded():
+        # A sharded ledger has one writer process: this fails while the API holds the lease
+        await writer_lease.acquire()
+    audit_appender.start()
+    try:
+        return await sweeper.sweep()
+    finally:
+        # Flush queued audit events before the loop closes
+        await audit_appender.stop()
+        await writer_lease.release()
+        get_storage().close()
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=SWEEP_BATCH_SIZE)
+    parser.add_argument("--max-rate", type=float, default=SWEEP_MAX_PER_SECOND, help="consents per second (0 = unlimited)")
+    args = parser.parse_args(argv)
+
+    sweeper = ExpirySweeper(batch_size=args.batch_size, max_per_second=args.max_rate)
+    expired = asyncio.run(_sweep_once(sweeper))
+    print(f"Expired {expired} consent(s), {sweeper.skipped} no longer active")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
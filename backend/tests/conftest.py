@@ -0,0 +1,68 @@
+"""
+Shared setup for the backend tests.
+
+Modules read their configuration from the environment at import time, so the test
+environment is set here, before anything under test is imported: the embedded SQLite
+backend, a throwaway signing key directory and local HS256 tokens.
+"""
+import os
+import sys
+import asyncio
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+os.environ.update({
+    "STORAGE_BACKEND": "sqlite",
+    "STORAGE_SQLITE_PATH": ":memory:",
+    "SIGNING_KEYS_DIR": tempfile.mkdtemp(prefix="saksham-test-keys-"),
+    "AUTH_MODE": "local",
+    "JWT_SECRET": "test-secret-" + "x" * 32,
+    "WORKER_PROCESSES": "1",
+    "SWEEPER_ENABLED": "false",
+})
+
+@pytest.fixture
+def store():
+    """A fresh in-memory SQLite storage installed as the process-wide backend."""
+    import storage
+    from storage.sqlite_storage import SQLiteStorage
+
+    backend = SQLiteStorage(":memory:")
+    storage.set_storage(backend)
+    yield backend
+    storage.set_storage(None)
+    backend.close()
+
+@pytest.fixture
+def client(store, monkeypatch):
+    """A TestClient on the API (startup and shutdown run) over a fresh `store`."""
+    from fastapi.testclient import TestClient
+
+    import database
+    import decision_index
+    import routers.admin
+    import routers.consent
+    from app_registry import app_registry
+    from main import app
+    from signature_cache import signature_cache
+    from status_cache import status_cache
+
+    # Process-wide caches would otherwise answer from the previous test's database
+    app_registry.clear()
+    asyncio.run(status_cache.clear())
+    signature_cache.clear()
+    index = decision_index.DecisionIndex()
+    for module in (decision_index, routers.consent, routers.admin):
+        monkeypatch.setattr(module, "decision_index", index)
+    # The DB thread pool is process-wide; shutdown must leave it to the next test
+    monkeypatch.setattr(database, "close_db", lambda: None)
+    with TestClient(app) as test_client:
+        yield test_client
+
+def auth_headers(user_id: str, **claims) -> dict:
+    from jwt_auth import mint_token
+    return {"Authorization": f"Bearer {mint_token(user_id, **claims)}"}
@@ -0,0 +1,33 @@
+import uuid
+
+import pytest
+
+from conftest import auth_headers
+
+ADMIN = {"app_metadata": {"role": "admin"}}
+
+def _user():
+    return str(uuid.uuid4())
+
+@pytest.mark.parametrize("path", [
+    "/admin/cache/status/invalidate",
+    "/admin/cache/apps/invalidate",
+    "/admin/sweeper/run",
+    "/admin/shards/anchor",
+])
+def test_admin_actions_require_the_admin_role(client, path):
+    assert client.post(path).status_code == 401
+    assert client.post(path, headers=auth_headers(_user())).status_code == 403
+    # app_metadata is set by the service, unlike user_metadata
+    assert client.post(path, headers=auth_headers(_user(), user_metadata={"role": "admin"})).status_code == 403
+
+def test_admin_can_invalidate_a_cached_status(client):
+    response = client.post("/admin/cache/status/invalidate", params={"consent_id": str(uuid.uuid4())},
+                           headers=auth_headers(_user(), **ADMIN))
+    assert response.status_code == 200 and response.json()["status"] == "invalidated"
+
+    roles = {"app_metadata": {"roles": ["auditor", "admin"]}}
+    assert client.post("/admin/cache/status/invalidate", headers=auth_headers(_user(), **roles)).status_code == 200
+
+def test_admin_anchor_needs_a_sharded_ledger(client):
+    assert client.post("/admin/shards/anchor", headers=auth_headers(_user(), **ADMIN)).status_code == 400
@@ -0,0 +1,57 @@
+import asyncio
+import threading
+
+import pytest
+
+from app_registry import AppRegistry
+from storage import ApplicationExists
+
+def test_app_names_are_unique(store):
+    store.create_application({"app_name": "Shop"})
+    with pytest.raises(ApplicationExists):
+        store.create_application({"app_name": "Shop"})
+
+def test_workers_creating_the_same_app_share_one_row(store, monkeypatch):
+    # Both workers look the name up before either creates it
+    both_looked = threading.Barrier(2, timeout=5)
+    lookups = []
+    find = store.find_application
+
+    def find_application(app_name):
+        found = find(app_name)
+        lookups.append(app_name)
+        if len(lookups) <= 2:
+            both_looked.wait()
+        return found
+
+    monkeypatch.setattr(store, "find_application", find_application)
+
+    async def run():
+        workers = [AppRegistry(), AppRegistry()]
+        results = await asyncio.gather(*(w.resolve("Shop", owner_user_id=None) for w in workers))
+        return results, sum(w.created for w in workers)
+
+    (first, second), created = asyncio.run(run())
+    assert first == second and created == 1
+    assert len(lookups) == 3  # The loser selected the winner's row
+    assert store._one("select count(*) as n from applications")["n"] == 1
+
+def test_cancelled_leader_does_not_fail_waiters(store, monkeypatch):
+    release = threading.Event()
+    find = store.find_application
+    monkeypatch.setattr(store, "find_application", lambda name: release.wait(5) and find(name))
+
+    async def run():
+        registry = AppRegistry()
+        leader = asyncio.ensure_future(registry.resolve("Shop"))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.ensure_future(registry.resolve("Shop"))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        await asyncio.sleep(0.01)
+        release.set()
+        app_id, app_name = await asyncio.wait_for(waiter, 5)
+        assert leader.cancelled() and app_name == "Shop"
+        assert await registry.resolve("Shop") == (app_id, "Shop") and registry.created == 1
+
+    asyncio.run(run())
@@ -0,0 +1,109 @@
+import os
+import sys
+import json
+import uuid
+import asyncio
+import hashlib
+import subprocess
+
+from archive import encode_segment, export_archive
+from conftest import BACKEND_DIR, auth_headers
+from verify_archive import MANIFEST_FILE, verify_archive
+
+def _grant(client, user_id: str, count: int) -> None:
+    for _ in range(count):
+        response = client.post("/consent/grant", headers=auth_headers(user_id), json={
+            "app_id": "Shop", "purposes": [{"purpose_code": "ANALYTICS", "data_categories": ["usage"]}],
+        })
+        assert response.status_code == 200, response.text
+
+def _export(client, tmp_path, events: int = 7) -> tuple:
+    _grant(client, str(uuid.uuid4()), events)
+    directory = str(tmp_path / "archive")
+    signed = asyncio.run(export_archive(directory, segment_events=3, page_size=2))
+    keys = tmp_path / "keys.json"
+    keys.write_text(json.dumps(client.get("/consent/keys").json()))
+    return directory, str(keys), signed["signed_payload"]
+
+def _reasons(report: dict) -> set:
+    return {v["reason"] for v in report["violations"]}
+
+def _rewrite_manifest(directory: str, update) -> None:
+    path = os.path.join(directory, MANIFEST_FILE)
+    with open(path) as f:
+        signed = json.load(f)
+    update(signed["signed_payload"])  # The signature is left as it was
+    with open(path, "w") as f:
+        json.dump(signed, f)
+
+def test_exported_archive_verifies_offline(client, store, tmp_path):
+    directory, keys, manifest = _export(client, tmp_path)
+    assert manifest["event_count"] == 7
+    assert [s["events"] for s in manifest["segments"]] == [3, 3, 1]
+    assert manifest["heads"][0]["hash"] == store.latest_audit_event()["hash_current"]
+
+    for jobs in (1, 2):
+        report = verify_archive(directory, keys_path=keys, jobs=jobs)
+        assert (report["status"], report["verified_count"], report["segments"]) == ("VALID", 7, 3)
+        assert report["manifest_signature"] == "VALID" and report["violations"] == []
+
+    # The standalone script, as a regulator runs it
+    run = subprocess.run([sys.executable, os.path.join(BACKEND_DIR, "verify_archive.py"), directory, "--keys", keys],
+                         capture_output=True, text=True)
+    assert run.returncode == 0, run.stdout + run.stderr
+    assert run.stdout.startswith("VALID: 7 events in 3 segment(s)")
+
+def test_edited_segment_is_detected(client, store, tmp_path):
+    directory, keys, manifest = _export(client, tmp_path)
+    # Re-encode the middle segment with one payload changed and point the manifest at it
+    events = store.audit_events_after(None, 100)[3:6]
+    events[1]["event_payload"] = {**events[1]["event_payload"], "app_name": "Rewritten"}
+    blob = encode_segment(1, events)
+    entry = manifest["segments"][1]
+    with open(os.path.join(directory, entry["file"]), "wb") as f:
+        f.write(blob)
+
+    report = verify_archive(directory, jobs=1)
+    assert report["status"] == "TAMPERED"
+    assert _reasons(report) == {"Segment Checksum Mismatch", "Hash Mismatch - Event data may have been tampered with"}
+
+    _rewrite_manifest(directory, lambda m: m["segments"][1].update(sha256=hashlib.sha256(blob).hexdigest()))
+    # A matching checksum does not help: the event hashes are recomputed
+    report = verify_archive(directory, jobs=1)
+    assert _reasons(report) == {"Hash Mismatch - Event data may have been tampered with"}
+    assert any(v.get("event_id") == str(events[1]["event_id"]) for v in report["violations"])
+    # Only a key holder could re-sign the edited manifest
+    report = verify_archive(directory, keys_path=keys, jobs=1)
+    assert "Manifest Signature Invalid" in _reasons(report) and report["manifest_signature"] == "INVALID"
+
+def test_corrupted_and_dropped_segments_are_detected(client, tmp_path):
+    directory, keys, manifest = _export(client, tmp_path)
+    path = os.path.join(directory, manifest["segments"][2]["file"])
+    with open(path, "r+b") as f:
+        f.seek(-1, os.SEEK_END)
+        last = f.read(1)
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([last[0] ^ 0xFF]))
+    assert "Segment Checksum Mismatch" in _reasons(verify_archive(directory, jobs=1))
+
+    # Leaving out a segment (and its count) breaks the link into the next one and the signed head
+    directory, keys, manifest = _export(client, tmp_path / "second")
+
+    def drop_middle(m: dict) -> None:
+        m["segments"].pop(1)
+        m["event_count"] -= 3
+
+    _rewrite_manifest(directory, drop_middle)
+    report = verify_archive(directory, jobs=1)
+    assert report["status"] == "TAMPERED"
+    assert {"Chain Link Broken - Previous event hash mismatch", "Head Mismatch"} <= _reasons(report)
+
+def test_ledger_edits_made_before_the_export_are_carried_into_the_archive(client, store, tmp_path):
+    _grant(client, str(uuid.uuid4()), 4)
+    event = store.audit_events_after(None, 2)[1]
+    store.update_audit_event(event["event_id"], {"event_payload": {"consent_id": "rewritten"}})
+    directory = str(tmp_path / "archive")
+    asyncio.run(export_archive(directory, segment_events=2))
+    report = verify_archive(directory, jobs=1)
+    assert report["status"] == "TAMPERED"
+    assert [v["event_id"] for v in report["violations"]] == [str(event["event_id"])]
@@ -0,0 +1,86 @@
+import uuid
+
+from chain import GENESIS_HASH
+from conftest import auth_headers
+from routers.audit import decode_cursor
+
+def test_first_page_carries_the_stream_cursor_of_its_newest_event(client):
+    user = str(uuid.uuid4())
+    headers = auth_headers(user)
+    for app in ("Shop", "Bank"):
+        response = client.post("/consent/grant", headers=headers, json={
+            "app_id": app, "purposes": [{"purpose_code": "ANALYTICS", "data_categories": ["usage"]}],
+        })
+        assert response.status_code == 200
+
+    first = client.get("/audit/events", params={"actor_id": user, "limit": 1}, headers=headers)
+    newest = first.json()[0]
+    assert decode_cursor(first.headers["X-Stream-Cursor"]) == (str(newest["timestamp"]), str(newest["event_id"]))
+
+    # Older pages are not a stream position
+    older = client.get("/audit/events", params={"actor_id": user, "limit": 1, "cursor": first.headers["X-Next-Cursor"]},
+                       headers=headers)
+    assert older.json() and "X-Stream-Cursor" not in older.headers
+    empty = client.get("/audit/events", params={"actor_id": str(uuid.uuid4())}, headers=headers)
+    assert empty.json() == [] and "X-Stream-Cursor" not in empty.headers
+
+def _grant(client, user_id: str, count: int = 1) -> None:
+    for _ in range(count):
+        response = client.post("/consent/grant", headers=auth_headers(user_id), json={
+            "app_id": "Shop", "purposes": [{"purpose_code": "ANALYTICS", "data_categories": ["usage"]}],
+        })
+        assert response.status_code == 200, response.text
+
+def _pages(client, headers: dict, between=None, **params) -> list:
+    """Follows X-Next-Cursor to the end; `between` runs after every page."""
+    pages, cursor = [], None
+    while True:
+        response = client.get("/audit/events", params={**params, **({"cursor": cursor} if cursor else {})},
+                              headers=headers)
+        assert response.status_code == 200, response.text
+        pages.append([e["event_id"] for e in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return pages
+        if between:
+            between()
+
+def test_pages_are_stable_while_events_are_appended(client, store):
+    user = str(uuid.uuid4())
+    headers = auth_headers(user)
+    _grant(client, user, 7)
+    snapshot = [e["event_id"] for e in store.list_audit_events(100, actor_id=user)]
+
+    pages = _pages(client, headers, between=lambda: _grant(client, user), actor_id=user, limit=3)
+    # Newer events land before the first page: later pages neither repeat nor skip
+    assert [len(p) for p in pages] == [3, 3, 1]
+    assert [e for page in pages for e in page] == snapshot
+
+    fresh = client.get("/audit/events", params={"actor_id": user, "limit": 3}, headers=headers).json()
+    assert len({e["event_id"] for e in fresh} - set(snapshot)) == 2  # What was appended while paging
+
+def test_pages_split_events_with_the_same_timestamp(client, store):
+    # Same timestamp: the event_id breaks the tie, in the chain and in the pages
+    ids = sorted(str(uuid.uuid4()) for _ in range(5))
+    prev, rows = GENESIS_HASH, []
+    for i, event_id in enumerate(ids):
+        current = f"{i:x}".rjust(64, "0")
+        rows.append({"event_id": event_id, "event_type": "TEST", "actor_id": None, "actor_type": "SYSTEM",
+                     "event_payload": {}, "timestamp": "2026-01-01T00:00:00", "hash_prev": prev,
+                     "hash_current": current, "hash_version": 2})
+        prev = current
+    store.append_ledger(rows)
+
+    pages = _pages(client, auth_headers(str(uuid.uuid4())), event_type="TEST", limit=2)
+    assert pages == [ids[:2:-1], ids[2:0:-1], ids[:1]]
+
+def test_full_last_page_ends_with_an_empty_page(client):
+    user = str(uuid.uuid4())
+    _grant(client, user, 4)
+    pages = _pages(client, auth_headers(user), actor_id=user, limit=2, fields="event_type")
+    assert [len(p) for p in pages] == [2, 2, 0]
+
+def test_malformed_cursor_is_rejected(client):
+    headers = auth_headers(str(uuid.uuid4()))
+    for cursor in ("not base64!", "bm90IGpzb24", "WzFd"):  # Bad base64, not JSON, one-element list
+        assert client.get("/audit/events", params={"cursor": cursor}, headers=headers).status_code == 400
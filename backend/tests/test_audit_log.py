@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from audit_log import AuditAppender
+from chain import GENESIS_HASH, ChainVerifier
+from storage import LedgerConflict
+
+def _row(hash_prev: str, hash_current: str, shard: int = 0) -> dict:
+    return {
+        "event_type": "TEST",
+        "actor_id": None,
+        "actor_type": "SYSTEM",
+        "event_payload": {"n": hash_current[:4]},
+        "timestamp": "2026-01-01T00:00:00." + hash_current[:6],
+        "hash_prev": hash_prev,
+        "hash_current": hash_current,
+        "hash_version": 2,
+        "shard": shard,
+    }
+
+def test_append_ledger_rejects_stale_head(store):
+    store.append_ledger([_row(GENESIS_HASH, "1" * 64)])
+    # A second writer still holding the genesis head must not fork the chain
+    with pytest.raises(LedgerConflict):
+        store.append_ledger([_row(GENESIS_HASH, "2" * 64)])
+    # Rows after the first must link to the row before them
+    with pytest.raises(LedgerConflict):
+        store.append_ledger([_row("1" * 64, "3" * 64), _row("1" * 64, "4" * 64)])
+    assert [e["hash_current"] for e in store.audit_events_after(None, 10)] == ["1" * 64]
+
+def test_append_ledger_checks_heads_per_shard(store):
+    store.append_ledger([_row(GENESIS_HASH, "1" * 64, shard=0)])
+    store.append_ledger([_row(GENESIS_HASH, "2" * 64, shard=1)])
+    with pytest.raises(LedgerConflict):
+        store.append_ledger([_row(GENESIS_HASH, "3" * 64, shard=1)])
+
+def test_appenders_of_several_workers_keep_one_chain(store):
+    async def run():
+        # Each API worker has its own appender and in-memory head
+        workers = [AuditAppender(max_batch_size=5, max_wait_ms=0) for _ in range(3)]
+
+        async def write(n: int, appender: AuditAppender) -> None:
+            for i in range(10):
+                await appender.append_many([
+                    {"event_type": "TEST", "actor_id": None, "actor_type": "SYSTEM",
+                     "event_payload": {"worker": n, "i": i, "j": j}} for j in range(3)
+                ])
+
+        await asyncio.gather(*(write(n, a) for n, a in enumerate(workers)))
+        for appender in workers:
+            await appender.stop()
+        return sum(a.conflicts for a in workers)
+
+    conflicts = asyncio.run(run())
+    events = store.audit_events_after(None, 1000)
+    verifier = ChainVerifier(expected_prev=GENESIS_HASH)
+    verifier.feed(events)
+    assert len(events) == 90
+    assert verifier.critical == 0
+    assert conflicts > 0
+
+def test_writes_do_not_wait_for_root_signing(store, monkeypatch):
+    import threading
+    from merkle import merkle_log
+
+    release = threading.Event()
+    sign = merkle_log.sign_root_if_due
+    monkeypatch.setattr(merkle_log, "root_interval", 1)
+    monkeypatch.setattr(merkle_log, "sign_root_if_due", lambda: release.wait(5) and sign())
+
+    async def run():
+        appender = AuditAppender(max_wait_ms=0)
+        event = {"event_type": "TEST", "actor_id": None, "actor_type": "SYSTEM", "event_payload": {"i": 1}}
+        # Root signing is stuck, yet the writes complete, leaves included
+        await asyncio.wait_for(appender.append_many([event]), 2)
+        await asyncio.wait_for(appender.append_many([event, event]), 2)
+        assert merkle_log.current_size() == 3
+        release.set()
+        await appender.stop()
+
+    asyncio.run(run())
+    assert store.merkle_root()["tree_size"] == 3
@@ -0,0 +1,106 @@
+import enum
+import random
+import struct
+import datetime
+
+import pytest
+
+import canonical
+from canonical import _stdlib_canonical, canonical_json, chain_hash, HASH_V2
+
+orjson = pytest.importorskip("orjson")
+
+class Level(enum.IntEnum):
+    HIGH = 1
+
+class Basis(str, enum.Enum):
+    CONSENT = "CONSENT"
+
+def _stdlib_or_error(payload):
+    try:
+        return _stdlib_canonical(payload)
+    except (TypeError, ValueError) as e:
+        return type(e)
+
+EDGE_CASES = [
+    {"a": "\x7f"},
+    {"a": "x\x7fy", "b": 1},
+    {"\x7f": 1},
+    {"a": " "},
+    {"a": "é"},
+    {"a": "\ud800"},
+    {"a": "\x00\x08\x1f\"\\/"},
+    {"a": 2 ** 64},
+    {"a": -2 ** 63 - 1},
+    {"a": 2 ** 63 - 1},
+    {"a": float("nan")},
+    {"a": [float("inf"), float("-inf")]},
+    {"a": 1e16},
+    {"a": 1.5e300},
+    {"a": 1e-5},
+    {"a": -9e-5},
+    {"a": 1e-7},
+    {"a": 0.0001},
+    {"a": -0.0},
+    {"a": 1.5},
+    {"a": None},
+    [None, 1e22],
+    1e16,
+    None,
+    {1: "a"},
+    {"b": (1, 2), "a": [True, False]},
+    {"a": Level.HIGH, "b": Basis.CONSENT},
+    {"a": datetime.datetime(2026, 1, 1)},
+    {"note": "ratio:1e5, empty:null, tiny 0.00001"},
+]
+
+@pytest.mark.parametrize("payload", EDGE_CASES, ids=repr)
+def test_fast_path_matches_stdlib_on_edge_cases(payload, monkeypatch):
+    monkeypatch.setattr(canonical, "CANONICAL_FAST_JSON", True)
+    expected = _stdlib_or_error(payload)
+    if isinstance(expected, type):
+        with pytest.raises(expected):
+            canonical_json(payload)
+    else:
+        assert canonical_json(payload) == expected
+
+def _random_value(rng: random.Random, depth: int = 0):
+    kind = rng.random()
+    if depth > 3 or kind < 0.5:
+        return rng.choice([
+            lambda: struct.unpack("d", struct.pack("Q", rng.getrandbits(64)))[0],
+            lambda: rng.random() * 10 ** rng.randint(-12, 25),
+            lambda: rng.randint(-2 ** 70, 2 ** 70),
+            lambda: rng.randint(-1000, 1000),
+            lambda: "".join(chr(rng.choice([rng.randint(0, 127), 0x7f, 0x2028, rng.randint(128, 0x2000)]))
+                            for _ in range(rng.randint(0, 6))),
+            lambda: None,
+            lambda: rng.random() < 0.5,
+        ])()
+    if kind < 0.75:
+        return [_random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+    return {_random_value(rng, 9) if rng.random() < 0.1 else f"k{rng.randint(0, 99)}": _random_value(rng, depth + 1)
+            for _ in range(rng.randint(0, 4))}
+
+def test_fast_path_matches_stdlib_on_random_payloads(monkeypatch):
+    monkeypatch.setattr(canonical, "CANONICAL_FAST_JSON", True)
+    rng = random.Random(16)
+    for _ in range(5000):
+        payload = _random_value(rng)
+        expected = _stdlib_or_error(payload)
+        if isinstance(expected, type):
+            continue
+        assert canonical_json(payload) == expected, payload
+
+def test_receipts_take_the_fast_path():
+    receipt = {
+        "version": "1.0",
+        "consent_id": "0b6f2a4e-1c3d-4e5f-8a9b-7c6d5e4f3a2b",
+        "timestamp": "2026-01-01T09:30:12.345678",
+        "purposes": [{"purpose": "ANALYTICS", "categories": ["usage"]}],
+        "kid": "k1",
+    }
+    data = canonical._fast_canonical(receipt)
+    assert data == _stdlib_canonical(receipt)
+    assert chain_hash("0" * 64, receipt, receipt["timestamp"], HASH_V2) == \
+        chain_hash("0" * 64, receipt, receipt["timestamp"], HASH_V2, _stdlib_canonical(receipt))
@@ -0,0 +1,73 @@
+import uuid
+import asyncio
+
+import pytest
+
+from conftest import auth_headers
+from decision_index import DecisionIndex
+
+def _grant(client, user_id: str, app: str, categories=("usage",)) -> dict:
+    response = client.post("/consent/grant", json={
+        "app_id": app,
+        "purposes": [{"purpose_code": "ANALYTICS", "data_categories": list(categories)}],
+    }, headers=auth_headers(user_id))
+    assert response.status_code == 200, response.text
+    return response.json()["receipt_payload"]
+
+def test_check_requires_authentication(client):
+    check = {"user_id": str(uuid.uuid4()), "app_id": str(uuid.uuid4()), "purpose_code": "ANALYTICS"}
+    assert client.post("/consent/check", json=check).status_code == 401
+    assert client.post("/consent/check-batch", json={"checks": [check]}).status_code == 401
+
+def test_decisions_only_for_the_user_or_the_app_owner(client):
+    owner, alice, mallory = (str(uuid.uuid4()) for _ in range(3))
+    shop = _grant(client, owner, "Shop")["app_id"]  # The first grant registers the app to its caller
+    _grant(client, alice, "Shop")
+    check = {"user_id": alice, "app_id": shop, "purpose_code": "ANALYTICS", "data_categories": ["usage"]}
+
+    assert client.post("/consent/check", json=check, headers=auth_headers(alice)).json()["allowed"]
+    assert client.post("/consent/check", json=check, headers=auth_headers(owner)).json()["allowed"]
+    assert client.post("/consent/check", json=check, headers=auth_headers(mallory)).status_code == 403
+
+    own = {**check, "user_id": mallory}
+    batch = client.post("/consent/check-batch", json={"checks": [own]}, headers=auth_headers(mallory))
+    assert batch.status_code == 200 and batch.json()[0]["reason"] == "no_consent"
+    batch = client.post("/consent/check-batch", json={"checks": [own, check]}, headers=auth_headers(mallory))
+    assert batch.status_code == 403
+
+    unknown = {**check, "app_id": str(uuid.uuid4())}
+    assert client.post("/consent/check", json=unknown, headers=auth_headers(owner)).status_code == 403
+    not_an_id = {**check, "app_id": "Shop"}
+    assert client.post("/consent/check", json=not_an_id, headers=auth_headers(owner)).status_code == 403
+
+def test_fallback_loads_all_pairs_in_one_lookup(client, store, monkeypatch):
+    users = [str(uuid.uuid4()) for _ in range(5)]
+    receipts = [_grant(client, user, "Shop", categories=("usage", "email")) for user in users]
+    _grant(client, users[0], "Other")
+
+    calls = []
+    lookup = store.active_grants_for
+    monkeypatch.setattr(store, "active_grants_for", lambda now, pairs: calls.append(pairs) or lookup(now, pairs))
+    monkeypatch.setattr(store, "active_grants", lambda *a, **k: pytest.fail("one query per pair"))
+
+    checks = [{"user_id": r["user_id"], "app_id": r["app_id"], "purpose_code": "ANALYTICS",
+               "data_categories": ["email"]} for r in receipts]
+    checks.append({**checks[0], "data_categories": ["location"]})
+    checks.append({**checks[0], "user_id": "not-a-uuid"})
+    cold = DecisionIndex()  # Not warmed: every check goes to the database
+    results = asyncio.run(cold.check_many(checks))
+
+    assert [r["allowed"] for r in results] == [True] * 5 + [False, False]
+    assert results[5]["reason"] == "category_not_granted"
+    assert results[0]["consent_id"] == receipts[0]["consent_id"]
+    assert len(calls) == 1 and len(calls[0]) == 5
+
+def test_owner_is_reloaded_after_the_app_cache_is_dropped(client):
+    from app_registry import app_registry
+
+    owner, alice = str(uuid.uuid4()), str(uuid.uuid4())
+    shop = _grant(client, owner, "Shop")["app_id"]
+    _grant(client, alice, "Shop")
+    app_registry.clear()
+    check = {"user_id": alice, "app_id": shop, "purpose_code": "ANALYTICS", "data_categories": ["usage"]}
+    assert client.post("/consent/check", json=check, headers=auth_headers(owner)).json()["allowed"]
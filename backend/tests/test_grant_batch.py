@@ -0,0 +1,59 @@
+import uuid
+
+import routers.consent
+from conftest import auth_headers
+
+def _item(app_id: str = "Shop", purpose: str = "ANALYTICS") -> dict:
+    return {"app_id": app_id, "purposes": [{"purpose_code": purpose, "data_categories": ["usage"]}]}
+
+def _grant_batch(client, user_id: str, items: list):
+    return client.post("/consent/grant-batch", headers=auth_headers(user_id), json={"grants": items})
+
+def test_bad_items_fail_alone(client, store, capsys):
+    user = str(uuid.uuid4())
+    items = [
+        _item(),
+        _item(app_id=str(uuid.uuid4())),  # Unregistered application
+        _item(purpose="NO_SUCH_PURPOSE"),  # Rejected by the database (purposes foreign key)
+        _item(app_id="Bank"),
+        _item(purpose="MARKETING"),
+    ]
+    response = _grant_batch(client, user, items)
+    assert response.status_code == 200, response.text
+    results = response.json()
+    assert [r["ok"] for r in results] == [True, False, False, True, True]
+    assert "not found" in results[1]["error"] and results[1]["receipt"] is None
+    assert results[2]["error"].startswith("Grant failed")
+    # The rejected group commit was retried event by event
+    assert "Audit batch of 4 event(s) failed" in capsys.readouterr().out
+
+    receipts = [r["receipt"] for r in results if r["ok"]]
+    assert [r["receipt_payload"]["purposes"][0]["purpose"] for r in receipts] == ["ANALYTICS", "ANALYTICS", "MARKETING"]
+    assert store._one("select count(*) as n from consents")["n"] == 3
+    verified = client.post("/consent/verify-batch", json={"receipts": receipts}).json()
+    assert [v["status"] for v in verified] == ["active"] * 3
+
+    # Failed items left no gap or stray leaf behind
+    chain = client.get("/audit/verify-chain", params={"full": "true"}).json()
+    assert (chain["status"], chain["verified_count"]) == ("VALID", 3)
+    assert len(store.find_merkle_leaves()) == 3
+
+def test_failed_app_lookup_fails_only_its_items(client, monkeypatch):
+    registry = routers.consent.app_registry
+    resolve = registry.resolve
+
+    async def flaky(ref, **kwargs):
+        if ref == "Broken":
+            raise ConnectionError("registry unavailable")
+        return await resolve(ref, **kwargs)
+
+    monkeypatch.setattr(registry, "resolve", flaky)
+    results = _grant_batch(client, str(uuid.uuid4()), [_item("Broken"), _item(), _item("Broken")]).json()
+    assert [r["ok"] for r in results] == [False, True, False]
+    assert results[0]["error"] == "Application lookup failed: registry unavailable"
+
+def test_oversized_batch_is_rejected(client, store, monkeypatch):
+    monkeypatch.setattr(routers.consent, "GRANT_BATCH_MAX", 2)
+    response = _grant_batch(client, str(uuid.uuid4()), [_item()] * 3)
+    assert response.status_code == 413
+    assert store._one("select count(*) as n from consents")["n"] == 0
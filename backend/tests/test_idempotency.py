@@ -0,0 +1,69 @@
+import uuid
+import asyncio
+
+import pytest
+from fastapi import Response
+
+from conftest import auth_headers
+from idempotency import REPLAY_HEADER, IdempotencyStore, _digest
+
+def _grant(client, user_id: str, key: str, purpose: str = "ANALYTICS"):
+    return client.post("/consent/grant", json={
+        "app_id": "Shop",
+        "purposes": [{"purpose_code": purpose, "data_categories": ["usage"]}],
+    }, headers={**auth_headers(user_id), "Idempotency-Key": key})
+
+def test_retry_replays_the_first_receipt(client, store):
+    user = str(uuid.uuid4())
+    first = _grant(client, user, "grant-1")
+    retry = _grant(client, user, "grant-1")
+    assert first.status_code == retry.status_code == 200
+    assert REPLAY_HEADER not in first.headers
+    assert retry.headers[REPLAY_HEADER] == "true"
+    assert retry.json() == first.json()
+    assert store._one("select count(*) as n from consents")["n"] == 1
+
+def test_key_reused_with_another_body_is_rejected(client, store):
+    user = str(uuid.uuid4())
+    assert _grant(client, user, "grant-1").status_code == 200
+    reused = _grant(client, user, "grant-1", purpose="MARKETING")
+    assert reused.status_code == 422
+    assert store._one("select count(*) as n from consents")["n"] == 1
+
+def test_keys_are_scoped_to_the_caller(client, store):
+    assert _grant(client, str(uuid.uuid4()), "grant-1").status_code == 200
+    other = _grant(client, str(uuid.uuid4()), "grant-1")
+    assert other.status_code == 200 and REPLAY_HEADER not in other.headers
+    assert store._one("select count(*) as n from consents")["n"] == 2
+
+def test_cancelled_first_request_does_not_fail_duplicates(store):
+    idempotency = IdempotencyStore(backend="table")
+    calls = []
+
+    async def run():
+        started, release = asyncio.Event(), asyncio.Event()
+
+        async def handler():
+            calls.append(1)
+            started.set()
+            await release.wait()
+            return {"consent_id": "c-1"}
+
+        body = {"consent_id": "c-1"}
+        first = asyncio.create_task(idempotency.run("key", "revoke:u", body, Response(), handler))
+        await started.wait()
+        duplicate = asyncio.create_task(idempotency.run("key", "revoke:u", body, Response(), handler))
+        await asyncio.sleep(0)
+        # The client of the first request disconnects while the handler runs
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        release.set()
+        return await duplicate
+
+    assert asyncio.run(run()) == {"consent_id": "c-1"}
+    assert len(calls) == 1 and idempotency.waited == 1
+    # The claim was completed rather than released, so a retry elsewhere replays it
+    row = store.idempotency_record(_digest("revoke:u", "key"))
+    assert row["state"] == "complete"
+    assert not idempotency._inflight
@@ -0,0 +1,110 @@
+import json
+import time
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException
+
+import jwt_auth
+import routers.auth
+from jwt_auth import AuthError, KeyUnavailable, SigningKeyCache, decode_token, mint_token, token_cache
+from routers.auth import get_current_user
+
+@pytest.fixture(autouse=True)
+def fresh_token_cache():
+    token_cache.clear()
+    yield
+    token_cache.clear()
+
+@pytest.fixture
+def rsa_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+def _jwks(private_key, kid: str) -> dict:
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    return {"keys": [{**jwk, "kid": kid, "alg": "RS256", "use": "sig"}]}
+
+def _rs256_token(private_key, kid: str, user_id: str = "u-1", expires_in: int = 3600) -> str:
+    now = int(time.time())
+    payload = {"sub": user_id, "aud": jwt_auth.JWT_AUDIENCE, "iat": now, "exp": now + expires_in}
+    return jwt.encode(payload, private_key, algorithm="RS256", headers={"kid": kid})
+
+def _use_keys(monkeypatch, keys: SigningKeyCache) -> None:
+    monkeypatch.setattr(jwt_auth, "signing_keys", keys)
+    monkeypatch.setattr(routers.auth, "signing_keys", keys)
+
+def test_hs256_token_is_verified_locally():
+    claims = decode_token(mint_token("u-1", email="a@example.com"))
+    assert claims["sub"] == "u-1" and claims["email"] == "a@example.com"
+
+    user = asyncio.run(get_current_user(f"Bearer {mint_token('u-1')}"))
+    assert user.id == "u-1" and user.role == "authenticated"
+
+def test_expired_and_forged_tokens_are_rejected():
+    with pytest.raises(AuthError, match="expired"):
+        decode_token(mint_token("u-1", expires_in=-3600))
+    with pytest.raises(AuthError, match="Signature"):
+        decode_token(mint_token("u-1", secret="not-the-secret"))
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(get_current_user(f"Bearer {mint_token('u-1', secret='not-the-secret')}"))
+    assert e.value.status_code == 401
+
+def test_jwks_token_is_verified_locally(rsa_key):
+    keys = SigningKeyCache()
+    keys.set_keys(_jwks(rsa_key, "k1"))
+    assert decode_token(_rs256_token(rsa_key, "k1"), keys)["sub"] == "u-1"
+
+    with pytest.raises(AuthError, match="expired"):
+        decode_token(_rs256_token(rsa_key, "k1", expires_in=-3600), keys)
+    other = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    with pytest.raises(AuthError, match="Signature"):
+        decode_token(_rs256_token(other, "k1"), keys)
+    with pytest.raises(KeyUnavailable):
+        decode_token(_rs256_token(rsa_key, "k2"), keys)
+
+def test_unknown_kid_refreshes_the_jwks_off_the_event_loop(monkeypatch, rsa_key):
+    keys = SigningKeyCache(jwks_url="https://auth.invalid/jwks.json")
+    fetched_on = []
+
+    def refresh():
+        fetched_on.append(threading.get_ident())
+        keys.set_keys(_jwks(rsa_key, "rotated"))
+        return True
+
+    monkeypatch.setattr(keys, "refresh", refresh)
+    _use_keys(monkeypatch, keys)
+
+    async def authenticate():
+        user = await get_current_user(f"Bearer {_rs256_token(rsa_key, 'rotated')}")
+        return user, threading.get_ident()
+
+    user, loop_thread = asyncio.run(authenticate())
+    assert user.id == "u-1"
+    assert len(fetched_on) == 1 and fetched_on[0] != loop_thread
+
+def test_unverifiable_token_falls_back_to_the_auth_server(monkeypatch, store, rsa_key):
+    _use_keys(monkeypatch, SigningKeyCache())  # No JWKS configured
+    asked = []
+
+    def get_auth_user(token):
+        asked.append(token)
+        return SimpleNamespace(id="u-remote", email="r@example.com", role="authenticated",
+                               aud="authenticated", app_metadata={}, user_metadata={})
+
+    monkeypatch.setattr(store, "get_auth_user", get_auth_user)
+    token = _rs256_token(rsa_key, "k1")
+    user = asyncio.run(get_current_user(f"Bearer {token}"))
+    assert user.id == "u-remote" and asked == [token]
+
+    # Cached: the auth server is asked once per token
+    asyncio.run(get_current_user(f"Bearer {token}"))
+    assert len(asked) == 1
+
+    monkeypatch.setattr(routers.auth, "AUTH_REMOTE_FALLBACK", False)
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(get_current_user(f"Bearer {_rs256_token(rsa_key, 'k2')}"))
+    assert e.value.status_code == 401
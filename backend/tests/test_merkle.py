@@ -0,0 +1,177 @@
+import uuid
+import asyncio
+import hashlib
+import itertools
+
+from audit_log import AuditAppender, MerkleRootSigner
+from chain import GENESIS_HASH
+from merkle import merkle_log, verify_consistency, verify_inclusion
+
+# --- RFC 9162 section 2.1, written out independently of merkle.py ---
+
+def _leaf(event: dict) -> bytes:
+    return hashlib.sha256(b"\x00" + f"{event['event_id']}:{event['hash_current']}".encode()).digest()
+
+def _node(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+def _k(n: int) -> int:
+    k = 1
+    while k << 1 < n:
+        k <<= 1
+    return k
+
+def mth(leaves: list) -> bytes:
+    if not leaves:
+        return hashlib.sha256(b"").digest()
+    if len(leaves) == 1:
+        return leaves[0]
+    k = _k(len(leaves))
+    return _node(mth(leaves[:k]), mth(leaves[k:]))
+
+def path(m: int, leaves: list) -> list:
+    if len(leaves) <= 1:
+        return []
+    k = _k(len(leaves))
+    if m < k:
+        return path(m, leaves[:k]) + [mth(leaves[k:])]
+    return path(m - k, leaves[k:]) + [mth(leaves[:k])]
+
+def subproof(m: int, leaves: list, complete: bool) -> list:
+    n = len(leaves)
+    if m == n:
+        return [] if complete else [mth(leaves)]
+    k = _k(n)
+    if m <= k:
+        return subproof(m, leaves[:k], complete) + [mth(leaves[k:])]
+    return subproof(m - k, leaves[k:], False) + [mth(leaves[:k])]
+
+def _hex(hashes: list) -> list:
+    return [h.hex() for h in hashes]
+
+# --- helpers ---
+
+_seconds = itertools.count()
+
+def _append(store, count: int) -> list:
+    head = store.latest_audit_event()
+    prev = head["hash_current"] if head else GENESIS_HASH
+    rows = []
+    for i in range(count):
+        current = hashlib.sha256(f"{prev}:{i}".encode()).hexdigest()
+        rows.append({
+            "event_type": "TEST", "actor_id": None, "actor_type": "SYSTEM",
+            "event_payload": {"consent_id": str(uuid.uuid4())},
+            "timestamp": "2026-01-01T00:%02d:%02d" % divmod(next(_seconds), 60),
+            "hash_prev": prev, "hash_current": current, "hash_version": 2, "shard": 0,
+        })
+        prev = current
+    return store.append_ledger(rows)
+
+def _leaves_in_tree_order(store) -> list:
+    leaves = store.find_merkle_leaves()
+    assert [leaf["leaf_index"] for leaf in leaves] == list(range(len(leaves)))
+    events = {e["event_id"]: e for e in store.audit_events_after(None, 10000)}
+    return [_leaf(events[leaf["event_id"]]) for leaf in leaves]
+
+# --- tests ---
+
+def test_leaves_are_stored_with_their_batch(store):
+    events = _append(store, 3)
+    leaves = store.find_merkle_leaves()
+    assert [leaf["event_id"] for leaf in leaves] == [e["event_id"] for e in events]
+    assert [leaf["consent_id"] for leaf in leaves] == [e["event_payload"]["consent_id"] for e in events]
+    assert [leaf["leaf_hash"] for leaf in leaves] == _hex(_leaf(e) for e in events)
+
+def test_roots_and_proofs_match_rfc_9162(store):
+    _append(store, 13)
+    leaves = _leaves_in_tree_order(store)
+    for n in range(1, 14):
+        root = mth(leaves[:n]).hex()
+        assert merkle_log.root_at(n) == root
+        for m in range(n):
+            proof = merkle_log.inclusion_proof(m, n)
+            assert proof == _hex(path(m, leaves[:n]))
+            assert verify_inclusion(m, n, leaves[m].hex(), proof, root)
+        for m in range(1, n):
+            proof = merkle_log.consistency_proof(m, n)
+            assert proof == _hex(subproof(m, leaves[:n], True))
+            assert verify_consistency(m, n, mth(leaves[:m]).hex(), root, proof)
+
+def test_tampered_proofs_are_rejected(store):
+    _append(store, 7)
+    leaves = _leaves_in_tree_order(store)
+    root = mth(leaves).hex()
+    proof = merkle_log.inclusion_proof(2, 7)
+    forged = [proof[0][::-1]] + proof[1:]
+    assert not verify_inclusion(2, 7, leaves[2].hex(), forged, root)
+    assert not verify_inclusion(3, 7, leaves[2].hex(), proof, root)
+    consistency = merkle_log.consistency_proof(3, 7)
+    assert not verify_consistency(3, 7, mth(leaves[:3]).hex(), root, consistency[:-1])
+    assert not verify_consistency(3, 7, mth(leaves[:4]).hex(), root, consistency)
+
+def test_workers_extend_one_tree(store):
+    async def run():
+        # Each API worker has its own appender; none keeps a copy of the tree
+        workers = [AuditAppender(max_batch_size=4, max_wait_ms=0) for _ in range(3)]
+
+        async def write(n: int, appender: AuditAppender) -> None:
+            for i in range(8):
+                await appender.append_many([
+                    {"event_type": "TEST", "actor_id": None, "actor_type": "SYSTEM",
+                     "event_payload": {"worker": n, "i": i, "j": j}} for j in range(2)
+                ])
+
+        await asyncio.gather(*(write(n, a) for n, a in enumerate(workers)))
+        for appender in workers:
+            await appender.stop()
+
+    asyncio.run(run())
+    leaves = _leaves_in_tree_order(store)
+    assert len(leaves) == 48
+    # Every stored node is the hash of the subtree it names: no worker overwrote another's
+    for n in (1, 5, 16, 31, 48):
+        assert merkle_log.root_at(n) == mth(leaves[:n]).hex()
+    for m in range(48):
+        assert merkle_log.inclusion_proof(m, 48) == _hex(path(m, leaves))
+
+def test_backfill_adds_events_written_before_the_index(store):
+    _append(store, 5)
+    # As if the last three events predated the Merkle index, which also left stale nodes
+    store._conn.execute("delete from merkle_leaves where leaf_index >= 2")
+    store._conn.execute("update merkle_nodes set hash = ? where node_index >= 1", ("0" * 64,))
+    store._conn.execute("update merkle_nodes set hash = (select leaf_hash from merkle_leaves where leaf_index = 1) "
+                        "where level = 0 and node_index = 1")
+    assert merkle_log.backfill(page_size=2) == 3
+    assert merkle_log.backfill() == 0
+    leaves = _leaves_in_tree_order(store)
+    assert len(leaves) == 5 and merkle_log.root_at(5) == mth(leaves).hex()
+
+def test_root_signer_logs_failures_and_retries(store, monkeypatch, capsys):
+    _append(store, 3)
+    monkeypatch.setattr(merkle_log, "root_interval", 1)
+    sign = merkle_log.sign_root_if_due
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("database unavailable")
+        return sign()
+
+    monkeypatch.setattr(merkle_log, "sign_root_if_due", flaky)
+    signer = MerkleRootSigner()
+    signer.RETRY_MIN_SECONDS = 0.01
+
+    async def run():
+        signer.notify()
+        for _ in range(100):
+            if store.merkle_root():
+                break
+            await asyncio.sleep(0.01)
+        await signer.stop()
+
+    asyncio.run(run())
+    assert signer.failures == 1
+    assert store.merkle_root()["tree_size"] == 3
+    assert "Merkle root signing failed" in capsys.readouterr().out
@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+from audit_log import ShardedAuditAppender
+from shards import WriterLease, WriterLeaseError, create_anchor, verify_anchors
+
+def _event(i: int) -> dict:
+    return {"event_type": "TEST", "actor_id": None, "actor_type": "SYSTEM", "event_payload": {"i": i}}
+
+def _write(lease: WriterLease, per_shard: int = 2) -> None:
+    async def run():
+        appender = ShardedAuditAppender(shards=2, max_wait_ms=0, lease=lease)
+        for i in range(per_shard):
+            await asyncio.gather(*(appender.append(**_event(i), shard=shard) for shard in (0, 1)))
+        await appender.stop()
+
+    asyncio.run(run())
+
+@pytest.fixture
+def lease(store):
+    held = WriterLease()
+    asyncio.run(held.acquire())
+    yield held
+    asyncio.run(held.release())
+
+def _reasons(result: dict) -> list:
+    return [v["reason"] for v in result["violations"]]
+
+# --- single writer ---
+
+def test_one_process_holds_the_writer_lease(store):
+    first, second = WriterLease(), WriterLease()
+
+    async def run():
+        await first.acquire()
+        with pytest.raises(WriterLeaseError):
+            await second.acquire()
+        await first.release()
+        await second.acquire()
+        await second.release()
+
+    asyncio.run(run())
+    assert store._one("select count(*) as n from writer_leases")["n"] == 0
+
+def test_expired_lease_is_taken_over_and_the_old_holder_stops_writing(store):
+    old, new = WriterLease(), WriterLease()
+
+    async def run():
+        await old.acquire()
+        # The holder stopped renewing (e.g. it hung) and its lease ran out
+        store._conn.execute("update writer_leases set expires_at = '2000-01-01T00:00:00'")
+        await new.acquire()
+        assert not await asyncio.to_thread(old._claim)
+        with pytest.raises(WriterLeaseError):
+            old.check()
+        await old.release()
+        new.check()
+        await new.release()
+
+    asyncio.run(run())
+
+def test_sharded_writes_require_the_lease(store):
+    async def run():
+        appender = ShardedAuditAppender(shards=2, max_wait_ms=0, lease=WriterLease())
+        with pytest.raises(WriterLeaseError):
+            await appender.append(**_event(0), shard=1)
+        await appender.stop()
+
+    asyncio.run(run())
+    assert store.latest_audit_event() is None
+
+# --- anchors ---
+
+def test_clean_anchor_sequence_verifies(store, lease):
+    for _ in range(3):
+        _write(lease)
+        assert create_anchor(store, shards=2)
+    assert create_anchor(store, shards=2) is None  # No head moved
+    result = asyncio.run(verify_anchors(full=True))
+    assert result["status"] == "VALID" and result["anchors_verified"] == 3
+
+def test_missing_anchor_is_a_gap(store, lease):
+    for _ in range(3):
+        _write(lease)
+        create_anchor(store, shards=2)
+    store._conn.execute("delete from audit_anchors where anchor_seq = 2")
+    result = asyncio.run(verify_anchors(full=True))
+    assert result["status"] == "TAMPERED"
+    assert "Anchor Missing - Anchor sequence has a gap" in _reasons(result)
+    assert "Anchor Link Broken - Previous root mismatch" in _reasons(result)
+
+def test_rolled_back_shard_head_is_detected(store, lease):
+    _write(lease)
+    create_anchor(store, shards=2)
+    # Drop shard 0's newest event and anchor what is left
+    head = store.latest_audit_event(0)
+    store._conn.execute("delete from audit_events where event_id = ?", (head["event_id"],))
+    create_anchor(store, shards=2, force=True)
+    result = asyncio.run(verify_anchors(full=True))
+    assert result["status"] == "TAMPERED"
+    assert _reasons(result) == ["Shard Head Moved Backwards"]
+
+def test_edited_anchored_head_is_detected(store, lease):
+    _write(lease)
+    create_anchor(store, shards=2)
+    assert asyncio.run(verify_anchors())["status"] == "VALID"
+
+    head = store.latest_audit_event(1)
+    store.update_audit_event(head["event_id"], {"event_payload": {"i": "rewritten"}})
+    result = asyncio.run(verify_anchors())
+    assert result["status"] == "TAMPERED"
+    assert _reasons(result) == ["Anchor Mismatch - Anchored history was modified"]
+
+    store._conn.execute("delete from audit_events where event_id = ?", (head["event_id"],))
+    assert _reasons(asyncio.run(verify_anchors())) == ["Anchored Event Missing"]
+
+def test_forged_anchor_signature_is_detected(store, lease):
+    _write(lease)
+    create_anchor(store, shards=2)
+    store._conn.execute("update audit_anchors set signature = 'forged'")
+    assert _reasons(asyncio.run(verify_anchors(full=True))) == ["Anchor Signature Invalid"]
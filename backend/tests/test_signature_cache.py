@@ -0,0 +1,96 @@
+import uuid
+import base64
+
+import pytest
+
+import utils
+from conftest import auth_headers
+from signature_cache import SignatureCache, signature_cache
+
+@pytest.fixture
+def crypto(monkeypatch):
+    """Records every signature check that reaches the public-key crypto."""
+    calls = []
+    verify = utils._verify_signature
+
+    def counted(data, signature_b64, kid):
+        calls.append(signature_b64)
+        return verify(data, signature_b64, kid)
+
+    monkeypatch.setattr(utils, "_verify_signature", counted)
+    signature_cache.clear()
+    yield calls
+    signature_cache.clear()
+
+def _forge(signature: str) -> str:
+    raw = bytearray(base64.b64decode(signature))
+    raw[-1] ^= 0x01
+    return base64.b64encode(bytes(raw)).decode()
+
+def _signed(consent_id: str = "c-1") -> tuple:
+    payload = {"consent_id": consent_id, "kid": utils.signing_key_id()}
+    return payload, utils.sign_payload(payload)
+
+def test_only_verified_signatures_are_memoized(crypto):
+    payload, signature = _signed()
+    forged = _forge(signature)
+    for _ in range(3):
+        assert not utils.verify_signature(payload, forged)
+    assert len(crypto) == 3 and len(signature_cache.cache) == 0
+
+    assert utils.verify_signature(payload, signature)
+    assert utils.verify_signature(payload, signature)
+    assert len(crypto) == 4 and len(signature_cache.cache) == 1
+    # The good signature's entry does not vouch for a forged one over the same payload
+    assert not utils.verify_signature(payload, forged)
+    assert not utils.verify_signature({**payload, "consent_id": "c-2"}, signature)
+    assert len(crypto) == 6 and len(signature_cache.cache) == 1
+
+def test_unreadable_signatures_are_not_memoized(crypto):
+    payload, _ = _signed()
+    for signature in ("not base64!", "", _signed("c-2")[1]):
+        assert not utils.verify_signature(payload, signature)
+        assert not utils.verify_signature(payload, signature)
+    assert not utils.verify_signature({"kid": "0" * 16}, "AAAA")  # Unknown key
+    assert len(signature_cache.cache) == 0
+
+def test_workers_never_memoize(crypto):
+    payload, signature = _signed()
+    assert utils.verify_signature(payload, signature, memoize=False)
+    assert len(signature_cache.cache) == 0
+    assert utils.verify_signature(payload, signature)
+    assert len(crypto) == 2
+
+def test_disabled_cache_verifies_every_time(monkeypatch, crypto):
+    monkeypatch.setattr(utils, "signature_cache", SignatureCache(maxsize=0))
+    payload, signature = _signed()
+    assert utils.verify_signature(payload, signature) and utils.verify_signature(payload, signature)
+    assert not utils.verify_signature(payload, _forge(signature))
+    assert len(crypto) == 3
+
+def test_batch_memoizes_valid_receipts_only(client, crypto):
+    user = str(uuid.uuid4())
+    receipts = []
+    for _ in range(3):
+        response = client.post("/consent/grant", headers=auth_headers(user), json={
+            "app_id": "Shop", "purposes": [{"purpose_code": "ANALYTICS", "data_categories": ["usage"]}],
+        })
+        receipts.append(response.json())
+    receipts[1] = {**receipts[1], "signature": _forge(receipts[1]["signature"])}
+
+    def statuses():
+        response = client.post("/consent/verify-batch", json={"receipts": receipts})
+        return [r["status"] for r in response.json()]
+
+    # Batch signatures are checked in the worker pool, which never memoizes; the API
+    # process then remembers the ones that passed
+    assert statuses() == ["active", "invalid_signature", "active"]
+    assert len(signature_cache.cache) == 2
+    assert statuses() == ["active", "invalid_signature", "active"]
+    assert len(signature_cache.cache) == 2
+
+    crypto.clear()
+    response = client.post("/consent/verify", json={"receipt": receipts[1]})
+    assert response.json()["status"] == "invalid_signature" and len(crypto) == 1
+    assert client.post("/consent/verify", json={"receipt": receipts[0]}).json()["status"] == "active"
+    assert len(crypto) == 1  # Answered from the memo
@@ -0,0 +1,121 @@
+import os
+import uuid
+import base64
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+
+import routers.consent
+import signing_keys
+import utils
+from canonical import canonical_json
+from conftest import auth_headers
+from signing_keys import RSA_PSS, KeyRing, key_id
+
+def _write_private(directory, private, name: str, mtime: int) -> str:
+    path = os.path.join(directory, name)
+    with open(path, "wb") as f:
+        f.write(private.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption()
+        ))
+    os.utime(path, (mtime, mtime))
+    return path
+
+def _retire(path: str) -> None:
+    """Replaces a private key file with its public half, as an operator would."""
+    with open(path, "rb") as f:
+        private = serialization.load_pem_private_key(f.read(), password=None)
+    with open(path[:-len(".pem")] + ".pub.pem", "wb") as f:
+        f.write(private.public_key().public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo
+        ))
+    os.remove(path)
+
+@pytest.fixture
+def ring(tmp_path, monkeypatch):
+    """A keyring over an empty key directory, used by the API and the signing helpers."""
+    keys = KeyRing(directory=str(tmp_path), active_kid=None, algorithm="Ed25519")
+    for module in (signing_keys, utils, routers.consent):
+        monkeypatch.setattr(module, "keyring", keys)
+    return keys
+
+def _grant(client, user_id: str) -> dict:
+    response = client.post("/consent/grant", headers=auth_headers(user_id), json={
+        "app_id": "Shop", "purposes": [{"purpose_code": "ANALYTICS", "data_categories": ["usage"]}],
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def _status(client, receipt: dict) -> str:
+    response = client.post("/consent/verify", json={"receipt": receipt})
+    assert response.status_code == 200, response.text
+    return response.json()["status"]
+
+def test_receipts_from_a_rotated_key_keep_verifying(ring, client, tmp_path):
+    user = str(uuid.uuid4())
+    old = _grant(client, user)
+    old_kid = old["receipt_payload"]["kid"]
+    assert old_kid == ring.signer().kid
+
+    # Rotate: add a new private key and make it the active signer
+    new_key = ed25519.Ed25519PrivateKey.generate()
+    _write_private(str(tmp_path), new_key, "next.pem", mtime=2_000_000_000)
+    ring.load()
+    new = _grant(client, user)
+    new_kid = new["receipt_payload"]["kid"]
+    assert new_kid == key_id(new_key.public_key()) != old_kid
+
+    keys = {k["kid"]: k["active"] for k in client.get("/consent/keys").json()["keys"]}
+    assert keys == {old_kid: False, new_kid: True}
+    assert _status(client, old) == _status(client, new) == "active"
+
+    # Retire the old signer: its public key alone still verifies what it signed
+    _retire(ring.get(old_kid).source)
+    ring.load()
+    assert ring.get(old_kid).private_key is None and ring.signer().kid == new_kid
+    response = client.post("/consent/verify-batch", json={"receipts": [old, new]})
+    assert [r["status"] for r in response.json()] == ["active", "active"]
+    with pytest.raises(ValueError):
+        utils.sign_payload({"kid": old_kid, "consent_id": "c-1"})
+
+def test_dropping_a_key_invalidates_its_receipts(ring, client):
+    user = str(uuid.uuid4())
+    receipt = _grant(client, user)
+    assert _status(client, receipt) == "active"  # Now in the signature cache as well
+
+    os.remove(ring.signer().source)
+    ring.load()  # Generates a fresh signer in the emptied directory
+    assert ring.get(receipt["receipt_payload"]["kid"]) is None
+    assert _status(client, receipt) == "invalid_signature"
+    assert _status(client, _grant(client, user)) == "active"
+
+def test_pinned_key_id_selects_the_signer(tmp_path):
+    older = ed25519.Ed25519PrivateKey.generate()
+    newer = ed25519.Ed25519PrivateKey.generate()
+    _write_private(str(tmp_path), older, "a.pem", mtime=1_000_000_000)
+    _write_private(str(tmp_path), newer, "b.pem", mtime=2_000_000_000)
+
+    assert KeyRing(directory=str(tmp_path), active_kid=None).load().signer().kid == key_id(newer.public_key())
+    pinned = KeyRing(directory=str(tmp_path), active_kid=key_id(older.public_key())).load()
+    assert pinned.signer().kid == key_id(older.public_key())
+
+    _retire(os.path.join(str(tmp_path), "a.pem"))
+    with pytest.raises(ValueError):
+        KeyRing(directory=str(tmp_path), active_kid=key_id(older.public_key())).load()
+
+def test_receipts_without_a_kid_use_the_rsa_keys(ring, tmp_path):
+    legacy = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    _write_private(str(tmp_path), legacy, "legacy.pem", mtime=1_000_000_000)
+    _write_private(str(tmp_path), ed25519.Ed25519PrivateKey.generate(), "current.pem", mtime=2_000_000_000)
+    ring.load()
+    assert ring.signer().algorithm != RSA_PSS
+
+    payload = {"consent_id": "c-1", "purposes": ["ANALYTICS"]}  # Issued before receipts carried a kid
+    key = ring.get(key_id(legacy.public_key()))
+    signed = base64.b64encode(key.sign(canonical_json(payload))).decode()
+    assert utils.verify_signature(payload, signed, memoize=False)
+    assert not utils.verify_signature({**payload, "consent_id": "c-2"}, signed, memoize=False)
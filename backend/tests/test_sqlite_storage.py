@@ -0,0 +1,199 @@
+"""
+SQLiteStorage against the Storage contract, mirroring what test_ledger_postgres.py
+checks for append_ledger_batch() so both backends refuse and keep the same batches.
+"""
+import uuid
+import itertools
+
+import pytest
+
+from storage.base import ApplicationExists, LedgerConflict, LedgerRejected
+from storage.sqlite_storage import SQLiteStorage
+
+GENESIS = "0" * 64
+_clock = itertools.count(1)
+
+def _event(hash_prev: str, hash_current: str, **extra) -> dict:
+    return {"event_type": "TEST", "actor_id": None, "actor_type": "SYSTEM", "event_payload": {"h": hash_current},
+            "timestamp": f"2026-01-01T00:00:00.{next(_clock):06d}", "hash_prev": hash_prev, "hash_current": hash_current,
+            "hash_version": 2, **extra}
+
+def _grant(user_id: str, app_id: str, expiry: str = "2027-01-01T00:00:00") -> dict:
+    consent_id = str(uuid.uuid4())
+    return {
+        "consent": {"consent_id": consent_id, "user_id": user_id, "app_id": app_id,
+                    "expiry_time": expiry, "status": "active"},
+        "purposes": [{"purpose_code": "ANALYTICS", "data_categories": ["usage", "email"]}],
+        "receipt": {"signed_payload": {"consent_id": consent_id}, "signature": "sig"},
+    }
+
+def _app(store, name: str = "Shop") -> str:
+    return store.create_application({"app_name": name, "owner_user_id": str(uuid.uuid4())})["app_id"]
+
+def _count(store, table: str) -> int:
+    return store._one(f"select count(*) as n from {table}")["n"]
+
+# --- ledger writes ---
+
+def test_grant_rows_are_written_with_their_event(store):
+    user, app = str(uuid.uuid4()), _app(store)
+    grant = _grant(user, app)
+    stored = store.append_ledger([
+        _event(GENESIS, "a" * 64, event_type="CONSENT_GRANTED", actor_id=user, grant=grant),
+        _event("a" * 64, "b" * 64),
+    ])
+    assert [e["hash_current"] for e in stored] == ["a" * 64, "b" * 64]
+    assert all(e["shard"] == 0 and e["event_id"] for e in stored)
+
+    consent_id = grant["consent"]["consent_id"]
+    assert store.consent_statuses([consent_id, str(uuid.uuid4())]) == {consent_id: "active"}
+    [active] = store.active_grants_for("2026-06-01T00:00:00", [(user, app)])
+    assert active["purposes"] == [{"purpose_code": "ANALYTICS", "data_categories": ["usage", "email"]}]
+    assert store.get_audit_event(stored[0]["event_id"])["event_payload"] == {"h": "a" * 64}
+    assert store.latest_audit_event()["hash_current"] == "b" * 64
+
+def test_failed_statement_rolls_back_the_whole_batch(store):
+    user, app = str(uuid.uuid4()), _app(store)
+    bad = _grant(user, str(uuid.uuid4()))  # Unknown app: foreign key violation
+    with pytest.raises(LedgerRejected):
+        store.append_ledger([
+            _event(GENESIS, "a" * 64, grant=_grant(user, app)),
+            _event("a" * 64, "b" * 64, grant=bad),
+        ])
+    tables = ("audit_events", "consents", "consent_purposes", "consent_receipts", "merkle_leaves")
+    assert [_count(store, t) for t in tables] == [0] * len(tables)
+    # The storage is usable afterwards
+    store.append_ledger([_event(GENESIS, "a" * 64)])
+
+def test_expiring_an_inactive_consent_rejects_the_batch(store):
+    user = str(uuid.uuid4())
+    grant = _grant(user, _app(store))
+    store.append_ledger([_event(GENESIS, "a" * 64, grant=grant)])
+    expire = {"consent_id": grant["consent"]["consent_id"]}
+    store.append_ledger([_event("a" * 64, "b" * 64, expire=expire)])
+    with pytest.raises(LedgerRejected, match="not active"):
+        store.append_ledger([_event("b" * 64, "c" * 64), _event("c" * 64, "d" * 64, expire=expire)])
+    assert _count(store, "audit_events") == 2
+    assert store.consent_statuses([expire["consent_id"]]) == {expire["consent_id"]: "expired"}
+
+def test_stale_head_is_a_conflict(store):
+    store.append_ledger([_event(GENESIS, "a" * 64)])
+    with pytest.raises(LedgerConflict):
+        store.append_ledger([_event(GENESIS, "b" * 64)])
+    # Heads are per shard
+    store.append_ledger([_event(GENESIS, "c" * 64, shard=1), _event("c" * 64, "d" * 64, shard=1)])
+    with pytest.raises(LedgerConflict):
+        store.append_ledger([_event("a" * 64, "e" * 64), _event("a" * 64, "f" * 64)])
+    assert _count(store, "audit_events") == 3
+    assert store.latest_audit_event(1)["hash_current"] == "d" * 64
+
+def test_writers_sharing_a_database_file_see_each_others_heads(tmp_path):
+    path = str(tmp_path / "ledger.db")
+    first, second = SQLiteStorage(path), SQLiteStorage(path)
+    try:
+        first.append_ledger([_event(GENESIS, "a" * 64)])
+        with pytest.raises(LedgerConflict):
+            second.append_ledger([_event(GENESIS, "b" * 64)])
+        second.append_ledger([_event("a" * 64, "b" * 64)])
+        assert [leaf["leaf_index"] for leaf in first.find_merkle_leaves()] == [0, 1]
+    finally:
+        first.close()
+        second.close()
+
+# --- reads ---
+
+def test_event_pages_follow_the_cursor_contract(store):
+    user = str(uuid.uuid4())
+    prev, rows = GENESIS, []
+    for i in range(6):
+        current = f"{i:x}".rjust(64, "0")
+        kind = "CONSENT_GRANTED" if i % 2 else "TEST"
+        rows.append(_event(prev, current, event_type=kind, actor_id=user if i < 3 else None,
+                           event_payload={"consent_id": "c-%d" % (i % 3)}))
+        prev = current
+    stored = store.append_ledger(rows)
+    ids = [e["event_id"] for e in stored]
+
+    first = store.audit_events_after(None, 4)
+    assert [e["event_id"] for e in first] == ids[:4]
+    cursor = (first[-1]["timestamp"], first[-1]["event_id"])
+    assert [e["event_id"] for e in store.audit_events_after(cursor, 4)] == ids[4:]
+
+    newest = store.list_audit_events(3)
+    assert [e["event_id"] for e in newest] == ids[:2:-1]
+    before = (newest[-1]["timestamp"], newest[-1]["event_id"])
+    assert [e["event_id"] for e in store.list_audit_events(10, before=before)] == ids[2::-1]
+
+    assert [e["event_id"] for e in store.list_audit_events(10, actor_id=user, event_type="CONSENT_GRANTED")] == [ids[1]]
+    assert [e["event_id"] for e in store.list_audit_events(10, consent_id="c-2")] == [ids[5], ids[2]]
+    window = store.list_audit_events(10, since=stored[1]["timestamp"], until=stored[3]["timestamp"])
+    assert [e["event_id"] for e in window] == [ids[2], ids[1]]
+    assert set(store.list_audit_events(1, columns=["event_id", "shard"])[0]) == {"event_id", "shard"}
+    with pytest.raises(ValueError):
+        store.list_audit_events(1, columns=["event_id", "secret"])
+
+def test_consent_lifecycle_queries(store):
+    app = _app(store)
+    users = [str(uuid.uuid4()) for _ in range(3)]
+    grants = [_grant(users[0], app, "2026-03-01T00:00:00"), _grant(users[1], app), _grant(users[2], app)]
+    prev, rows = GENESIS, []
+    for i, grant in enumerate(grants):
+        rows.append(_event(prev, str(i) * 64, grant=grant))
+        prev = str(i) * 64
+    store.append_ledger(rows)
+    ids = [g["consent"]["consent_id"] for g in grants]
+
+    revoked = store.revoke_consent(ids[2], "2026-02-01T00:00:00")
+    assert revoked["status"] == "revoked" and revoked["user_id"] == users[2]
+    assert store.revoke_consent(str(uuid.uuid4()), "2026-02-01T00:00:00") is None
+
+    now = "2026-06-01T00:00:00"
+    assert [c["consent_id"] for c in store.expired_consents(now, 10)] == [ids[0]]
+    assert [c["consent_id"] for c in store.active_grants(now, 10)] == [ids[1]]
+    assert {c["consent_id"] for c in store.active_grants("2026-01-15T00:00:00", 10)} == set(ids[:2])
+    page = store.active_grants("2026-01-15T00:00:00", 1)
+    rest = store.active_grants("2026-01-15T00:00:00", 10, after=page[0]["consent_id"])
+    assert len(page) == len(rest) == 1 and page[0]["consent_id"] < rest[0]["consent_id"]
+    assert store.active_grants_for(now, [(users[2], app), (users[0], app)]) == []
+
+def test_application_names_are_unique(store):
+    app = _app(store, "Shop")
+    with pytest.raises(ApplicationExists):
+        _app(store, "Shop")
+    assert store.find_application("Shop")["app_id"] == app
+    assert store.get_application(app)["app_name"] == "Shop"
+    assert store.get_application(str(uuid.uuid4())) is None
+
+# --- idempotency keys and checkpoints ---
+
+def test_idempotency_key_lifecycle(store):
+    record = {"idempotency_key": "k", "fingerprint": "f", "expires_at": "2999-01-01T00:00:00"}
+    assert store.claim_idempotency_key(record)
+    assert not store.claim_idempotency_key({**record, "fingerprint": "other"})
+    store.complete_idempotency_key("k", {"ok": True}, "2999-01-02T00:00:00")
+    row = store.idempotency_record("k")
+    assert (row["state"], row["response"], row["fingerprint"]) == ("complete", {"ok": True}, "f")
+    store.release_idempotency_key("k")  # Only pending claims are released
+    assert store.idempotency_record("k")["state"] == "complete"
+
+    assert store.purge_idempotency_keys("2998-01-01T00:00:00") == 0
+    assert store.purge_idempotency_keys("2999-01-03T00:00:00") == 1
+    assert store.idempotency_record("k") is None
+
+    assert store.claim_idempotency_key(record)
+    store.release_idempotency_key("k")
+    assert store.claim_idempotency_key(record)
+    # An expired claim is taken over
+    assert store.claim_idempotency_key({**record, "idempotency_key": "old", "expires_at": "2000-01-01T00:00:00"})
+    assert store.claim_idempotency_key({**record, "idempotency_key": "old", "fingerprint": "new"})
+    assert store.idempotency_record("old")["fingerprint"] == "new"
+
+def test_checkpoints_round_trip(store):
+    checkpoint = {"checkpoint_id": "global", "last_event_id": str(uuid.uuid4()),
+                  "last_timestamp": "2026-01-01T00:00:00", "last_hash": "a" * 64, "verified_count": 3,
+                  "updated_at": "2026-01-01T00:00:01"}
+    store.save_checkpoint(checkpoint)
+    store.save_checkpoint({**checkpoint, "verified_count": 5})
+    assert store.get_checkpoint("global")["verified_count"] == 5
+    store.delete_checkpoint("global")
+    assert store.get_checkpoint("global") is None
@@ -0,0 +1,38 @@
+import uuid
+import asyncio
+
+from status_cache import StatusCache, LocalStatusBackend
+
+def test_write_through_and_revoked_set():
+    async def run():
+        cache = StatusCache(LocalStatusBackend())
+        active, revoked, unknown = (str(uuid.uuid4()) for _ in range(3))
+        await cache.put_many({active: "active", revoked: "revoked"})
+        assert await cache.get_many([active, revoked, unknown]) == {active: "active", revoked: "revoked"}
+
+        # Revocation is final: answered from the revoked set even once the backend forgot it
+        await cache.backend.clear()
+        assert await cache.get(revoked) == "revoked"
+        assert await cache.get(active) is None
+
+        await cache.invalidate(revoked)
+        assert await cache.get(revoked) is None
+        return cache.stats()
+
+    stats = asyncio.run(run())
+    assert stats["hits"] == 3 and stats["misses"] == 3
+
+def test_verify_sees_a_revocation_through_the_cache(client):
+    from conftest import auth_headers
+
+    user = str(uuid.uuid4())
+    receipt = client.post("/consent/grant", json={
+        "app_id": "Shop", "purposes": [{"purpose_code": "ANALYTICS", "data_categories": ["usage"]}],
+    }, headers=auth_headers(user)).json()
+    assert client.post("/consent/verify", json={"receipt": receipt}).json()["status"] == "active"
+
+    consent_id = receipt["receipt_payload"]["consent_id"]
+    assert client.post("/consent/revoke", json={"consent_id": consent_id}, headers=auth_headers(user)).status_code == 200
+    assert client.post("/consent/verify", json={"receipt": receipt}).json()["status"] == "revoked"
+    batch = client.post("/consent/verify-batch", json={"receipts": [receipt]}).json()
+    assert batch[0]["status"] == "revoked"
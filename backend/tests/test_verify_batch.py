@@ -0,0 +1,64 @@
+import uuid
+import base64
+
+import routers.consent
+from conftest import auth_headers
+
+def _grant(client, user_id: str) -> dict:
+    response = client.post("/consent/grant", headers=auth_headers(user_id), json={
+        "app_id": "Shop", "purposes": [{"purpose_code": "ANALYTICS", "data_categories": ["usage"]}],
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def _forge(signature: str) -> str:
+    raw = bytearray(base64.b64decode(signature))
+    raw[0] ^= 0xFF
+    return base64.b64encode(bytes(raw)).decode()
+
+def _verify_batch(client, receipts: list) -> list:
+    response = client.post("/consent/verify-batch", json={"receipts": receipts})
+    assert response.status_code == 200, response.text
+    return [(r["valid"], r["status"]) for r in response.json()]
+
+def test_mixed_batch_is_answered_in_input_order(client, monkeypatch):
+    # Several signature chunks, so results are reassembled across them
+    monkeypatch.setattr(routers.consent, "VERIFY_BATCH_CHUNK_SIZE", 2)
+    user = str(uuid.uuid4())
+    valid, revoked, forged, edited = (_grant(client, user) for _ in range(4))
+    response = client.post("/consent/revoke", headers=auth_headers(user), json={"consent_id": revoked["consent_id"]})
+    assert response.status_code == 200
+    forged = {**forged, "signature": _forge(forged["signature"])}
+    edited = {**edited, "receipt_payload": {**edited["receipt_payload"], "consent_id": valid["consent_id"]}}
+
+    receipts = [forged, valid, {"signature": "x"}, revoked, edited, valid]
+    expected = [
+        (False, "invalid_signature"),
+        (True, "active"),
+        (False, "invalid_format"),
+        (False, "revoked"),
+        (False, "invalid_signature"),
+        (True, "active"),
+    ]
+    assert _verify_batch(client, receipts) == expected
+    # A second pass answers valid signatures from the signature cache: same results
+    assert _verify_batch(client, receipts) == expected
+
+def test_batch_agrees_with_single_verification(client):
+    user = str(uuid.uuid4())
+    receipts = [_grant(client, user) for _ in range(3)]
+    client.post("/consent/revoke", headers=auth_headers(user), json={"consent_id": receipts[1]["consent_id"]})
+    receipts[2] = {**receipts[2], "signature": _forge(receipts[2]["signature"])}
+
+    single = []
+    for receipt in receipts:
+        response = client.post("/consent/verify", json={"receipt": receipt})
+        single.append((response.json()["valid"], response.json()["status"]))
+    assert _verify_batch(client, receipts) == single
+
+def test_oversized_batch_is_rejected(client, monkeypatch):
+    monkeypatch.setattr(routers.consent, "VERIFY_BATCH_MAX", 2)
+    receipt = _grant(client, str(uuid.uuid4()))
+    response = client.post("/consent/verify-batch", json={"receipts": [receipt] * 3})
+    assert response.status_code == 413
+    assert _verify_batch(client, [receipt] * 2) == [(True, "active")] * 2
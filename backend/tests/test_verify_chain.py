@@ -0,0 +1,125 @@
+import json
+import uuid
+
+from conftest import auth_headers
+
+def _grant(client, user_id: str, count: int = 1) -> None:
+    for _ in range(count):
+        response = client.post("/consent/grant", headers=auth_headers(user_id), json={
+            "app_id": "Shop", "purposes": [{"purpose_code": "ANALYTICS", "data_categories": ["usage"]}],
+        })
+        assert response.status_code == 200, response.text
+
+def _verify(client, **params) -> dict:
+    response = client.get("/audit/verify-chain", params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def test_incremental_runs_resume_from_the_checkpoint(client, store):
+    user = str(uuid.uuid4())
+    assert _verify(client)["status"] == "EMPTY"
+    _grant(client, user, 3)
+
+    first = _verify(client, limit=2)
+    assert (first["status"], first["verified_count"], first["new_events_verified"]) == ("VALID", 3, 3)
+    assert first["checkpoint"]["verified_count"] == 3
+
+    _grant(client, user, 2)
+    second = _verify(client, limit=2)
+    assert (second["status"], second["verified_count"], second["new_events_verified"]) == ("VALID", 5, 2)
+    newest = store.latest_audit_event()
+    assert second["checkpoint"]["last_event_id"] == newest["event_id"]
+
+    idle = _verify(client)
+    assert idle["new_events_verified"] == 0 and idle["message"] == "No new events since last checkpoint"
+
+def test_edit_behind_the_checkpoint_needs_a_full_run(client, store):
+    _grant(client, str(uuid.uuid4()), 4)
+    assert _verify(client)["status"] == "VALID"
+
+    oldest = store.audit_events_after(None, 1)[0]
+    store.update_audit_event(oldest["event_id"], {"event_payload": {"consent_id": "rewritten"}})
+    # Incremental runs re-check only the checkpointed event and what came after it
+    assert _verify(client)["status"] == "VALID"
+
+    full = _verify(client, full="true")
+    assert full["status"] == "TAMPERED" and full["mode"] == "full"
+    assert any(v["event_id"] == str(oldest["event_id"]) for v in full["violations"])
+
+def test_edit_of_the_checkpointed_event_is_caught_incrementally(client, store):
+    _grant(client, str(uuid.uuid4()), 2)
+    assert _verify(client)["status"] == "VALID"
+    newest = store.latest_audit_event()
+    store.update_audit_event(newest["event_id"], {"hash_current": "f" * 64})
+    assert _verify(client)["status"] == "TAMPERED"
+
+def test_tamper_simulations_are_caught_by_the_next_incremental_run(client, store):
+    user = str(uuid.uuid4())
+    _grant(client, user, 4)
+    assert _verify(client)["status"] == "VALID"
+
+    oldest = store.audit_events_after(None, 1)[0]
+    response = client.post(f"/audit/simulate-tamper-data/{oldest['event_id']}", headers=auth_headers(user))
+    assert response.status_code == 200
+    result = _verify(client)
+    assert result["status"] == "TAMPERED"
+    assert any(v["event_id"] == str(oldest["event_id"]) for v in result["violations"])
+
+    assert client.post("/audit/tamper", headers=auth_headers(user)).status_code == 200
+    assert _verify(client)["status"] == "TAMPERED"
+
+# --- /verify-chain/stream ---
+
+def _ndjson(client, **params) -> list:
+    response = client.get("/audit/verify-chain/stream", params=params)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    body = response.text
+    assert body.endswith("\n")
+    return [json.loads(line) for line in body.split("\n")[:-1]]
+
+def test_stream_frames_ndjson_records(client):
+    _grant(client, str(uuid.uuid4()), 5)
+    records = _ndjson(client, page_size=2)
+    assert [r["type"] for r in records] == ["start", "progress", "progress", "progress", "result"]
+    assert records[0]["page_size"] == 2
+    assert [r["verified"] for r in records[1:4]] == [2, 4, 5]
+    assert records[-1]["status"] == "VALID" and records[-1]["verified_count"] == 5
+    assert "violations" not in records[-1]
+
+def test_stream_frames_server_sent_events(client):
+    _grant(client, str(uuid.uuid4()), 3)
+    response = client.get("/audit/verify-chain/stream", params={"page_size": 2, "format": "sse"})
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text.endswith("\n\n")
+    frames = response.text.split("\n\n")[:-1]
+    kinds = []
+    for frame in frames:
+        event, data = frame.split("\n")
+        assert event.startswith("event: ") and data.startswith("data: ")
+        kinds.append(event[len("event: "):])
+        record = json.loads(data[len("data: "):])
+        assert "type" not in record  # The SSE event name carries it
+    assert kinds == ["start", "progress", "progress", "result"]
+    assert record["status"] == "VALID"
+
+def test_stream_reports_violations_before_the_result(client, store):
+    _grant(client, str(uuid.uuid4()), 4)
+    assert _verify(client)["status"] == "VALID"
+    checkpoint = store.get_checkpoint("global")
+    second = store.audit_events_after(None, 2)[1]
+    store.update_audit_event(second["event_id"], {"hash_current": "0" * 64})
+
+    records = _ndjson(client, page_size=3)
+    kinds = [r["type"] for r in records]
+    assert kinds[0] == "start" and kinds[-1] == "result" and "violation" in kinds
+    assert kinds.index("violation") < kinds.index("result")
+    assert records[-1]["status"] == "TAMPERED"
+    assert any(r["type"] == "violation" and r["event_id"] == str(second["event_id"]) for r in records)
+    # Streaming neither reads nor moves the checkpoint
+    assert store.get_checkpoint("global") == checkpoint
+
+def test_stream_of_an_empty_ledger(client):
+    records = _ndjson(client)
+    assert [r["type"] for r in records] == ["start", "result"]
+    assert records[-1]["status"] == "EMPTY"
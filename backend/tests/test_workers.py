@@ -0,0 +1,23 @@
+import os
+import asyncio
+
+import workers
+from workers import map_chunks, shutdown_pool, start_pool
+
+def test_pool_spawns_its_workers_at_startup(monkeypatch):
+    monkeypatch.setattr(workers, "WORKER_PROCESSES", 2)
+
+    async def run():
+        await start_pool()
+        pool = workers._pool
+        started = dict(pool._processes)
+        lengths = await map_chunks(len, [[1], [1, 2], [1, 2, 3]])
+        return pool, started, lengths
+
+    try:
+        pool, started, lengths = asyncio.run(run())
+        assert pool._mp_context.get_start_method() == "spawn"
+        assert len(started) == 2 and os.getpid() not in started
+        assert lengths == [1, 2, 3]
+    finally:
+        shutdown_pool()
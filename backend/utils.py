@@ -1,62 +1,90 @@
-import json
-import hashlib
+import re
 import base64
-from datetime import datetime
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.asymmetric import rsa, padding
-from cryptography.hazmat.primitives import serialization
+from datetime import datetime, timezone
+from typing import Optional
+from cryptography.exceptions import InvalidSignature
 
-# --- GLOBAL KEY MOCK (simulating a private PKI for the Consent Manager) ---
-# In production, this would be loaded from a secure vault.
-private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
-public_key = private_key.public_key()
+from signing_keys import keyring
+from signature_cache import signature_cache
+from canonical import canonical_json, chain_hash, HASH_V1
+from metrics import SIGN_SECONDS, VERIFY_SECONDS
+
+# --- SIGNING KEYS ---
+# Loaded from SIGNING_KEYS_DIR (see signing_keys.py), so every worker and every
+# restart signs and verifies with the same keys. Receipts carry a `kid`.
 
 def get_public_key_pem():
-    return public_key.public_bytes(
-        encoding=serialization.Encoding.PEM,
-        format=serialization.PublicFormat.SubjectPublicKeyInfo
-    ).decode('utf-8')
+    return keyring.signer().public_pem()
 
-def canonical_json(payload: dict) -> bytes:
-    """
-    Produces a deterministic JSON byte string.
-    Keys are sorted, no whitespace.
-    """
-    return json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')
+def signing_key_id() -> str:
+    """Key ID of the active signer; put it in a payload as `kid` before signing."""
+    return keyring.signer().kid
 
-def sign_payload(payload: dict) -> str:
+def sign_payload(payload: dict, data: Optional[bytes] = None) -> str:
     """
-    Signs the canonical JSON of the payload using the system's private key.
+    Signs the canonical JSON of the payload with the key named by its `kid`
+    (the active key if the payload has none). Pass `data` when the caller already
+    holds canonical_json(payload), so it is not serialized again.
     Returns Base64 encoded signature.
     """
-    data = canonical_json(payload)
-    signature = private_key.sign(
-        data,
-        padding.PSS(
-            mgf=padding.MGF1(hashes.SHA256()),
-            salt_length=padding.PSS.MAX_LENGTH
-        ),
-        hashes.SHA256()
-    )
+    kid = payload.get("kid") if isinstance(payload, dict) else None
+    key = keyring.get(kid) if kid else keyring.signer()
+    if key is None:
+        raise ValueError(f"Unknown signing key: {kid}")
+    with SIGN_SECONDS.time(key.algorithm):
+        signature = key.sign(data if data is not None else canonical_json(payload))
     return base64.b64encode(signature).decode('utf-8')
 
-def verify_signature(payload: dict, signature_b64: str) -> bool:
+def verify_signature(payload: dict, signature_b64: str, memoize: bool = True) -> bool:
     """
     Verifies that the payload matches the signature.
+    Uses the key named by the payload's `kid`; receipts from before key IDs
+    are checked against the RSA keys in the keyring.
+    With `memoize`, a payload and signature that verified before (with a key still in
+    the keyring) are accepted from the signature cache without the crypto.
     """
+    with VERIFY_SECONDS.time():
+        try:
+            data = canonical_json(payload)
+        except Exception as e:
+            print(f"Signature verification failed: {e}")
+            return False
+        kid = payload.get("kid") if isinstance(payload, dict) else None
+        digest = signature_memo_key(data, signature_b64, kid) if memoize else None
+        if digest is not None and signature_memoized(digest, kid):
+            return True
+        ok = _verify_signature(data, signature_b64, kid)
+        if ok and digest is not None:
+            signature_cache.remember(digest)
+        return ok
+
+def signature_memo_key(data: bytes, signature_b64: str, kid: Optional[str]) -> Optional[bytes]:
+    """Signature cache key for canonical payload bytes and their signature (None when the cache is off)."""
+    return signature_cache.digest(data, signature_b64, kid) if signature_cache.enabled else None
+
+def signature_memoized(digest: bytes, kid: Optional[str]) -> bool:
+    # A key dropped from the keyring no longer vouches for what it verified earlier
+    return signature_cache.seen(digest) and (not kid or keyring.get(kid) is not None)
+
+def _verify_signature(data: bytes, signature_b64: str, kid: Optional[str]) -> bool:
     try:
-        data = canonical_json(payload)
         signature = base64.b64decode(signature_b64)
-        public_key.verify(
-            signature,
-            data,
-            padding.PSS(
-                mgf=padding.MGF1(hashes.SHA256()),
-                salt_length=padding.PSS.MAX_LENGTH
-            ),
-            hashes.SHA256()
-        )
-        return True
+        if kid:
+            key = keyring.get(kid)
+            if key is None:
+                print(f"Signature verification failed: unknown kid {kid}")
+                return False
+            key.verify(signature, data)
+            return True
+
+        for key in keyring.legacy_keys():
+            try:
+                key.verify(signature, data)
+                return True
+            except InvalidSignature:
+                continue
+        print("Signature verification failed: no matching legacy RSA key")
+        return False
     except Exception as e:
         print(f"Signature verification failed: {e}")
         return False
@@ -65,6 +93,24 @@ def generate_hash_chain(prev_hash: str, current_payload: dict, timestamp: str) -
     """
     Generates a SHA-256 hash for the current event, linking it to the previous one.
     Hash = SHA256(prev_hash + canonical_payload + timestamp)
+    This is hash format v1; see canonical.chain_hash for v2.
+    """
+    return chain_hash(prev_hash, current_payload, timestamp, HASH_V1)
+
+def parse_timestamp(value) -> datetime:
+    """
+    Parses an ISO timestamp as returned by Postgres / PostgREST into a naive UTC datetime.
+    Tolerates 'Z' suffixes and fractional seconds that are not 3 or 6 digits long.
     """
-    content = (prev_hash or "") + json.dumps(current_payload, sort_keys=True) + timestamp
-    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        text = str(value).replace("Z", "+00:00")
+        try:
+            dt = datetime.fromisoformat(text)
+        except ValueError:
+            text = re.sub(r"\.(\d+)", lambda m: "." + m.group(1)[:6].ljust(6, "0"), text)
+            dt = datetime.fromisoformat(text)
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
@@ -0,0 +1,453 @@
+"""
+Offline verifier for audit ledger archives (see archive.py for the exporter).
+
+Checks every segment against the signed manifest, recomputes every event's hash
+(hash formats v1 and v2, see README "Canonical JSON and Hash Formats") and re-checks
+the chain linkage within and across segments, one segment per CPU core. Needs only
+the Python standard library; checking the manifest signature also needs the
+`cryptography` package and the public keys from GET /consent/keys.
+
+    python verify_archive.py ARCHIVE_DIR [--keys keys.json] [--jobs N] [--json]
+
+Exit status: 0 if the archive verifies, 1 if it does not, 2 if it cannot be read.
+
+Archive layout (format version 1):
+    manifest.json         {"signed_payload": {...}, "signature": "..."}; the payload
+                          lists every segment file with its SHA-256 and event range,
+                          the head of every shard chain and the signer's `kid`.
+    segment-NNNNNN.seg    MAGIC, u32 header length, header JSON, then the columns.
+
+A segment holds consecutive events in chain order. Its header is the segment index:
+event count, first/last event_id and timestamp, per-shard boundary hashes and the
+(offset, length, codec) of each column. Hash columns are 32-byte binary (SHA-256
+output does not compress, so they are stored raw and read straight from the mapped
+file); every other column is zlib-compressed. Integers are little-endian.
+"""
+import os
+import sys
+import json
+import mmap
+import zlib
+import base64
+import struct
+import hashlib
+import argparse
+from array import array
+from multiprocessing import Pool
+from typing import Dict, List, Optional
+
+ARCHIVE_FORMAT = "saksham-audit-archive"
+ARCHIVE_VERSION = 1
+MAGIC = b"SAKSARC1"
+MANIFEST_FILE = "manifest.json"
+
+GENESIS_HASH = "0" * 64
+HASH_V1 = 1
+HASH_V2 = 2
+HASH_SIZE = 32
+
+# Per-event bits of the "flags" column
+PREV_NULL = 1        # hash_prev is NULL
+PREV_OVERFLOW = 2    # hash_prev is not a 64-char hex digest; kept in the "overflow" column
+CURRENT_OVERFLOW = 4  # same for hash_current
+
+# Column name -> codec. "raw" columns are read in place from the mapped file.
+COLUMNS = {
+    "hash_current": "raw",   # 32 bytes per event
+    "hash_prev": "raw",      # 32 bytes per event (zeros where flagged)
+    "flags": "zlib",         # u8 per event
+    "hash_version": "zlib",  # u8 per event
+    "shard": "zlib",         # u16 per event
+    "payload_offsets": "zlib",  # u32 per event + 1, into "payload"
+    "payload": "zlib",       # canonical JSON of each event_payload, concatenated
+    "event_id": "zlib",      # JSON array of strings
+    "event_type": "zlib",
+    "actor_id": "zlib",
+    "actor_type": "zlib",
+    "timestamp": "zlib",     # the stored timestamp column, as text
+    "overflow": "zlib",      # JSON array of hash strings that did not fit the raw columns
+}
+
+MAX_VIOLATIONS = 1000
+
+def little_endian(typecode: str, values) -> bytes:
+    packed = array(typecode, values)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tobytes()
+
+def from_little_endian(typecode: str, data) -> array:
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+def manifest_bytes(manifest: dict) -> bytes:
+    """Canonical JSON of the manifest: the bytes that are signed."""
+    return json.dumps(manifest, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+# --- reading segments ---
+
+class Segment:
+    """A memory-mapped segment file; columns are decoded on first access."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._decoded: Dict[str, object] = {}
+        self._file = open(path, "rb")
+        self.map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        if bytes(self.view[:len(MAGIC)]) != MAGIC:
+            self.close()
+            raise ValueError(f"{path}: not an audit archive segment")
+        (header_length,) = struct.unpack_from("<I", self.map, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.header = json.loads(bytes(self.view[start:start + header_length]))
+        self.data_start = start + header_length
+        self.count = self.header["events"]
+
+    def raw(self, name: str) -> memoryview:
+        column = self.header["columns"][name]
+        offset = self.data_start + column["offset"]
+        data = self.view[offset:offset + column["length"]]
+        if column["codec"] == "zlib":
+            return memoryview(zlib.decompress(data))
+        return data
+
+    def column(self, name: str):
+        if name not in self._decoded:
+            data = self.raw(name)
+            if name in ("flags", "hash_version"):
+                value = from_little_endian("B", data)
+            elif name == "shard":
+                value = from_little_endian("H", data)
+            elif name == "payload_offsets":
+                value = from_little_endian("I", data)
+            elif name in ("hash_current", "hash_prev", "payload"):
+                value = data
+            else:
+                value = json.loads(bytes(data))
+            self._decoded[name] = value
+        return self._decoded[name]
+
+    def sha256(self) -> str:
+        return hashlib.sha256(self.map).hexdigest()
+
+    def close(self) -> None:
+        self._decoded.clear()
+        self.view.release()
+        self.map.close()
+        self._file.close()
+
+# --- verifying one segment (runs in a worker process) ---
+
+def _hash_timestamp(payload, timestamp: str) -> str:
+    # Same rule as chain.event_hash_timestamp: the payload's timestamp when it has one
+    if isinstance(payload, dict) and payload.get("timestamp"):
+        value = payload["timestamp"]
+        return value if isinstance(value, str) else str(value)
+    return timestamp
+
+def verify_segment(task: tuple) -> dict:
+    """
+    Recomputes the hashes of one segment and checks linkage inside it, per shard.
+    Returns the shard boundaries (first hash_prev, last hash_current, timestamps) so
+    the caller can check linkage across segments.
+    """
+    path, expected_sha256, max_violations = task
+    result = {"file": os.path.basename(path), "events": 0, "shards": {}, "violations": [],
+              "critical": 0, "warnings": 0, "duplicate_timestamp": None}
+
+    def violation(entry: dict) -> None:
+        if entry["severity"] == "CRITICAL":
+            result["critical"] += 1
+        else:
+            result["warnings"] += 1
+        if len(result["violations"]) < max_violations:
+            result["violations"].append(entry)
+
+    try:
+        segment = Segment(path)
+    except (OSError, ValueError) as e:
+        violation({"segment": result["file"], "reason": "Segment Unreadable", "details": str(e), "severity": "CRITICAL"})
+        return result
+    try:
+        if expected_sha256 and segment.sha256() != expected_sha256:
+            violation({"segment": result["file"], "reason": "Segment Checksum Mismatch",
+                       "details": "The segment file does not match the SHA-256 in the signed manifest.",
+                       "severity": "CRITICAL"})
+        _check_events(segment, result, violation)
+        result["events"] = segment.count
+    except Exception as e:
+        violation({"segment": result["file"], "reason": "Segment Unreadable", "details": repr(e), "severity": "CRITICAL"})
+    finally:
+        segment.close()
+    return result
+
+def _check_events(segment: Segment, result: dict, violation) -> None:
+    # Kept apart from verify_segment so the views into the mapped file are gone before it is closed
+    current = segment.column("hash_current")
+    prev = segment.column("hash_prev")
+    flags = segment.column("flags")
+    versions = segment.column("hash_version")
+    shards = segment.column("shard")
+    offsets = segment.column("payload_offsets")
+    payloads = segment.column("payload")
+    event_ids = segment.column("event_id")
+    timestamps = segment.column("timestamp")
+    overflow = iter(segment.column("overflow"))
+
+    state: Dict[int, dict] = result["shards"]
+    for i in range(segment.count):
+        flag = flags[i]
+        if flag & PREV_NULL:
+            prev_hex = None
+        elif flag & PREV_OVERFLOW:
+            prev_hex = next(overflow)
+        else:
+            prev_hex = prev[i * HASH_SIZE:(i + 1) * HASH_SIZE].hex()
+        current_hex = next(overflow) if flag & CURRENT_OVERFLOW else current[i * HASH_SIZE:(i + 1) * HASH_SIZE].hex()
+
+        event_id = event_ids[i]
+        timestamp = timestamps[i]
+        payload_bytes = payloads[offsets[i]:offsets[i + 1]]
+        payload = json.loads(bytes(payload_bytes))
+        hash_timestamp = _hash_timestamp(payload, timestamp)
+        version = versions[i] or HASH_V1
+
+        # Check 1: recomputed hash (data integrity)
+        if version == HASH_V2:
+            h = hashlib.sha256()
+            h.update((prev_hex or "").encode("utf-8"))
+            h.update(payload_bytes)
+            h.update(hash_timestamp.encode("utf-8"))
+            recomputed = h.hexdigest()
+        elif version == HASH_V1:
+            content = (prev_hex or "") + json.dumps(payload, sort_keys=True) + hash_timestamp
+            recomputed = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        else:
+            recomputed = None
+        if recomputed != current_hex:
+            violation({
+                "event_id": event_id,
+                "timestamp": timestamp,
+                "reason": "Hash Mismatch - Event data may have been tampered with",
+                "details": "Recalculated hash doesn't match stored hash_current" if recomputed
+                else f"Unknown hash version {version}",
+                "expected_hash": recomputed,
+                "found_hash": current_hex,
+                "severity": "CRITICAL"
+            })
+
+        # Check 2: linkage to the previous event of the same shard
+        shard = shards[i]
+        chain = state.get(shard)
+        if chain is None:
+            state[shard] = chain = {"events": 0, "first_prev": prev_hex, "first_event_id": event_id,
+                                    "first_timestamp": timestamp, "last_hash": None, "last_timestamp": None}
+        elif prev_hex != chain["last_hash"]:
+            violation({
+                "event_id": event_id,
+                "timestamp": timestamp,
+                "shard": shard,
+                "reason": "Chain Link Broken - Previous event hash mismatch",
+                "details": "Event's hash_prev doesn't match previous event's hash_current. Possible deletion, reordering, or insertion.",
+                "expected_prev_hash": chain["last_hash"],
+                "found_prev_hash": prev_hex,
+                "severity": "CRITICAL"
+            })
+
+        # Check 3: duplicate timestamps (reported once per archive by the caller)
+        if chain["events"] and timestamp == chain["last_timestamp"] and result["duplicate_timestamp"] is None:
+            result["duplicate_timestamp"] = event_id
+
+        chain["events"] += 1
+        chain["last_hash"] = current_hex
+        chain["last_timestamp"] = timestamp
+        chain["last_event_id"] = event_id
+
+# --- manifest signature ---
+
+def _load_public_keys(path: str) -> Dict[str, object]:
+    """kid -> public key, from the JSON of GET /consent/keys or a PEM file."""
+    from cryptography.hazmat.primitives import serialization
+
+    with open(path, "rb") as f:
+        data = f.read()
+    if data.lstrip().startswith(b"{"):
+        pems = [k["public_key_pem"].encode("utf-8") for k in json.loads(data)["keys"]]
+    else:
+        pems = [data]
+    keys = {}
+    for pem in pems:
+        key = serialization.load_pem_public_key(pem)
+        der = key.public_bytes(serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+        keys[hashlib.sha256(der).hexdigest()[:16]] = key
+    return keys
+
+def verify_manifest_signature(signed: dict, keys_path: str) -> Optional[str]:
+    """None if the signature verifies, otherwise the reason it does not."""
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import ed25519, padding
+
+    manifest = signed["signed_payload"]
+    key = _load_public_keys(keys_path).get(manifest.get("kid"))
+    if key is None:
+        return f"No public key for kid {manifest.get('kid')}"
+    data = manifest_bytes(manifest)
+    try:
+        signature = base64.b64decode(signed["signature"])
+        if isinstance(key, ed25519.Ed25519PublicKey):
+            key.verify(signature, data)
+        else:
+            key.verify(signature, data, padding.PSS(mgf=padding.MGF1(hashes.SHA256()),
+                                                    salt_length=padding.PSS.MAX_LENGTH), hashes.SHA256())
+    except (InvalidSignature, ValueError):
+        return "The manifest signature does not verify"
+    return None
+
+# --- whole archive ---
+
+def verify_archive(directory: str, keys_path: Optional[str] = None, jobs: Optional[int] = None,
+                   max_violations: int = MAX_VIOLATIONS) -> dict:
+    with open(os.path.join(directory, MANIFEST_FILE), "rb") as f:
+        signed = json.load(f)
+    manifest = signed["signed_payload"]
+    if manifest.get("format") != ARCHIVE_FORMAT or manifest.get("version") != ARCHIVE_VERSION:
+        raise ValueError(f"Unsupported archive format: {manifest.get('format')} v{manifest.get('version')}")
+
+    violations: List[dict] = []
+    counts = {"critical": 0, "warnings": 0}
+
+    def add(entry: dict) -> None:
+        counts["critical" if entry["severity"] == "CRITICAL" else "warnings"] += 1
+        if len(violations) < max_violations:
+            violations.append(entry)
+
+    if keys_path:
+        problem = verify_manifest_signature(signed, keys_path)
+        signature_status = "VALID" if problem is None else "INVALID"
+        if problem:
+            add({"reason": "Manifest Signature Invalid", "details": problem, "severity": "CRITICAL"})
+    else:
+        signature_status = "NOT_CHECKED"
+
+    tasks = [(os.path.join(directory, s["file"]), s["sha256"], max_violations) for s in manifest["segments"]]
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(tasks) or 1))
+
+    # Stitch segments together in order: each shard's chain continues from its last hash
+    heads: Dict[int, dict] = {}
+    total = 0
+    duplicate_reported = False
+    pool = Pool(jobs) if jobs > 1 else None
+    try:
+        results = pool.imap(verify_segment, tasks) if pool else map(verify_segment, tasks)
+        for entry, result in zip(manifest["segments"], results):
+            for v in result["violations"]:
+                add({"segment": entry["file"], **v})
+            # Violations beyond the per-segment list still count
+            counts["critical"] += result["critical"] - sum(1 for v in result["violations"] if v["severity"] == "CRITICAL")
+            counts["warnings"] += result["warnings"] - sum(1 for v in result["violations"] if v["severity"] != "CRITICAL")
+            if result["events"] != entry["events"]:
+                add({"segment": entry["file"], "reason": "Segment Event Count Mismatch",
+                     "details": f"Manifest lists {entry['events']} events, segment holds {result['events']}.",
+                     "severity": "CRITICAL"})
+            if result["duplicate_timestamp"] and not duplicate_reported:
+                duplicate_reported = True
+                add({"event_id": "MULTIPLE", "reason": "Duplicate Timestamps Detected",
+                     "details": "Multiple events have the same timestamp. This may indicate unauthorized insertions.",
+                     "severity": "WARNING"})
+            for shard, chain in sorted(result["shards"].items()):
+                shard = int(shard)
+                head = heads.get(shard)
+                expected = head["hash"] if head else GENESIS_HASH
+                if chain["first_prev"] != expected:
+                    add({"segment": entry["file"], "event_id": chain["first_event_id"],
+                         "timestamp": chain["first_timestamp"], "shard": shard,
+                         "reason": "Chain Link Broken - Previous event hash mismatch",
+                         "details": "The first event of this shard in the segment does not link to the previous one.",
+                         "expected_prev_hash": expected, "found_prev_hash": chain["first_prev"],
+                         "severity": "CRITICAL"})
+                if head and head["timestamp"] == chain["first_timestamp"] and not duplicate_reported:
+                    duplicate_reported = True
+                    add({"event_id": "MULTIPLE", "reason": "Duplicate Timestamps Detected",
+                         "details": "Multiple events have the same timestamp. This may indicate unauthorized insertions.",
+                         "severity": "WARNING"})
+                heads[shard] = {"hash": chain["last_hash"], "event_id": chain["last_event_id"],
+                                "timestamp": chain["last_timestamp"], "events": (head["events"] if head else 0) + chain["events"]}
+            total += result["events"]
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    # The recomputed chain heads must be the ones the manifest signs
+    if total != manifest["event_count"]:
+        add({"reason": "Event Count Mismatch",
+             "details": f"Manifest lists {manifest['event_count']} events, segments hold {total}.", "severity": "CRITICAL"})
+    signed_heads = {h["shard"]: h for h in manifest["heads"]}
+    for shard in sorted(set(signed_heads) | set(heads)):
+        found, expected = heads.get(shard), signed_heads.get(shard)
+        if not found or not expected or found["hash"] != expected["hash"] or found["events"] != expected["events"]:
+            add({"shard": shard, "reason": "Head Mismatch",
+                 "details": "The chain head recomputed from the segments differs from the signed manifest.",
+                 "expected_hash": expected["hash"] if expected else None,
+                 "found_hash": found["hash"] if found else None, "severity": "CRITICAL"})
+
+    if counts["critical"]:
+        status = "TAMPERED"
+    elif counts["warnings"]:
+        status = "SUSPICIOUS"
+    else:
+        status = "VALID"
+    return {
+        "status": status,
+        "verified_count": total,
+        "segments": len(tasks),
+        "jobs": jobs,
+        "manifest_signature": signature_status,
+        "created_at": manifest.get("created_at"),
+        "heads": [{"shard": s, **h} for s, h in sorted(heads.items())],
+        "critical_violations": counts["critical"],
+        "warnings": counts["warnings"],
+        "violations": violations,
+    }
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("archive", help="directory written by `python -m archive`")
+    parser.add_argument("--keys", help="public keys: JSON from GET /consent/keys, or a PEM file")
+    parser.add_argument("--jobs", type=int, default=0, help="worker processes (default: one per CPU)")
+    parser.add_argument("--max-violations", type=int, default=MAX_VIOLATIONS, help="violations listed in the report")
+    parser.add_argument("--json", action="store_true", help="print the full report as JSON")
+    args = parser.parse_args(argv)
+
+    try:
+        report = verify_archive(args.archive, keys_path=args.keys, jobs=args.jobs or None,
+                                max_violations=args.max_violations)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Cannot read archive: {e}", file=sys.stderr)
+        return 2
+    except ImportError:
+        print("Checking the manifest signature needs the 'cryptography' package (pip install cryptography)", file=sys.stderr)
+        return 2
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['status']}: {report['verified_count']} events in {report['segments']} segment(s), "
+              f"{report['jobs']} job(s); manifest signature {report['manifest_signature']}")
+        for head in report["heads"]:
+            print(f"  shard {head['shard']}: {head['events']} events, head {head['hash']}")
+        for v in report["violations"]:
+            where = v.get("event_id") or v.get("segment") or ""
+            print(f"  [{v['severity']}] {v['reason']} {where}".rstrip())
+        hidden = report["critical_violations"] + report["warnings"] - len(report["violations"])
+        if hidden > 0:
+            print(f"  ... and {hidden} more")
+    return 0 if report["status"] == "VALID" else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+import os
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, List, Optional, Sequence
+
+# Process pool for CPU-bound work (hash recomputation, signing, signature checks)
+# so it neither holds the GIL nor blocks the event loop.
+# WORKER_PROCESSES=0 (default) uses one process per CPU; 1 disables the pool (serial mode).
+WORKER_PROCESSES = int(os.environ.get("WORKER_PROCESSES", "0")) or (os.cpu_count() or 1)
+# Workers start fresh ("spawn", or "forkserver" on Unix) instead of forking the API process,
+# whose DB threads, JWKS refresher and event loop could leave locks held in the child
+WORKER_START_METHOD = os.environ.get("WORKER_START_METHOD", "spawn")
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+def get_process_pool() -> Optional[ProcessPoolExecutor]:
+    global _pool
+    if WORKER_PROCESSES <= 1:
+        return None
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=WORKER_PROCESSES,
+                                    mp_context=multiprocessing.get_context(WORKER_START_METHOD))
+    return _pool
+
+def _ready() -> int:
+    return os.getpid()
+
+async def start_pool() -> None:
+    """
+    Creates the pool and starts every worker process (called at startup), so the
+    first request that needs it does not wait for processes to spawn.
+    """
+    pool = get_process_pool()
+    if pool is None:
+        return
+    loop = asyncio.get_running_loop()
+    try:
+        await asyncio.gather(*[loop.run_in_executor(pool, _ready) for _ in range(WORKER_PROCESSES)])
+    except BrokenProcessPool as e:
+        print(f"Worker pool failed to start, CPU-bound work runs serially until it is recreated: {e}")
+        shutdown_pool()
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def chunked(items: Sequence, size: int) -> List[Sequence]:
+    size = max(1, size)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+async def map_chunks(fn: Callable, chunks: List[Sequence], parallel: bool = True) -> List:
+    """
+    Runs fn(chunk) for every chunk and returns the results in chunk order.
+    Uses the process pool when available (fn must be a picklable top-level function),
+    otherwise - or if the pool breaks - runs serially in a thread, off the event loop.
+    """
+    pool = get_process_pool() if parallel and len(chunks) > 1 else None
+    if pool is not None:
+        loop = asyncio.get_running_loop()
+        try:
+            return list(await asyncio.gather(*[loop.run_in_executor(pool, fn, c) for c in chunks]))
+        except BrokenProcessPool as e:
+            print(f"Worker pool failed, falling back to serial execution: {e}")
+            shutdown_pool()
+    return await asyncio.to_thread(lambda: [fn(c) for c in chunks])
@@ -0,0 +1,72 @@
+// Live audit events from /audit/events/stream (server-sent events).
+// EventSource cannot send an Authorization header, so the stream is read with fetch.
+// Every connection sends the last event's id as Last-Event-ID, so nothing is missed: the
+// first one resumes from `after`, the X-Stream-Cursor of the caller's initial /audit/events
+// fetch (or a promise of it), and reconnects resume from the last event received.
+export function subscribeAuditEvents(apiUrl, token, params, onEvent, after = null) {
+    const controller = new AbortController();
+    let lastEventId = null;
+    let stopped = false;
+
+    const connect = async () => {
+        const query = new URLSearchParams(params || {}).toString();
+        const headers = { 'Authorization': `Bearer ${token}` };
+        if (lastEventId) headers['Last-Event-ID'] = lastEventId;
+
+        const res = await fetch(`${apiUrl}/audit/events/stream${query ? `?${query}` : ''}`, {
+            headers,
+            signal: controller.signal
+        });
+        if (!res.ok || !res.body) throw new Error(`Stream failed: ${res.status}`);
+
+        const reader = res.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        for (;;) {
+            const { value, done } = await reader.read();
+            if (done) return;
+            buffer += decoder.decode(value, { stream: true });
+            let end;
+            while ((end = buffer.indexOf('\n\n')) !== -1) {
+                const message = buffer.slice(0, end);
+                buffer = buffer.slice(end + 2);
+                let id = null, event = 'message', data = '';
+                for (const line of message.split('\n')) {
+                    if (line.startsWith('id: ')) id = line.slice(4);
+                    else if (line.startsWith('event: ')) event = line.slice(7);
+                    else if (line.startsWith('data: ')) data += line.slice(6);
+                }
+                if (event === 'audit_event' && data) {
+                    lastEventId = id;
+                    onEvent(JSON.parse(data));
+                } else if (event === 'reset' && data) {
+                    // Fell behind: reconnect from the cursor the server handed back
+                    lastEventId = JSON.parse(data).cursor || lastEventId;
+                }
+            }
+        }
+    };
+
+    const run = async () => {
+        try {
+            lastEventId = (await after) || null;
+        } catch (e) {
+            console.error(e);
+        }
+        while (!stopped) {
+            try {
+                await connect();
+            } catch (e) {
+                if (stopped) return;
+                console.error(e);
+            }
+            if (!stopped) await new Promise(resolve => setTimeout(resolve, 2000));
+        }
+    };
+    run();
+
+    return () => {
+        stopped = true;
+        controller.abort();
+    };
+}
@@ -1,4 +1,5 @@
 import { useState, useEffect } from 'react';
+import { subscribeAuditEvents } from '../auditStream';
 
 const API_URL = "https://saksham-api.vercel.app";
 
@@ -15,10 +16,12 @@ export default function RegulatorDashboard({ token }) {
         const data = await res.json();
         setEvents(data);
         setLoading(false);
+        return res.headers.get('X-Stream-Cursor');
     };
 
     const verifyChain = async () => {
-        const res = await fetch(`${API_URL}/audit/verify-chain`, {
+        // Full re-verification: incremental runs skip history behind the checkpoint
+        const res = await fetch(`${API_URL}/audit/verify-chain?full=true`, {
             headers: { 'Authorization': `Bearer ${token}` }
         });
         const data = await res.json();
@@ -38,7 +41,11 @@ export default function RegulatorDashboard({ token }) {
     };
 
     useEffect(() => {
-        fetchLogs();
+        // New events are pushed by the server instead of re-polling the list,
+        // starting right after the newest event of the initial fetch
+        return subscribeAuditEvents(API_URL, token, {}, ev => {
+            setEvents(prev => [ev, ...prev.filter(e => e.event_id !== ev.event_id)].slice(0, 20));
+        }, fetchLogs());
     }, []);
 
     return (
@@ -1,4 +1,5 @@
 import { useState, useEffect } from 'react';
+import { subscribeAuditEvents } from '../auditStream';
 
 const API_URL = "https://saksham-api.vercel.app";
 
@@ -7,7 +8,11 @@ export default function UserDashboard({ userId, token }) {
     const [loading, setLoading] = useState(false);
 
     useEffect(() => {
-        fetchHistory();
+        // This user's new events are pushed by the server instead of re-polling the list,
+        // starting right after the newest event of the initial fetch
+        return subscribeAuditEvents(API_URL, token, { actor_id: userId }, ev => {
+            setAuditLog(prev => [ev, ...prev.filter(e => e.event_id !== ev.event_id)].slice(0, 10));
+        }, fetchHistory());
     }, []);
 
     const fetchHistory = async () => {
@@ -19,10 +24,12 @@ export default function UserDashboard({ userId, token }) {
             if (res.status === 401) { alert("Session expired or invalid"); return; }
             const data = await res.json();
             setAuditLog(data);
+            return res.headers.get('X-Stream-Cursor');
         } catch (e) {
             console.error(e);
+        } finally {
+            setLoading(false);
         }
-        setLoading(false);
     };
 
     const handleRevoke = async (consentId) => {